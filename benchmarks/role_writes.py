@@ -0,0 +1,170 @@
+# benchmarks/role_writes.py - Scritture per UPDATE di un ruolo: trigger precedenti e attuali
+#
+#   python -m benchmarks.role_writes --roles 20000 --updates 2000
+#
+# Per ogni operazione conta le righe scritte (sqlite3 total_changes, che
+# include quelle dei trigger), le righe aggiunte a role_history e il tempo.
+# "prima" usa i trigger dei ruoli e gli UPDATE del repository dello schema
+# di partenza (commit db4a42f), "dopo" il repository e lo schema attuali,
+# sullo stesso database di partenza.
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+import click
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.database.connection import DatabaseConnection  # noqa: E402
+from src.database.repository import OrganigrammaRepository  # noqa: E402
+
+SCHEMA_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                           "sql", "organigramma_db.sql")
+
+# Trigger dei ruoli nello schema di partenza (sql/organigramma_db.sql al commit
+# db4a42f): scattano a ogni UPDATE, anche solo di updated_at, per cui il
+# timestamp riscrive la riga e fa scattare di nuovo lo storico
+LEGACY_TRIGGERS = {
+    "update_roles_timestamp": """
+        CREATE TRIGGER update_roles_timestamp
+            AFTER UPDATE ON roles
+        BEGIN
+            UPDATE roles SET updated_at = CURRENT_TIMESTAMP WHERE id = NEW.id;
+        END""",
+    "role_audit_update": """
+        CREATE TRIGGER role_audit_update
+            AFTER UPDATE ON roles
+        BEGIN
+            INSERT INTO role_history (
+                role_id, person_name, function_name, organizational_unit,
+                job_title_name, percentage, ad_interim, reports_to,
+                start_date, end_date, action, flags
+            ) VALUES (
+                NEW.id, NEW.person_name, NEW.function_name, NEW.organizational_unit,
+                NEW.job_title_name, NEW.percentage, NEW.ad_interim, NEW.reports_to,
+                NEW.start_date, NEW.end_date, 'UPDATE', NEW.flags
+            );
+        END""",
+}
+
+# Lo schema di partenza non aveva gli id interi né i trigger che li allineano
+LEGACY_DROPPED = ("roles_sync_ids_update",)
+
+# UPDATE del repository prima della modifica (senza manager_id)
+LEGACY_UPDATE_ROLE = """
+UPDATE roles
+SET organizational_unit = ?, job_title_name = ?, percentage = ?,
+    ad_interim = ?, reports_to = ?, flags = ?, updated_at = CURRENT_TIMESTAMP
+WHERE id = ?
+"""
+LEGACY_END_ROLE = """
+UPDATE roles SET end_date = ?, updated_at = CURRENT_TIMESTAMP
+WHERE id = ? AND end_date IS NULL
+"""
+
+
+def create_database(path: str, roles: int):
+    """Schema completo e dati sintetici: 1 ruolo per persona, 50 funzioni"""
+    import sqlite3
+    conn = sqlite3.connect(path)
+    with open(SCHEMA_PATH, encoding="utf-8") as f:
+        conn.executescript(f.read())
+    conn.executemany("INSERT INTO functions (name) VALUES (?)",
+                     [(f"F{i}",) for i in range(50)])
+    conn.executemany("INSERT INTO persons (name) VALUES (?)",
+                     [(f"Persona {i}",) for i in range(roles)])
+    conn.executemany(
+        "INSERT INTO roles (person_name, function_name, reports_to, start_date, "
+        "updated_at) VALUES (?, ?, ?, '2020-01-01', '2020-01-01 00:00:00')",
+        [(f"Persona {i}", f"F{i % 50}", f"Persona {i // 10}") for i in range(roles)])
+    conn.commit()
+    conn.close()
+
+
+def operations(roles: int, updates: int, seed: int = 7):
+    """(nome, lista di (role_id, valori)) uguali per i due scenari"""
+    rng = random.Random(seed)
+    ids = rng.sample(range(1, roles + 1), updates * 4)
+    chunks = [ids[i * updates:(i + 1) * updates] for i in range(4)]
+    return [
+        ("update_role (percentuale)", [(rid, dict(percentage=0.5)) for rid in chunks[0]]),
+        ("update_role (responsabile)", [(rid, dict(reports_to=f"Persona {rid % 97}"))
+                                        for rid in chunks[1]]),
+        ("update_role (nessuna modifica)", [(rid, {}) for rid in chunks[2]]),
+        ("end_role", [(rid, None) for rid in chunks[3]]),
+    ]
+
+
+def run(db: DatabaseConnection, legacy: bool, plan):
+    repo = OrganigrammaRepository(db)
+    results = []
+    for name, steps in plan:
+        with db.transaction() as conn:
+            changes = conn.total_changes
+            history = conn.execute("SELECT COUNT(*) FROM role_history").fetchone()[0]
+            started = time.perf_counter()
+            for role_id, values in steps:
+                if values is None:
+                    if legacy:
+                        conn.execute(LEGACY_END_ROLE, ("2024-12-31", role_id))
+                    else:
+                        repo.end_role(role_id, "2024-12-31")
+                    continue
+                role = repo.get_role(role_id)
+                for key, value in values.items():
+                    setattr(role, key, value)
+                if legacy:
+                    conn.execute(LEGACY_UPDATE_ROLE, (
+                        role.organizational_unit, role.job_title_name, role.percentage,
+                        role.ad_interim, role.reports_to, role.flags, role_id))
+                else:
+                    repo.update_role(role_id, role)
+            elapsed = time.perf_counter() - started
+            written = conn.total_changes - changes
+            logged = conn.execute("SELECT COUNT(*) FROM role_history").fetchone()[0] - history
+        results.append((name, written / len(steps), logged / len(steps),
+                        elapsed / len(steps) * 1e6))
+    return results
+
+
+@click.command()
+@click.option('--roles', default=20000, show_default=True, help='Ruoli nel database di prova')
+@click.option('--updates', default=2000, show_default=True, help='UPDATE per operazione')
+def main(roles, updates):
+    """Righe scritte e storico per UPDATE di un ruolo, prima e dopo"""
+    workdir = tempfile.mkdtemp(prefix="role_writes_")
+    try:
+        base = os.path.join(workdir, "base.db")
+        create_database(base, roles)
+        plan = operations(roles, updates)
+        report = {}
+        for label, legacy in (("prima", True), ("dopo", False)):
+            path = os.path.join(workdir, f"{label}.db")
+            shutil.copy(base, path)
+            db = DatabaseConnection(path)
+            if legacy:
+                with db.get_connection() as conn:
+                    for name in LEGACY_DROPPED:
+                        conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+                    for name, sql in LEGACY_TRIGGERS.items():
+                        conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+                        conn.execute(sql)
+                    conn.commit()
+            report[label] = run(db, legacy, plan)
+            db.close()
+
+        click.echo(f"{'operazione':32} {'righe/UPDATE':>18} {'storico/UPDATE':>18} {'µs/UPDATE':>18}")
+        click.echo(f"{'':32} {'prima -> dopo':>18} {'prima -> dopo':>18} {'prima -> dopo':>18}")
+        for before, after in zip(report["prima"], report["dopo"]):
+            click.echo(f"{before[0]:32} {before[1]:>8.2f} -> {after[1]:<7.2f} "
+                       f"{before[2]:>8.2f} -> {after[2]:<7.2f} "
+                       f"{before[3]:>8.1f} -> {after[3]:<7.1f}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -8,7 +8,11 @@ CREATE TABLE functions (
     reports_to TEXT REFERENCES functions(name),
     flags TEXT(25),
     created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    parent_function_id INTEGER REFERENCES functions(id),
+    -- Gerarchia materializzata (trigger functions_closure_*)
+    level INTEGER,
+    path TEXT
 );
 
 -- Alias delle funzioni
@@ -16,6 +20,7 @@ CREATE TABLE function_aliases (
     function_name TEXT REFERENCES functions(name) ON DELETE CASCADE,
     alias TEXT NOT NULL,
     flags TEXT(25),
+    function_id INTEGER REFERENCES functions(id) ON DELETE CASCADE,
     PRIMARY KEY (function_name, alias)
 );
 
@@ -55,6 +60,7 @@ CREATE TABLE person_aliases (
     person_name TEXT REFERENCES persons(name) ON DELETE CASCADE,
     alias TEXT NOT NULL,
     flags TEXT(25),
+    person_id INTEGER REFERENCES persons(id) ON DELETE CASCADE,
     PRIMARY KEY (person_name, alias)
 );
 
@@ -73,6 +79,10 @@ CREATE TABLE roles (
     flags TEXT(25),
     created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
     updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    -- Chiavi surrogate intere (allineate ai nomi dai trigger *_sync_*)
+    person_id INTEGER REFERENCES persons(id) ON DELETE CASCADE,
+    function_id INTEGER REFERENCES functions(id) ON DELETE CASCADE,
+    manager_id INTEGER REFERENCES persons(id),
     CONSTRAINT valid_dates CHECK (end_date IS NULL OR end_date >= start_date)
 );
 
@@ -95,38 +105,103 @@ CREATE TABLE role_history (
     flags TEXT(25)
 );
 
+-- Storico degli spostamenti delle funzioni (diff dell'organigramma)
+CREATE TABLE function_history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    function_id INTEGER NOT NULL,
+    function_name TEXT NOT NULL,
+    old_reports_to TEXT,
+    new_reports_to TEXT,
+    action TEXT CHECK (action IN ('INSERT', 'UPDATE', 'DELETE')),
+    change_date DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Fotografie con nome dell'organigramma (funzioni e ruoli attivi)
+CREATE TABLE org_snapshots (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL UNIQUE,
+    taken_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    flags TEXT(25)
+);
+
+CREATE TABLE org_snapshot_functions (
+    snapshot_id INTEGER NOT NULL REFERENCES org_snapshots(id) ON DELETE CASCADE,
+    function_id INTEGER NOT NULL,
+    function_name TEXT NOT NULL,
+    reports_to TEXT,
+    PRIMARY KEY (snapshot_id, function_id)
+) WITHOUT ROWID;
+
+CREATE TABLE org_snapshot_roles (
+    snapshot_id INTEGER NOT NULL REFERENCES org_snapshots(id) ON DELETE CASCADE,
+    role_id INTEGER NOT NULL,
+    person_name TEXT NOT NULL,
+    function_name TEXT NOT NULL,
+    reports_to TEXT,
+    ad_interim BOOLEAN,
+    PRIMARY KEY (snapshot_id, role_id)
+) WITHOUT ROWID;
+
+-- Gerarchia delle funzioni: una riga per ogni coppia antenato/discendente
+CREATE TABLE function_closure (
+    ancestor_id INTEGER NOT NULL,
+    descendant_id INTEGER NOT NULL,
+    depth INTEGER NOT NULL,
+    PRIMARY KEY (ancestor_id, descendant_id)
+) WITHOUT ROWID;
+
 -- Indici per performance
 CREATE INDEX idx_functions_reports_to ON functions(reports_to);
-CREATE INDEX idx_persons_status ON persons(status);
+CREATE INDEX idx_persons_status_name ON persons(status, name);
 CREATE INDEX idx_persons_employee_id ON persons(employee_id);
-CREATE INDEX idx_roles_person ON roles(person_name);
+CREATE INDEX idx_roles_person_function ON roles(person_name, function_name);
 CREATE INDEX idx_roles_function ON roles(function_name);
+CREATE INDEX idx_roles_job_title ON roles(job_title_name);
 CREATE INDEX idx_roles_reports_to ON roles(reports_to);
 CREATE INDEX idx_roles_dates ON roles(start_date, end_date);
 CREATE INDEX idx_roles_active ON roles(person_name, function_name) WHERE end_date IS NULL;
 CREATE INDEX idx_job_titles_level ON job_titles(level);
+CREATE INDEX idx_roles_function_period ON roles(function_id, IFNULL(end_date, '9999-12-31'), start_date);
+CREATE INDEX idx_roles_person_period ON roles(person_id, IFNULL(end_date, '9999-12-31'), start_date);
+CREATE INDEX idx_roles_manager_period ON roles(manager_id, IFNULL(end_date, '9999-12-31'), start_date);
+CREATE INDEX idx_roles_active_ids ON roles(function_id, person_id) WHERE end_date IS NULL;
+CREATE INDEX idx_functions_parent_id ON functions(parent_function_id);
+CREATE INDEX idx_person_aliases_person_id ON person_aliases(person_id);
+CREATE INDEX idx_function_aliases_function_id ON function_aliases(function_id);
+CREATE INDEX idx_function_closure_descendant ON function_closure(descendant_id, depth);
+CREATE INDEX idx_functions_path ON functions(path);
+CREATE INDEX idx_role_history_change_date ON role_history(change_date);
+CREATE INDEX idx_role_history_role_id ON role_history(role_id, change_date);
+CREATE INDEX idx_function_history_change_date ON function_history(change_date);
+CREATE INDEX idx_roles_end_date ON roles(end_date) WHERE end_date IS NOT NULL;
 
--- Trigger per updated_at automatico
+-- Trigger per updated_at automatico (solo sulle colonne di business e solo
+-- se l'UPDATE non l'ha già impostato: il repository lo imposta sempre)
 CREATE TRIGGER update_functions_timestamp 
-    AFTER UPDATE ON functions
+    AFTER UPDATE OF name, reports_to, flags ON functions
+    WHEN NEW.updated_at IS NOT CURRENT_TIMESTAMP
 BEGIN
     UPDATE functions SET updated_at = CURRENT_TIMESTAMP WHERE id = NEW.id;
 END;
 
 CREATE TRIGGER update_job_titles_timestamp 
-    AFTER UPDATE ON job_titles
+    AFTER UPDATE OF name, level, flags ON job_titles
+    WHEN NEW.updated_at IS NOT CURRENT_TIMESTAMP
 BEGIN
     UPDATE job_titles SET updated_at = CURRENT_TIMESTAMP WHERE id = NEW.id;
 END;
 
 CREATE TRIGGER update_persons_timestamp 
-    AFTER UPDATE ON persons
+    AFTER UPDATE OF name, email, employee_id, hire_date, status, flags ON persons
+    WHEN NEW.updated_at IS NOT CURRENT_TIMESTAMP
 BEGIN
     UPDATE persons SET updated_at = CURRENT_TIMESTAMP WHERE id = NEW.id;
 END;
 
 CREATE TRIGGER update_roles_timestamp 
-    AFTER UPDATE ON roles
+    AFTER UPDATE OF person_name, function_name, organizational_unit, job_title_name,
+                    percentage, ad_interim, reports_to, start_date, end_date, flags ON roles
+    WHEN NEW.updated_at IS NOT CURRENT_TIMESTAMP
 BEGIN
     UPDATE roles SET updated_at = CURRENT_TIMESTAMP WHERE id = NEW.id;
 END;
@@ -147,7 +222,14 @@ BEGIN
 END;
 
 CREATE TRIGGER role_audit_update 
-    AFTER UPDATE ON roles
+    AFTER UPDATE OF person_name, function_name, organizational_unit, job_title_name,
+                    percentage, ad_interim, reports_to, start_date, end_date, flags ON roles
+    WHEN NEW.person_name IS NOT OLD.person_name OR NEW.function_name IS NOT OLD.function_name
+      OR NEW.organizational_unit IS NOT OLD.organizational_unit
+      OR NEW.job_title_name IS NOT OLD.job_title_name OR NEW.percentage IS NOT OLD.percentage
+      OR NEW.ad_interim IS NOT OLD.ad_interim OR NEW.reports_to IS NOT OLD.reports_to
+      OR NEW.start_date IS NOT OLD.start_date OR NEW.end_date IS NOT OLD.end_date
+      OR NEW.flags IS NOT OLD.flags
 BEGIN
     INSERT INTO role_history (
         role_id, person_name, function_name, organizational_unit,
@@ -160,6 +242,360 @@ BEGIN
     );
 END;
 
+-- Storico spostamenti funzioni (le rinomine del padre non contano)
+CREATE TRIGGER function_audit_insert
+    AFTER INSERT ON functions
+BEGIN
+    INSERT INTO function_history (function_id, function_name, new_reports_to, action)
+    VALUES (NEW.id, NEW.name, NEW.reports_to, 'INSERT');
+END;
+
+CREATE TRIGGER function_audit_move
+    AFTER UPDATE OF reports_to ON functions
+    WHEN NEW.reports_to IS NOT OLD.reports_to
+      AND NEW.reports_to IS NOT (SELECT name FROM functions WHERE id = OLD.parent_function_id)
+BEGIN
+    INSERT INTO function_history (function_id, function_name, old_reports_to,
+                                  new_reports_to, action)
+    VALUES (NEW.id, NEW.name, OLD.reports_to, NEW.reports_to, 'UPDATE');
+END;
+
+CREATE TRIGGER function_audit_delete
+    AFTER DELETE ON functions
+BEGIN
+    INSERT INTO function_history (function_id, function_name, old_reports_to, action)
+    VALUES (OLD.id, OLD.name, OLD.reports_to, 'DELETE');
+END;
+
+-- Trigger che allineano gli id interi ai nomi (import, SQL manuale)
+CREATE TRIGGER roles_sync_ids_insert
+    AFTER INSERT ON roles
+    WHEN NEW.person_id IS NULL OR NEW.function_id IS NULL
+      OR (NEW.manager_id IS NULL AND NEW.reports_to IS NOT NULL)
+BEGIN
+    UPDATE roles SET
+        person_id = (SELECT id FROM persons WHERE name = NEW.person_name),
+        function_id = (SELECT id FROM functions WHERE name = NEW.function_name),
+        manager_id = (SELECT id FROM persons WHERE name = NEW.reports_to)
+    WHERE id = NEW.id;
+END;
+
+CREATE TRIGGER roles_sync_ids_update
+    AFTER UPDATE OF person_name, function_name, reports_to ON roles
+    WHEN (NEW.person_name IS NOT OLD.person_name
+          AND NEW.person_id IS NOT (SELECT id FROM persons WHERE name = NEW.person_name))
+      OR (NEW.function_name IS NOT OLD.function_name
+          AND NEW.function_id IS NOT (SELECT id FROM functions WHERE name = NEW.function_name))
+      OR (NEW.reports_to IS NOT OLD.reports_to
+          AND NEW.manager_id IS NOT (SELECT id FROM persons WHERE name = NEW.reports_to))
+BEGIN
+    UPDATE roles SET
+        person_id = (SELECT id FROM persons WHERE name = NEW.person_name),
+        function_id = (SELECT id FROM functions WHERE name = NEW.function_name),
+        manager_id = (SELECT id FROM persons WHERE name = NEW.reports_to)
+    WHERE id = NEW.id;
+END;
+
+CREATE TRIGGER functions_sync_parent_insert
+    AFTER INSERT ON functions
+BEGIN
+    UPDATE functions
+    SET parent_function_id = (SELECT p.id FROM functions p WHERE p.name = NEW.reports_to)
+    WHERE id = NEW.id AND NEW.parent_function_id IS NULL
+      AND NEW.reports_to IS NOT NULL AND NEW.reports_to <> '';
+    -- Figli inseriti prima del padre (FK differite)
+    UPDATE functions SET parent_function_id = NEW.id
+    WHERE reports_to = NEW.name AND parent_function_id IS NULL;
+    UPDATE roles SET function_id = NEW.id
+    WHERE function_name = NEW.name AND function_id IS NULL;
+    UPDATE function_aliases SET function_id = NEW.id
+    WHERE function_name = NEW.name AND function_id IS NULL;
+END;
+
+CREATE TRIGGER functions_sync_parent_update
+    AFTER UPDATE OF reports_to ON functions
+    WHEN NEW.reports_to IS NOT OLD.reports_to
+BEGIN
+    UPDATE functions
+    SET parent_function_id = (SELECT p.id FROM functions p WHERE p.name = NEW.reports_to)
+    WHERE id = NEW.id;
+END;
+
+CREATE TRIGGER persons_sync_ids_insert
+    AFTER INSERT ON persons
+BEGIN
+    -- Righe inserite prima della persona (FK differite)
+    UPDATE roles SET person_id = NEW.id
+    WHERE person_name = NEW.name AND person_id IS NULL;
+    UPDATE roles SET manager_id = NEW.id
+    WHERE reports_to = NEW.name AND manager_id IS NULL;
+    UPDATE person_aliases SET person_id = NEW.id
+    WHERE person_name = NEW.name AND person_id IS NULL;
+END;
+
+CREATE TRIGGER person_aliases_sync_ids
+    AFTER INSERT ON person_aliases
+    WHEN NEW.person_id IS NULL
+BEGIN
+    UPDATE person_aliases
+    SET person_id = (SELECT id FROM persons WHERE name = NEW.person_name)
+    WHERE rowid = NEW.rowid;
+END;
+
+CREATE TRIGGER function_aliases_sync_ids
+    AFTER INSERT ON function_aliases
+    WHEN NEW.function_id IS NULL
+BEGIN
+    UPDATE function_aliases
+    SET function_id = (SELECT id FROM functions WHERE name = NEW.function_name)
+    WHERE rowid = NEW.rowid;
+END;
+
+CREATE TRIGGER persons_rename
+    AFTER UPDATE OF name ON persons
+    WHEN NEW.name IS NOT OLD.name
+BEGIN
+    UPDATE roles SET person_name = NEW.name, updated_at = CURRENT_TIMESTAMP
+    WHERE person_id = OLD.id;
+    UPDATE roles SET reports_to = NEW.name, updated_at = CURRENT_TIMESTAMP
+    WHERE manager_id = OLD.id;
+    UPDATE person_aliases SET person_name = NEW.name WHERE person_id = OLD.id;
+END;
+
+CREATE TRIGGER functions_rename
+    AFTER UPDATE OF name ON functions
+    WHEN NEW.name IS NOT OLD.name
+BEGIN
+    UPDATE roles SET function_name = NEW.name, updated_at = CURRENT_TIMESTAMP
+    WHERE function_id = OLD.id;
+    UPDATE functions SET reports_to = NEW.name, updated_at = CURRENT_TIMESTAMP
+    WHERE parent_function_id = OLD.id;
+    UPDATE function_aliases SET function_name = NEW.name WHERE function_id = OLD.id;
+END;
+
+-- Indice di ricerca full-text (rowid = id * 4 + tipo: 1 persona, 2 funzione, 3 job title)
+CREATE VIRTUAL TABLE search_index USING fts5(
+    kind UNINDEXED, name, aliases, codes,
+    tokenize = "unicode61 remove_diacritics 2",
+    prefix = '2 3'
+);
+INSERT INTO search_index (search_index, rank) VALUES ('rank', 'bm25(0.0, 10.0, 4.0, 1.0)');
+
+CREATE TRIGGER persons_search_insert AFTER INSERT ON persons
+BEGIN
+    INSERT INTO search_index (rowid, kind, name, aliases, codes)
+    VALUES (NEW.id * 4 + 1, 'person', NEW.name,
+            (SELECT group_concat(alias, ' ') FROM person_aliases WHERE person_name = NEW.name),
+            trim(coalesce(NEW.employee_id, '') || ' ' || coalesce(NEW.email, '')));
+END;
+
+CREATE TRIGGER persons_search_update AFTER UPDATE OF name, employee_id, email ON persons
+BEGIN
+    DELETE FROM search_index WHERE rowid = OLD.id * 4 + 1;
+    INSERT INTO search_index (rowid, kind, name, aliases, codes)
+    VALUES (NEW.id * 4 + 1, 'person', NEW.name,
+            (SELECT group_concat(alias, ' ') FROM person_aliases WHERE person_name = NEW.name),
+            trim(coalesce(NEW.employee_id, '') || ' ' || coalesce(NEW.email, '')));
+END;
+
+CREATE TRIGGER persons_search_delete AFTER DELETE ON persons
+BEGIN
+    DELETE FROM search_index WHERE rowid = OLD.id * 4 + 1;
+END;
+
+CREATE TRIGGER person_aliases_search_insert AFTER INSERT ON person_aliases
+BEGIN
+    UPDATE search_index SET aliases =
+        (SELECT group_concat(alias, ' ') FROM person_aliases WHERE person_name = NEW.person_name)
+    WHERE rowid = (SELECT id * 4 + 1 FROM persons WHERE name = NEW.person_name);
+END;
+
+CREATE TRIGGER person_aliases_search_update AFTER UPDATE OF person_name, alias ON person_aliases
+BEGIN
+    UPDATE search_index SET aliases =
+        (SELECT group_concat(alias, ' ') FROM person_aliases WHERE person_name = OLD.person_name)
+    WHERE rowid = (SELECT id * 4 + 1 FROM persons WHERE name = OLD.person_name);
+    UPDATE search_index SET aliases =
+        (SELECT group_concat(alias, ' ') FROM person_aliases WHERE person_name = NEW.person_name)
+    WHERE rowid = (SELECT id * 4 + 1 FROM persons WHERE name = NEW.person_name);
+END;
+
+CREATE TRIGGER person_aliases_search_delete AFTER DELETE ON person_aliases
+BEGIN
+    UPDATE search_index SET aliases =
+        (SELECT group_concat(alias, ' ') FROM person_aliases WHERE person_name = OLD.person_name)
+    WHERE rowid = (SELECT id * 4 + 1 FROM persons WHERE name = OLD.person_name);
+END;
+
+CREATE TRIGGER functions_search_insert AFTER INSERT ON functions
+BEGIN
+    INSERT INTO search_index (rowid, kind, name, aliases, codes)
+    VALUES (NEW.id * 4 + 2, 'function', NEW.name,
+            (SELECT group_concat(alias, ' ') FROM function_aliases WHERE function_name = NEW.name),
+            NULL);
+END;
+
+CREATE TRIGGER functions_search_update AFTER UPDATE OF name ON functions
+BEGIN
+    DELETE FROM search_index WHERE rowid = OLD.id * 4 + 2;
+    INSERT INTO search_index (rowid, kind, name, aliases, codes)
+    VALUES (NEW.id * 4 + 2, 'function', NEW.name,
+            (SELECT group_concat(alias, ' ') FROM function_aliases WHERE function_name = NEW.name),
+            NULL);
+END;
+
+CREATE TRIGGER functions_search_delete AFTER DELETE ON functions
+BEGIN
+    DELETE FROM search_index WHERE rowid = OLD.id * 4 + 2;
+END;
+
+CREATE TRIGGER function_aliases_search_insert AFTER INSERT ON function_aliases
+BEGIN
+    UPDATE search_index SET aliases =
+        (SELECT group_concat(alias, ' ') FROM function_aliases WHERE function_name = NEW.function_name)
+    WHERE rowid = (SELECT id * 4 + 2 FROM functions WHERE name = NEW.function_name);
+END;
+
+CREATE TRIGGER function_aliases_search_update AFTER UPDATE OF function_name, alias ON function_aliases
+BEGIN
+    UPDATE search_index SET aliases =
+        (SELECT group_concat(alias, ' ') FROM function_aliases WHERE function_name = OLD.function_name)
+    WHERE rowid = (SELECT id * 4 + 2 FROM functions WHERE name = OLD.function_name);
+    UPDATE search_index SET aliases =
+        (SELECT group_concat(alias, ' ') FROM function_aliases WHERE function_name = NEW.function_name)
+    WHERE rowid = (SELECT id * 4 + 2 FROM functions WHERE name = NEW.function_name);
+END;
+
+CREATE TRIGGER function_aliases_search_delete AFTER DELETE ON function_aliases
+BEGIN
+    UPDATE search_index SET aliases =
+        (SELECT group_concat(alias, ' ') FROM function_aliases WHERE function_name = OLD.function_name)
+    WHERE rowid = (SELECT id * 4 + 2 FROM functions WHERE name = OLD.function_name);
+END;
+
+CREATE TRIGGER job_titles_search_insert AFTER INSERT ON job_titles
+BEGIN
+    INSERT INTO search_index (rowid, kind, name, aliases, codes)
+    VALUES (NEW.id * 4 + 3, 'job_title', NEW.name,
+            (SELECT group_concat(alias, ' ') FROM job_title_aliases WHERE job_title_name = NEW.name),
+            NULL);
+END;
+
+CREATE TRIGGER job_titles_search_update AFTER UPDATE OF name ON job_titles
+BEGIN
+    DELETE FROM search_index WHERE rowid = OLD.id * 4 + 3;
+    INSERT INTO search_index (rowid, kind, name, aliases, codes)
+    VALUES (NEW.id * 4 + 3, 'job_title', NEW.name,
+            (SELECT group_concat(alias, ' ') FROM job_title_aliases WHERE job_title_name = NEW.name),
+            NULL);
+END;
+
+CREATE TRIGGER job_titles_search_delete AFTER DELETE ON job_titles
+BEGIN
+    DELETE FROM search_index WHERE rowid = OLD.id * 4 + 3;
+END;
+
+CREATE TRIGGER job_title_aliases_search_insert AFTER INSERT ON job_title_aliases
+BEGIN
+    UPDATE search_index SET aliases =
+        (SELECT group_concat(alias, ' ') FROM job_title_aliases WHERE job_title_name = NEW.job_title_name)
+    WHERE rowid = (SELECT id * 4 + 3 FROM job_titles WHERE name = NEW.job_title_name);
+END;
+
+CREATE TRIGGER job_title_aliases_search_update AFTER UPDATE OF job_title_name, alias ON job_title_aliases
+BEGIN
+    UPDATE search_index SET aliases =
+        (SELECT group_concat(alias, ' ') FROM job_title_aliases WHERE job_title_name = OLD.job_title_name)
+    WHERE rowid = (SELECT id * 4 + 3 FROM job_titles WHERE name = OLD.job_title_name);
+    UPDATE search_index SET aliases =
+        (SELECT group_concat(alias, ' ') FROM job_title_aliases WHERE job_title_name = NEW.job_title_name)
+    WHERE rowid = (SELECT id * 4 + 3 FROM job_titles WHERE name = NEW.job_title_name);
+END;
+
+CREATE TRIGGER job_title_aliases_search_delete AFTER DELETE ON job_title_aliases
+BEGIN
+    UPDATE search_index SET aliases =
+        (SELECT group_concat(alias, ' ') FROM job_title_aliases WHERE job_title_name = OLD.job_title_name)
+    WHERE rowid = (SELECT id * 4 + 3 FROM job_titles WHERE name = OLD.job_title_name);
+END;
+
+-- Trigger che mantengono closure table, livello e percorso delle funzioni
+CREATE TRIGGER functions_closure_insert
+    AFTER INSERT ON functions
+BEGIN
+    INSERT INTO function_closure (ancestor_id, descendant_id, depth)
+    VALUES (NEW.id, NEW.id, 0);
+    INSERT INTO function_closure (ancestor_id, descendant_id, depth)
+    SELECT c.ancestor_id, NEW.id, c.depth + 1 FROM function_closure c
+    WHERE c.descendant_id = (SELECT parent_function_id FROM functions WHERE id = NEW.id);
+    UPDATE functions SET
+        level = COALESCE((SELECT p.level + 1 FROM functions p
+                          WHERE p.id = functions.parent_function_id), 0),
+        path = COALESCE((SELECT p.path || ' > ' FROM functions p
+                         WHERE p.id = functions.parent_function_id), '') || name
+    WHERE id = NEW.id;
+    -- Figli inseriti prima del padre (FK differite): si agganciano i sottoalberi
+    INSERT INTO function_closure (ancestor_id, descendant_id, depth)
+    SELECT up.ancestor_id, down.descendant_id, up.depth + down.depth + 1
+    FROM functions child
+    JOIN function_closure down ON down.ancestor_id = child.id
+    JOIN function_closure up ON up.descendant_id = NEW.id
+    WHERE child.parent_function_id = NEW.id AND child.id <> NEW.id;
+    UPDATE functions SET
+        level = level + (SELECT level + 1 FROM functions WHERE id = NEW.id),
+        path = (SELECT path || ' > ' FROM functions WHERE id = NEW.id) || path
+    WHERE id IN (SELECT descendant_id FROM function_closure WHERE ancestor_id = NEW.id AND depth > 0);
+END;
+
+CREATE TRIGGER functions_closure_no_cycle
+    BEFORE UPDATE OF parent_function_id ON functions
+    WHEN NEW.parent_function_id IS NOT NULL AND EXISTS (
+        SELECT 1 FROM function_closure
+        WHERE ancestor_id = NEW.id AND descendant_id = NEW.parent_function_id
+    )
+BEGIN
+    SELECT RAISE(ABORT, 'Ciclo nella gerarchia delle funzioni');
+END;
+
+CREATE TRIGGER functions_closure_move
+    AFTER UPDATE OF parent_function_id ON functions
+    WHEN NEW.parent_function_id IS NOT OLD.parent_function_id
+      AND EXISTS (SELECT 1 FROM function_closure
+                  WHERE ancestor_id = NEW.id AND descendant_id = NEW.id)
+BEGIN
+    -- Stacca il sottoalbero dai vecchi antenati
+    DELETE FROM function_closure
+    WHERE descendant_id IN (SELECT descendant_id FROM function_closure WHERE ancestor_id = NEW.id)
+      AND ancestor_id NOT IN (SELECT descendant_id FROM function_closure WHERE ancestor_id = NEW.id);
+    -- Lo riattacca agli antenati del nuovo padre
+    INSERT INTO function_closure (ancestor_id, descendant_id, depth)
+    SELECT up.ancestor_id, down.descendant_id, up.depth + down.depth + 1
+    FROM function_closure up, function_closure down
+    WHERE up.descendant_id = NEW.parent_function_id AND down.ancestor_id = NEW.id;
+    -- Il sottoalbero cambia prefisso del percorso e livello di base
+    UPDATE functions SET
+        path = COALESCE((SELECT p.path || ' > ' FROM functions p WHERE p.id = NEW.parent_function_id), '') || NEW.name || substr(path, length(NEW.path) + 1),
+        level = level + COALESCE((SELECT p.level + 1 FROM functions p WHERE p.id = NEW.parent_function_id), 0) - NEW.level
+    WHERE id IN (SELECT descendant_id FROM function_closure WHERE ancestor_id = NEW.id);
+END;
+
+CREATE TRIGGER functions_closure_rename
+    AFTER UPDATE OF name ON functions
+    WHEN NEW.name IS NOT OLD.name
+BEGIN
+    UPDATE functions SET path =
+        substr(path, 1, length(NEW.path) - length(OLD.name)) || NEW.name
+        || substr(path, length(NEW.path) + 1)
+    WHERE id IN (SELECT descendant_id FROM function_closure WHERE ancestor_id = NEW.id);
+END;
+
+CREATE TRIGGER functions_closure_delete
+    AFTER DELETE ON functions
+BEGIN
+    DELETE FROM function_closure
+    WHERE descendant_id = OLD.id OR ancestor_id = OLD.id;
+END;
+
 -- View per ruoli attivi
 CREATE VIEW active_roles AS
 SELECT 
@@ -169,41 +605,30 @@ SELECT
     p.status as person_status,
     jt.level as job_level
 FROM roles r
-JOIN persons p ON r.person_name = p.name
+JOIN persons p ON r.person_id = p.id
 LEFT JOIN job_titles jt ON r.job_title_name = jt.name
 WHERE r.end_date IS NULL 
 AND p.status = 'ACTIVE';
 
+-- View della gerarchia funzioni (livello e percorso materializzati)
+CREATE VIEW function_chart AS
+SELECT f.id, f.name AS function_name, f.reports_to, f.level, f.path
+FROM functions f
+WHERE f.level IS NOT NULL;
+
 -- View per organigramma completo
 CREATE VIEW organization_chart AS
-WITH RECURSIVE org_tree AS (
-    -- Base case: top-level functions
-    SELECT 
-        f.name as function_name,
-        f.reports_to,
-        0 as level,
-        f.name as path
-    FROM functions f
-    WHERE f.reports_to IS NULL OR f.reports_to = ''
-    
-    UNION ALL
-    
-    -- Recursive case
-    SELECT 
-        f.name,
-        f.reports_to,
-        ot.level + 1,
-        ot.path || ' > ' || f.name
-    FROM functions f
-    JOIN org_tree ot ON f.reports_to = ot.function_name
-)
-SELECT 
-    ot.*,
+SELECT
+    f.name as function_name,
+    f.reports_to,
+    f.level,
+    f.path,
     ar.person_name,
     ar.job_title_name,
     ar.organizational_unit,
     ar.ad_interim,
     ar.reports_to as person_reports_to
-FROM org_tree ot
-LEFT JOIN active_roles ar ON ot.function_name = ar.function_name
-ORDER BY ot.level, ot.function_name, ar.person_name;
\ No newline at end of file
+FROM functions f
+LEFT JOIN active_roles ar ON ar.function_id = f.id
+WHERE f.level IS NOT NULL
+ORDER BY f.level, f.name, ar.person_name;
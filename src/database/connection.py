@@ -1,15 +1,187 @@
 # src/database/connection.py - Versione migliorata
 import sqlite3
+import threading
+import time
 from contextlib import contextmanager
-from typing import Generator
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Generator, Iterable, List, Optional, Sequence, Tuple, Union
 import os
 import logging
 
+from .pool import ConnectionPool
+from .migrations import apply_migrations
+
+
+@dataclass(frozen=True)
+class PerformanceProfile:
+    """Profilo di tuning SQLite (journal, sync, cache, mmap, checkpoint)"""
+    name: str
+    journal_mode: str = "WAL"
+    synchronous: str = "NORMAL"
+    cache_size: int = -16000          # negativo = KiB
+    mmap_size: int = 134217728        # byte (0 = disabilitato)
+    temp_store: str = "MEMORY"
+    busy_timeout: int = 5000          # millisecondi
+    wal_autocheckpoint: int = 1000    # pagine
+    checkpoint_interval: float = 300.0  # secondi tra wal_checkpoint(PASSIVE), 0 = mai
+
+    @property
+    def uses_wal(self) -> bool:
+        return self.journal_mode.upper() == "WAL"
+
+    def connection_pragmas(self) -> Dict[str, object]:
+        """PRAGMA per-connessione (journal_mode è persistente e va a parte)"""
+        pragmas: Dict[str, object] = {
+            "busy_timeout": self.busy_timeout,
+            "synchronous": self.synchronous,
+            "cache_size": self.cache_size,
+            "mmap_size": self.mmap_size,
+            "temp_store": self.temp_store,
+        }
+        if self.uses_wal:
+            pragmas["wal_autocheckpoint"] = self.wal_autocheckpoint
+        return pragmas
+
+    def to_dict(self) -> Dict[str, object]:
+        return {
+            "name": self.name,
+            "journal_mode": self.journal_mode,
+            "synchronous": self.synchronous,
+            "cache_size": self.cache_size,
+            "mmap_size": self.mmap_size,
+            "temp_store": self.temp_store,
+            "busy_timeout": self.busy_timeout,
+            "wal_autocheckpoint": self.wal_autocheckpoint,
+            "checkpoint_interval": self.checkpoint_interval,
+        }
+
+
+PERFORMANCE_PROFILES: Dict[str, PerformanceProfile] = {
+    # Default: WAL, lettori mai bloccati dagli scrittori, fsync solo ai checkpoint
+    "balanced": PerformanceProfile(name="balanced"),
+    # Massima durabilità: fsync ad ogni commit
+    "durable": PerformanceProfile(
+        name="durable", synchronous="FULL", cache_size=-8000, mmap_size=0,
+        busy_timeout=10000,
+    ),
+    # Carichi massivi / ambienti usa-e-getta: nessun fsync
+    "fast": PerformanceProfile(
+        name="fast", synchronous="OFF", cache_size=-65536, mmap_size=536870912,
+        wal_autocheckpoint=10000,
+    ),
+    # Comportamento originale: rollback journal, impostazioni SQLite di default
+    "legacy": PerformanceProfile(
+        name="legacy", journal_mode="DELETE", synchronous="FULL", cache_size=-2000,
+        mmap_size=0, temp_store="DEFAULT", checkpoint_interval=0,
+    ),
+}
+
+DEFAULT_PROFILE = "balanced"
+
+
+def resolve_profile(profile: Union[str, PerformanceProfile, None]) -> PerformanceProfile:
+    """Risolve un profilo per nome, oggetto o variabile d'ambiente DB_PROFILE"""
+    if isinstance(profile, PerformanceProfile):
+        return profile
+    name = profile or os.environ.get("DB_PROFILE") or DEFAULT_PROFILE
+    try:
+        return PERFORMANCE_PROFILES[name.lower()]
+    except KeyError:
+        raise ValueError(
+            f"Profilo database sconosciuto: {name} "
+            f"(disponibili: {', '.join(PERFORMANCE_PROFILES)})"
+        )
+
+
+@dataclass
+class _SharedDatabase:
+    """Stato condiviso da tutte le istanze che puntano allo stesso file"""
+    profile: PerformanceProfile
+    pool: ConnectionPool
+    readonly_pool: ConnectionPool
+    journal_mode: str
+    tx_local: threading.local = field(default_factory=threading.local)
+    last_checkpoint: float = field(default_factory=time.monotonic)
+    checkpoint_lock: threading.Lock = field(default_factory=threading.Lock)
+    # Ascoltatori delle modifiche per argomento (es. 'persons') e oggetti
+    # condivisi (cache, indici in memoria) legati a questo database
+    listeners: Dict[str, List[Callable]] = field(default_factory=dict)
+    objects: Dict[str, Any] = field(default_factory=dict)
+    objects_lock: threading.Lock = field(default_factory=threading.Lock)
+    # Risultati derivati riusati finché data_version non cambia: nome -> (versione, valore)
+    cache: Dict[str, Tuple[int, Any]] = field(default_factory=dict)
+    # Connessione dedicata a PRAGMA data_version (non scrive mai)
+    version_conn: Optional[sqlite3.Connection] = None
+    version_lock: threading.Lock = field(default_factory=threading.Lock)
+    # Versioni per argomento (vedi change_version): contatori dei commit che
+    # lo notificano, data_version dopo l'ultimo commit di questo processo e
+    # commit di altri processi osservati
+    topic_versions: Dict[str, int] = field(default_factory=dict)
+    local_version: Optional[int] = None
+    external_changes: int = 0
+
+
 class DatabaseConnection:
-    def __init__(self, db_path: str = "data/organigramma.db"):
+    # Un solo stato (pool, profilo) per file di database, condiviso da tutte le istanze
+    _shared: Dict[str, _SharedDatabase] = {}
+    _shared_lock = threading.Lock()
+
+    # PRAGMA applicati una volta alla creazione di ogni connessione
+    CONNECTION_PRAGMAS = {
+        "foreign_keys": "ON",
+    }
+
+    def __init__(self, db_path: str = "data/organigramma.db",
+                 pool_size: int = 8, max_idle_time: float = 300.0,
+                 profile: Union[str, PerformanceProfile, None] = None):
         self.db_path = db_path
         self._ensure_db_directory()
         self._init_database()
+        self._state = self._get_shared(pool_size, max_idle_time, resolve_profile(profile))
+        self.pool = self._state.pool
+        self.profile = self._state.profile
+
+    def _get_shared(self, pool_size: int, max_idle_time: float,
+                    profile: PerformanceProfile) -> _SharedDatabase:
+        """Recupera (o crea) lo stato condiviso per questo database"""
+        key = os.path.abspath(self.db_path)
+        with self._shared_lock:
+            state = self._shared.get(key)
+            if state is None:
+                journal_mode = self._apply_journal_mode(profile)
+                apply_migrations(self.db_path, profile.busy_timeout / 1000)
+                pragmas = {**self.CONNECTION_PRAGMAS, **profile.connection_pragmas()}
+                pool = ConnectionPool(
+                    self.db_path,
+                    max_size=pool_size,
+                    max_idle_time=max_idle_time,
+                    pragmas=pragmas,
+                )
+                # Connessioni di sola lettura per snapshot analitici
+                readonly_pool = ConnectionPool(
+                    f"file:{key}?mode=ro",
+                    max_size=pool_size,
+                    max_idle_time=max_idle_time,
+                    pragmas={**pragmas, "query_only": "ON"},
+                    connect_kwargs={"uri": True},
+                )
+                state = _SharedDatabase(profile, pool, readonly_pool, journal_mode)
+                self._shared[key] = state
+                logging.info(f"Database {self.db_path}: profilo '{profile.name}', "
+                             f"journal_mode={journal_mode}")
+            return state
+
+    def _apply_journal_mode(self, profile: PerformanceProfile) -> str:
+        """Imposta il journal_mode (persistente nel file) e restituisce quello attivo"""
+        conn = sqlite3.connect(self.db_path, timeout=profile.busy_timeout / 1000)
+        try:
+            row = conn.execute(f"PRAGMA journal_mode = {profile.journal_mode}").fetchone()
+        finally:
+            conn.close()
+        mode = str(row[0]).upper() if row else "UNKNOWN"
+        if mode != profile.journal_mode.upper():
+            logging.warning(f"journal_mode richiesto {profile.journal_mode}, attivo {mode}")
+        return mode
     
     def _ensure_db_directory(self):
         """Crea directory se non esiste"""
@@ -84,20 +256,238 @@ class DatabaseConnection:
     
     @contextmanager
     def get_connection(self) -> Generator[sqlite3.Connection, None, None]:
-        conn = None
-        try:
-            conn = sqlite3.connect(self.db_path)
-            conn.row_factory = sqlite3.Row
-            conn.execute("PRAGMA foreign_keys = ON")
-            yield conn
-        except Exception as e:
-            if conn:
+        """Connessione dal pool, restituita automaticamente all'uscita"""
+        with self.pool.connection() as conn:
+            outermost = self.pool.current_depth() == 1
+            try:
+                yield conn
+            except Exception as e:
+                if outermost:
+                    conn.rollback()
+                    logging.error(f"Database error: {e}")
+                raise
+            if outermost:
+                self._maybe_checkpoint(conn)
+    
+    @contextmanager
+    def transaction(self) -> Generator[sqlite3.Connection, None, None]:
+        """Unità di lavoro: una sola connessione, un solo commit.
+
+        Le chiamate annidate (anche dai metodi del repository) si uniscono
+        alla transazione già aperta dal thread; commit o rollback avvengono
+        solo all'uscita del blocco più esterno, quindi un passo fallito
+        annulla anche quelli precedenti.
+        """
+        tx = self._state.tx_local
+        with self.get_connection() as conn:
+            if getattr(tx, 'depth', 0) > 0:
+                tx.depth += 1
+                try:
+                    yield conn
+                finally:
+                    tx.depth -= 1
+                return
+            
+            # IMMEDIATE: il lock di scrittura si prende subito, niente
+            # upgrade falliti (SQLITE_BUSY) a metà dell'operazione
+            if not conn.in_transaction:
+                conn.execute("BEGIN IMMEDIATE")
+            tx.depth = 1
+            tx.changes = []
+            try:
+                yield conn
+                conn.commit()
+            except BaseException:
                 conn.rollback()
-            logging.error(f"Database error: {e}")
+                raise
+            finally:
+                tx.depth = 0
+                changes, tx.changes = tx.changes, []
+            self._state.local_version = self.data_version()
+            # Solo a commit avvenuto: dopo un rollback non c'è nulla da notificare
+            for topic, keys in changes:
+                self._dispatch_change(topic, keys)
+    
+    def subscribe(self, topic: str, callback: Callable[[Optional[set]], None]):
+        """Registra una funzione chiamata dopo ogni commit che modifica l'argomento.
+
+        La funzione riceve l'insieme delle chiavi modificate (None = tutte).
+        """
+        self._state.listeners.setdefault(topic, []).append(callback)
+
+    def notify_change(self, topic: str, keys: Optional[Iterable[str]] = None):
+        """Segnala una modifica: notificata subito o al commit della transazione"""
+        keys = set(keys) if keys is not None else None
+        tx = self._state.tx_local
+        if getattr(tx, 'depth', 0) > 0:
+            tx.changes.append((topic, keys))
+        else:
+            self._dispatch_change(topic, keys)
+
+    def _dispatch_change(self, topic: str, keys: Optional[set]):
+        with self._state.version_lock:
+            versions = self._state.topic_versions
+            versions[topic] = versions.get(topic, 0) + 1
+        for callback in list(self._state.listeners.get(topic, ())):
+            try:
+                callback(keys)
+            except Exception as e:
+                logging.error(f"Notifica modifica '{topic}' fallita: {e}")
+
+    def shared(self, name: str, factory: Callable[[], Any]) -> Any:
+        """Oggetto condiviso (cache, indice in memoria) unico per questo database"""
+        state = self._state
+        with state.objects_lock:
+            obj = state.objects.get(name)
+            if obj is None:
+                obj = state.objects[name] = factory()
+            return obj
+    
+    def data_version(self) -> int:
+        """Contatore che cambia a ogni commit sul file (di qualunque processo).
+
+        Letto da una connessione che non scrive mai, quindi vede anche i
+        commit delle connessioni del pool; costa una lettura dell'header.
+        """
+        state = self._state
+        with state.version_lock:
+            if state.version_conn is None:
+                state.version_conn = sqlite3.connect(
+                    f"file:{os.path.abspath(self.db_path)}?mode=ro", uri=True,
+                    check_same_thread=False,
+                    timeout=state.profile.busy_timeout / 1000,
+                )
+            return state.version_conn.execute("PRAGMA data_version").fetchone()[0]
+    
+    def change_version(self, *topics: str) -> Tuple[int, ...]:
+        """Versione dei soli argomenti dati, da usare come chiave di cache.
+
+        Cambia con i commit di questo processo che li notificano
+        (notify_change) e con qualunque commit di altri processi, che non
+        dicono cosa hanno modificato. Un commit di un altro processo nel
+        breve intervallo fra un commit locale e la lettura di data_version
+        che lo segue non viene distinto da quello locale.
+        """
+        version = self.data_version()
+        state = self._state
+        with state.version_lock:
+            if version != state.local_version:
+                state.external_changes += 1
+                state.local_version = version
+            return (state.external_changes,) + tuple(
+                state.topic_versions.get(topic, 0) for topic in topics)
+    
+    def cached(self, name: str, loader: Callable[[], Any]) -> Any:
+        """Valore di loader() riusato finché il database non cambia.
+
+        La validità costa una PRAGMA data_version, nessuna query; loader
+        dovrebbe leggere da read_snapshot() per restituire dati coerenti.
+        """
+        version = self.data_version()
+        entry = self._state.cache.get(name)
+        if entry is not None and entry[0] == version:
+            return entry[1]
+        # Versione letta prima del caricamento: un commit nel frattempo
+        # invalida il valore alla lettura successiva
+        value = loader()
+        self._state.cache[name] = (version, value)
+        return value
+    
+    def in_transaction(self) -> bool:
+        """True se il thread corrente è dentro un'unità di lavoro"""
+        return getattr(self._state.tx_local, 'depth', 0) > 0
+    
+    @contextmanager
+    def read_snapshot(self) -> Generator[sqlite3.Connection, None, None]:
+        """Connessione di sola lettura su uno snapshot coerente del database.
+
+        Tutte le query eseguite nel blocco vedono lo stesso stato; in WAL
+        il lettore non attende gli scrittori e non li blocca.
+        """
+        pool = self._state.readonly_pool
+        with pool.connection() as conn:
+            if pool.current_depth() > 1:
+                # Snapshot annidato: riusa quello già aperto dal thread
+                yield conn
+                return
+            conn.execute("BEGIN")
+            yield conn
+    
+    def open_snapshot(self, attach: Sequence[Tuple[str, str]] = ()) -> sqlite3.Connection:
+        """Snapshot di sola lettura non legato al thread corrente.
+
+        Serve per letture a blocchi che proseguono su thread diversi (es.
+        export in streaming); va restituito con release_snapshot(). attach:
+        coppie (alias, percorso) di file collegati in sola lettura prima
+        dello snapshot (ATTACH non è ammesso dentro una transazione).
+        """
+        conn = self._state.readonly_pool.acquire()
+        try:
+            for alias, path in attach:
+                conn.execute(f"ATTACH DATABASE ? AS {alias}",
+                             (f"file:{os.path.abspath(path)}?mode=ro",))
+            conn.execute("BEGIN")
+        except Exception:
+            self.release_snapshot(conn)
             raise
+        return conn
+
+    def release_snapshot(self, conn: sqlite3.Connection):
+        """Chiude lo snapshot, scollega i file collegati e restituisce la connessione al pool"""
+        attached = [row[1] for row in conn.execute("PRAGMA database_list")
+                    if row[1] not in ('main', 'temp')]
+        if attached:
+            if conn.in_transaction:
+                conn.rollback()
+            for alias in attached:
+                conn.execute(f"DETACH DATABASE {alias}")
+        self._state.readonly_pool.release(conn)
+
+    def _maybe_checkpoint(self, conn: sqlite3.Connection):
+        """Esegue periodicamente un wal_checkpoint(PASSIVE) per contenere il WAL"""
+        state = self._state
+        interval = state.profile.checkpoint_interval
+        if state.journal_mode != "WAL" or interval <= 0:
+            return
+        if time.monotonic() - state.last_checkpoint < interval:
+            return
+        if not state.checkpoint_lock.acquire(blocking=False):
+            return
+        try:
+            state.last_checkpoint = time.monotonic()
+            busy, log_pages, checkpointed = conn.execute(
+                "PRAGMA wal_checkpoint(PASSIVE)"
+            ).fetchone()
+            logging.debug(f"WAL checkpoint: {checkpointed}/{log_pages} pagine (busy={busy})")
+        except sqlite3.Error as e:
+            logging.warning(f"WAL checkpoint fallito: {e}")
         finally:
-            if conn:
-                conn.close()
+            state.checkpoint_lock.release()
+    
+    def interrupt_thread(self, thread_id: int) -> bool:
+        """Interrompe le query in corso del thread indicato (lettura o scrittura)"""
+        interrupted = self._state.pool.interrupt(thread_id)
+        return self._state.readonly_pool.interrupt(thread_id) or interrupted
+    
+    def profile_info(self) -> Dict[str, object]:
+        """Profilo di performance attivo (per health check e diagnostica)"""
+        return {
+            **self.profile.to_dict(),
+            "active_journal_mode": self._state.journal_mode,
+        }
+    
+    def close(self):
+        """Chiude le connessioni del pool condiviso"""
+        key = os.path.abspath(self.db_path)
+        with self._shared_lock:
+            state = self._shared.pop(key, None)
+        if state:
+            state.pool.close_all()
+            state.readonly_pool.close_all()
+            with state.version_lock:
+                if state.version_conn is not None:
+                    state.version_conn.close()
+                    state.version_conn = None
     
     def execute_query(self, query: str, params=None):
         """Esegue query con gestione errori migliorata"""
@@ -108,8 +498,10 @@ class DatabaseConnection:
                     cursor.execute(query, params)
                 else:
                     cursor.execute(query)
-                conn.commit()
-                return cursor.fetchall()
+                rows = cursor.fetchall()
+                if not self.in_transaction():
+                    conn.commit()
+                return rows
         except Exception as e:
             logging.error(f"Query error: {query[:50]}... - {e}")
             raise
\ No newline at end of file
@@ -0,0 +1,913 @@
+# src/database/migrations.py - Migrazioni incrementali dello schema (PRAGMA user_version)
+import sqlite3
+import logging
+from typing import Callable, List, Tuple
+
+
+def _table_exists(conn: sqlite3.Connection, table: str) -> bool:
+    row = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)
+    ).fetchone()
+    return row is not None
+
+
+def _create_index(conn: sqlite3.Connection, name: str, table: str, columns: str,
+                  replaces: str = None, where: str = None):
+    """Crea un indice (se la tabella esiste) ed elimina quello che rende superfluo"""
+    if not _table_exists(conn, table):
+        return
+    partial = f" WHERE {where}" if where else ""
+    conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {table}({columns}){partial}")
+    if replaces:
+        conn.execute(f"DROP INDEX IF EXISTS {replaces}")
+
+
+# ================================================================
+# MIGRAZIONI
+# ================================================================
+
+def _m001_keyset_indexes(conn: sqlite3.Connection):
+    """Indici per paginazione keyset e filtri delle liste"""
+    # (status, name) serve sia il filtro per stato sia l'ordinamento per nome
+    _create_index(conn, "idx_persons_status_name", "persons", "status, name",
+                  replaces="idx_persons_status")
+    # Ordinamento ruoli per persona e funzione anche sui ruoli terminati
+    _create_index(conn, "idx_roles_person_function", "roles", "person_name, function_name",
+                  replaces="idx_roles_person")
+    _create_index(conn, "idx_roles_job_title", "roles", "job_title_name")
+
+
+# ----------------------------------------------------------------
+# Chiavi surrogate intere
+# ----------------------------------------------------------------
+
+# Colonne FK intere affiancate ai riferimenti per nome: (tabella, colonna, definizione)
+SURROGATE_COLUMNS = [
+    ("roles", "person_id", "INTEGER REFERENCES persons(id) ON DELETE CASCADE"),
+    ("roles", "function_id", "INTEGER REFERENCES functions(id) ON DELETE CASCADE"),
+    ("roles", "manager_id", "INTEGER REFERENCES persons(id)"),
+    ("functions", "parent_function_id", "INTEGER REFERENCES functions(id)"),
+    ("person_aliases", "person_id", "INTEGER REFERENCES persons(id) ON DELETE CASCADE"),
+    ("function_aliases", "function_id", "INTEGER REFERENCES functions(id) ON DELETE CASCADE"),
+]
+
+# Allineamento set-based: (tabella, SET, WHERE delle righe da completare)
+_BACKFILL = [
+    ("roles",
+     "person_id = (SELECT id FROM persons WHERE name = roles.person_name), "
+     "function_id = (SELECT id FROM functions WHERE name = roles.function_name), "
+     "manager_id = (SELECT id FROM persons WHERE name = roles.reports_to)",
+     "person_id IS NULL OR function_id IS NULL "
+     "OR (manager_id IS NULL AND reports_to IS NOT NULL)"),
+    ("functions",
+     "parent_function_id = (SELECT p.id FROM functions p WHERE p.name = functions.reports_to)",
+     "parent_function_id IS NULL AND reports_to IS NOT NULL AND reports_to <> ''"),
+    ("person_aliases",
+     "person_id = (SELECT id FROM persons WHERE name = person_aliases.person_name)",
+     "person_id IS NULL"),
+    ("function_aliases",
+     "function_id = (SELECT id FROM functions WHERE name = function_aliases.function_name)",
+     "function_id IS NULL"),
+]
+
+# Colonne "di business": solo le loro modifiche aggiornano timestamp e audit,
+# così l'allineamento degli id non genera storico né aggiornamenti a cascata
+_ROLE_AUDITED = ("person_name, function_name, organizational_unit, job_title_name, "
+                 "percentage, ad_interim, reports_to, start_date, end_date, flags")
+
+_AUDIT_TRIGGERS = {
+    "update_roles_timestamp": f"""
+        CREATE TRIGGER update_roles_timestamp
+            AFTER UPDATE OF {_ROLE_AUDITED} ON roles
+        BEGIN
+            UPDATE roles SET updated_at = CURRENT_TIMESTAMP WHERE id = NEW.id;
+        END""",
+    "update_functions_timestamp": """
+        CREATE TRIGGER update_functions_timestamp
+            AFTER UPDATE OF name, reports_to, flags ON functions
+        BEGIN
+            UPDATE functions SET updated_at = CURRENT_TIMESTAMP WHERE id = NEW.id;
+        END""",
+    "role_audit_update": f"""
+        CREATE TRIGGER role_audit_update
+            AFTER UPDATE OF {_ROLE_AUDITED} ON roles
+        BEGIN
+            INSERT INTO role_history (
+                role_id, person_name, function_name, organizational_unit,
+                job_title_name, percentage, ad_interim, reports_to,
+                start_date, end_date, action, flags
+            ) VALUES (
+                NEW.id, NEW.person_name, NEW.function_name, NEW.organizational_unit,
+                NEW.job_title_name, NEW.percentage, NEW.ad_interim, NEW.reports_to,
+                NEW.start_date, NEW.end_date, 'UPDATE', NEW.flags
+            );
+        END""",
+}
+
+# Trigger che tengono gli id allineati ai nomi per chi scrive solo i nomi
+# (import, SQL manuale); il repository valorizza già gli id negli INSERT
+ID_SYNC_TRIGGERS = {
+    "roles_sync_ids_insert": """
+        CREATE TRIGGER roles_sync_ids_insert
+            AFTER INSERT ON roles
+            WHEN NEW.person_id IS NULL OR NEW.function_id IS NULL
+              OR (NEW.manager_id IS NULL AND NEW.reports_to IS NOT NULL)
+        BEGIN
+            UPDATE roles SET
+                person_id = (SELECT id FROM persons WHERE name = NEW.person_name),
+                function_id = (SELECT id FROM functions WHERE name = NEW.function_name),
+                manager_id = (SELECT id FROM persons WHERE name = NEW.reports_to)
+            WHERE id = NEW.id;
+        END""",
+    "roles_sync_ids_update": """
+        CREATE TRIGGER roles_sync_ids_update
+            AFTER UPDATE OF person_name, function_name, reports_to ON roles
+            WHEN NEW.person_name IS NOT OLD.person_name
+              OR NEW.function_name IS NOT OLD.function_name
+              OR NEW.reports_to IS NOT OLD.reports_to
+        BEGIN
+            UPDATE roles SET
+                person_id = (SELECT id FROM persons WHERE name = NEW.person_name),
+                function_id = (SELECT id FROM functions WHERE name = NEW.function_name),
+                manager_id = (SELECT id FROM persons WHERE name = NEW.reports_to)
+            WHERE id = NEW.id;
+        END""",
+    "functions_sync_parent_insert": """
+        CREATE TRIGGER functions_sync_parent_insert
+            AFTER INSERT ON functions
+        BEGIN
+            UPDATE functions
+            SET parent_function_id = (SELECT p.id FROM functions p WHERE p.name = NEW.reports_to)
+            WHERE id = NEW.id AND NEW.parent_function_id IS NULL
+              AND NEW.reports_to IS NOT NULL AND NEW.reports_to <> '';
+            -- Figli inseriti prima del padre (FK differite)
+            UPDATE functions SET parent_function_id = NEW.id
+            WHERE reports_to = NEW.name AND parent_function_id IS NULL;
+            UPDATE roles SET function_id = NEW.id
+            WHERE function_name = NEW.name AND function_id IS NULL;
+            UPDATE function_aliases SET function_id = NEW.id
+            WHERE function_name = NEW.name AND function_id IS NULL;
+        END""",
+    "functions_sync_parent_update": """
+        CREATE TRIGGER functions_sync_parent_update
+            AFTER UPDATE OF reports_to ON functions
+            WHEN NEW.reports_to IS NOT OLD.reports_to
+        BEGIN
+            UPDATE functions
+            SET parent_function_id = (SELECT p.id FROM functions p WHERE p.name = NEW.reports_to)
+            WHERE id = NEW.id;
+        END""",
+    "persons_sync_ids_insert": """
+        CREATE TRIGGER persons_sync_ids_insert
+            AFTER INSERT ON persons
+        BEGIN
+            -- Righe inserite prima della persona (FK differite)
+            UPDATE roles SET person_id = NEW.id
+            WHERE person_name = NEW.name AND person_id IS NULL;
+            UPDATE roles SET manager_id = NEW.id
+            WHERE reports_to = NEW.name AND manager_id IS NULL;
+            UPDATE person_aliases SET person_id = NEW.id
+            WHERE person_name = NEW.name AND person_id IS NULL;
+        END""",
+    "person_aliases_sync_ids": """
+        CREATE TRIGGER person_aliases_sync_ids
+            AFTER INSERT ON person_aliases
+            WHEN NEW.person_id IS NULL
+        BEGIN
+            UPDATE person_aliases
+            SET person_id = (SELECT id FROM persons WHERE name = NEW.person_name)
+            WHERE rowid = NEW.rowid;
+        END""",
+    "function_aliases_sync_ids": """
+        CREATE TRIGGER function_aliases_sync_ids
+            AFTER INSERT ON function_aliases
+            WHEN NEW.function_id IS NULL
+        BEGIN
+            UPDATE function_aliases
+            SET function_id = (SELECT id FROM functions WHERE name = NEW.function_name)
+            WHERE rowid = NEW.rowid;
+        END""",
+    # Rinomina: i riferimenti per nome seguono l'id (ricerca sull'indice intero)
+    "persons_rename": """
+        CREATE TRIGGER persons_rename
+            AFTER UPDATE OF name ON persons
+            WHEN NEW.name IS NOT OLD.name
+        BEGIN
+            UPDATE roles SET person_name = NEW.name WHERE person_id = OLD.id;
+            UPDATE roles SET reports_to = NEW.name WHERE manager_id = OLD.id;
+            UPDATE person_aliases SET person_name = NEW.name WHERE person_id = OLD.id;
+        END""",
+    "functions_rename": """
+        CREATE TRIGGER functions_rename
+            AFTER UPDATE OF name ON functions
+            WHEN NEW.name IS NOT OLD.name
+        BEGIN
+            UPDATE roles SET function_name = NEW.name WHERE function_id = OLD.id;
+            UPDATE functions SET reports_to = NEW.name WHERE parent_function_id = OLD.id;
+            UPDATE function_aliases SET function_name = NEW.name WHERE function_id = OLD.id;
+        END""",
+}
+
+# Migrazione 7: un UPDATE = una scrittura di riga (più lo storico). Le
+# definizioni sopra restano quelle installate dalla migrazione 2
+
+# Lo storico registra solo gli UPDATE che cambiano davvero qualcosa
+_ROLE_CHANGED = " OR ".join(f"NEW.{column} IS NOT OLD.{column}"
+                            for column in _ROLE_AUDITED.split(", "))
+
+# Il timestamp si aggiorna con una seconda scrittura solo se chi ha fatto
+# l'UPDATE non l'ha già impostato (il repository lo imposta sempre)
+_TIMESTAMP_UNSET = "NEW.updated_at IS NOT CURRENT_TIMESTAMP"
+
+_SINGLE_WRITE_TRIGGERS = {
+    "update_roles_timestamp": f"""
+        CREATE TRIGGER update_roles_timestamp
+            AFTER UPDATE OF {_ROLE_AUDITED} ON roles
+            WHEN {_TIMESTAMP_UNSET}
+        BEGIN
+            UPDATE roles SET updated_at = CURRENT_TIMESTAMP WHERE id = NEW.id;
+        END""",
+    "update_functions_timestamp": f"""
+        CREATE TRIGGER update_functions_timestamp
+            AFTER UPDATE OF name, reports_to, flags ON functions
+            WHEN {_TIMESTAMP_UNSET}
+        BEGIN
+            UPDATE functions SET updated_at = CURRENT_TIMESTAMP WHERE id = NEW.id;
+        END""",
+    "update_persons_timestamp": f"""
+        CREATE TRIGGER update_persons_timestamp
+            AFTER UPDATE OF name, email, employee_id, hire_date, status, flags ON persons
+            WHEN {_TIMESTAMP_UNSET}
+        BEGIN
+            UPDATE persons SET updated_at = CURRENT_TIMESTAMP WHERE id = NEW.id;
+        END""",
+    "update_job_titles_timestamp": f"""
+        CREATE TRIGGER update_job_titles_timestamp
+            AFTER UPDATE OF name, level, flags ON job_titles
+            WHEN {_TIMESTAMP_UNSET}
+        BEGIN
+            UPDATE job_titles SET updated_at = CURRENT_TIMESTAMP WHERE id = NEW.id;
+        END""",
+    "role_audit_update": f"""
+        CREATE TRIGGER role_audit_update
+            AFTER UPDATE OF {_ROLE_AUDITED} ON roles
+            WHEN {_ROLE_CHANGED}
+        BEGIN
+            INSERT INTO role_history (
+                role_id, person_name, function_name, organizational_unit,
+                job_title_name, percentage, ad_interim, reports_to,
+                start_date, end_date, action, flags
+            ) VALUES (
+                NEW.id, NEW.person_name, NEW.function_name, NEW.organizational_unit,
+                NEW.job_title_name, NEW.percentage, NEW.ad_interim, NEW.reports_to,
+                NEW.start_date, NEW.end_date, 'UPDATE', NEW.flags
+            );
+        END""",
+    # Solo se un nome cambiato non corrisponde più al suo id: chi scrive anche
+    # l'id (repository, rinomina a cascata) non paga un secondo UPDATE
+    "roles_sync_ids_update": """
+        CREATE TRIGGER roles_sync_ids_update
+            AFTER UPDATE OF person_name, function_name, reports_to ON roles
+            WHEN (NEW.person_name IS NOT OLD.person_name
+                  AND NEW.person_id IS NOT (SELECT id FROM persons WHERE name = NEW.person_name))
+              OR (NEW.function_name IS NOT OLD.function_name
+                  AND NEW.function_id IS NOT (SELECT id FROM functions WHERE name = NEW.function_name))
+              OR (NEW.reports_to IS NOT OLD.reports_to
+                  AND NEW.manager_id IS NOT (SELECT id FROM persons WHERE name = NEW.reports_to))
+        BEGIN
+            UPDATE roles SET
+                person_id = (SELECT id FROM persons WHERE name = NEW.person_name),
+                function_id = (SELECT id FROM functions WHERE name = NEW.function_name),
+                manager_id = (SELECT id FROM persons WHERE name = NEW.reports_to)
+            WHERE id = NEW.id;
+        END""",
+    "persons_rename": """
+        CREATE TRIGGER persons_rename
+            AFTER UPDATE OF name ON persons
+            WHEN NEW.name IS NOT OLD.name
+        BEGIN
+            UPDATE roles SET person_name = NEW.name, updated_at = CURRENT_TIMESTAMP
+            WHERE person_id = OLD.id;
+            UPDATE roles SET reports_to = NEW.name, updated_at = CURRENT_TIMESTAMP
+            WHERE manager_id = OLD.id;
+            UPDATE person_aliases SET person_name = NEW.name WHERE person_id = OLD.id;
+        END""",
+    "functions_rename": """
+        CREATE TRIGGER functions_rename
+            AFTER UPDATE OF name ON functions
+            WHEN NEW.name IS NOT OLD.name
+        BEGIN
+            UPDATE roles SET function_name = NEW.name, updated_at = CURRENT_TIMESTAMP
+            WHERE function_id = OLD.id;
+            UPDATE functions SET reports_to = NEW.name, updated_at = CURRENT_TIMESTAMP
+            WHERE parent_function_id = OLD.id;
+            UPDATE function_aliases SET function_name = NEW.name WHERE function_id = OLD.id;
+        END""",
+}
+
+# Viste riscritte per unire sugli id interi (colonne in uscita invariate)
+SURROGATE_VIEWS = {
+    "active_roles": """
+        CREATE VIEW active_roles AS
+        SELECT
+            r.*,
+            p.email,
+            p.employee_id,
+            p.status as person_status,
+            jt.level as job_level
+        FROM roles r
+        JOIN persons p ON r.person_id = p.id
+        LEFT JOIN job_titles jt ON r.job_title_name = jt.name
+        WHERE r.end_date IS NULL
+        AND p.status = 'ACTIVE'""",
+    "organization_chart": """
+        CREATE VIEW organization_chart AS
+        WITH RECURSIVE org_tree AS (
+            SELECT f.id, f.name as function_name, f.reports_to, 0 as level, f.name as path
+            FROM functions f
+            WHERE f.reports_to IS NULL OR f.reports_to = ''
+            UNION ALL
+            SELECT f.id, f.name, f.reports_to, ot.level + 1, ot.path || ' > ' || f.name
+            FROM functions f
+            JOIN org_tree ot ON f.parent_function_id = ot.id
+        )
+        SELECT
+            ot.function_name,
+            ot.reports_to,
+            ot.level,
+            ot.path,
+            ar.person_name,
+            ar.job_title_name,
+            ar.organizational_unit,
+            ar.ad_interim,
+            ar.reports_to as person_reports_to
+        FROM org_tree ot
+        LEFT JOIN active_roles ar ON ar.function_id = ot.id
+        ORDER BY ot.level, ot.function_name, ar.person_name""",
+    "function_chart": """
+        CREATE VIEW function_chart AS
+        WITH RECURSIVE org_tree AS (
+            SELECT f.id, f.name AS function_name, f.reports_to, 0 AS level, f.name AS path
+            FROM functions f
+            WHERE f.reports_to IS NULL OR f.reports_to = ''
+            UNION ALL
+            SELECT f.id, f.name, f.reports_to, ot.level + 1, ot.path || ' > ' || f.name
+            FROM functions f
+            JOIN org_tree ot ON f.parent_function_id = ot.id
+        )
+        SELECT ot.*
+        FROM org_tree ot
+        ORDER BY ot.level, ot.function_name""",
+    "role_chart": """
+        CREATE VIEW role_chart AS
+        WITH RECURSIVE org_tree AS (
+            SELECT ar.person_id, ar.person_name AS role_person_name, ar.reports_to,
+                   0 AS level, ar.person_name AS path
+            FROM active_roles ar
+            WHERE ar.reports_to IS NULL OR ar.reports_to = ''
+            UNION ALL
+            SELECT ar.person_id, ar.person_name, ar.reports_to,
+                   ot.level + 1, ot.path || ' > ' || ar.person_name
+            FROM active_roles ar
+            JOIN org_tree ot ON ar.manager_id = ot.person_id
+        )
+        SELECT DISTINCT ot.role_person_name, ot.reports_to, ot.level, ot.path
+        FROM org_tree ot
+        ORDER BY ot.level, ot.role_person_name""",
+}
+
+
+def _column_exists(conn: sqlite3.Connection, table: str, column: str) -> bool:
+    return any(row[1] == column for row in conn.execute(f"PRAGMA table_info({table})"))
+
+
+def _replace_object(conn: sqlite3.Connection, kind: str, name: str, sql: str,
+                    only_if_exists: bool = False):
+    """Ricrea un trigger o una vista con una nuova definizione"""
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = ? AND name = ?", (kind, name)
+    ).fetchone() is not None
+    if only_if_exists and not exists:
+        return
+    conn.execute(f"DROP {kind.upper()} IF EXISTS {name}")
+    conn.execute(sql)
+
+
+def backfill_surrogate_ids(conn: sqlite3.Connection):
+    """Completa gli id interi mancanti con un UPDATE set-based per tabella"""
+    for table, assignments, where in _BACKFILL:
+        if _table_exists(conn, table) and _column_exists(conn, table, assignments.split()[0]):
+            conn.execute(f"UPDATE {table} SET {assignments} WHERE {where}")
+
+
+def _m002_surrogate_keys(conn: sqlite3.Connection):
+    """FK intere (person_id, function_id, manager_id, parent_function_id)"""
+    added = set()
+    for table, column, definition in SURROGATE_COLUMNS:
+        if _table_exists(conn, table) and not _column_exists(conn, table, column):
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+            added.add(table)
+
+    # Prima del backfill: l'UPDATE degli id non deve generare storico
+    for name, sql in _AUDIT_TRIGGERS.items():
+        _replace_object(conn, "trigger", name, sql, only_if_exists=True)
+
+    backfill_surrogate_ids(conn)
+
+    _create_index(conn, "idx_roles_person_id", "roles", "person_id")
+    _create_index(conn, "idx_roles_function_id", "roles", "function_id")
+    _create_index(conn, "idx_roles_manager_id", "roles", "manager_id")
+    _create_index(conn, "idx_roles_active_ids", "roles", "function_id, person_id",
+                  where="end_date IS NULL")
+    _create_index(conn, "idx_functions_parent_id", "functions", "parent_function_id")
+    _create_index(conn, "idx_person_aliases_person_id", "person_aliases", "person_id")
+    _create_index(conn, "idx_function_aliases_function_id", "function_aliases", "function_id")
+
+    tables = {"roles", "functions", "persons", "person_aliases", "function_aliases"}
+    if all(_table_exists(conn, table) for table in tables):
+        for name, sql in ID_SYNC_TRIGGERS.items():
+            _replace_object(conn, "trigger", name, sql)
+    for name, sql in SURROGATE_VIEWS.items():
+        _replace_object(conn, "view", name, sql, only_if_exists=True)
+
+
+# ----------------------------------------------------------------
+# Indice di ricerca full-text (FTS5)
+# ----------------------------------------------------------------
+
+# Un documento per entità; rowid = id * 4 + codice del tipo, così ogni
+# trigger aggiorna il proprio documento con una ricerca sul rowid
+SEARCH_KINDS = {"person": 1, "function": 2, "job_title": 3}
+
+SEARCH_INDEX_SQL = """
+    CREATE VIRTUAL TABLE search_index USING fts5(
+        kind UNINDEXED, name, aliases, codes,
+        tokenize = "unicode61 remove_diacritics 2",
+        prefix = '2 3'
+    )"""
+
+# Peso delle colonne nel ranking bm25 (kind, name, aliases, codes)
+SEARCH_RANK = "bm25(0.0, 10.0, 4.0, 1.0)"
+
+# (tipo, tabella, tabella alias, colonna proprietario, espressione codes)
+_SEARCH_SOURCES = [
+    ("person", "persons", "person_aliases", "person_name",
+     "trim(coalesce({t}.employee_id, '') || ' ' || coalesce({t}.email, ''))"),
+    ("function", "functions", "function_aliases", "function_name", "NULL"),
+    ("job_title", "job_titles", "job_title_aliases", "job_title_name", "NULL"),
+]
+
+
+def _search_triggers() -> dict:
+    """Trigger che tengono l'indice allineato a entità e alias"""
+    triggers = {}
+    for kind, table, alias_table, owner, codes in _SEARCH_SOURCES:
+        code = SEARCH_KINDS[kind]
+        aliases = f"(SELECT group_concat(alias, ' ') FROM {alias_table} WHERE {owner} = NEW.name)"
+        insert = (
+            f"INSERT INTO search_index (rowid, kind, name, aliases, codes)\n"
+            f"            VALUES (NEW.id * 4 + {code}, '{kind}', NEW.name,\n"
+            f"                    {aliases},\n"
+            f"                    {codes.format(t='NEW')});"
+        )
+        changed = "name, employee_id, email" if kind == "person" else "name"
+        triggers[f"{table}_search_insert"] = f"""
+        CREATE TRIGGER {table}_search_insert AFTER INSERT ON {table}
+        BEGIN
+            {insert}
+        END"""
+        triggers[f"{table}_search_update"] = f"""
+        CREATE TRIGGER {table}_search_update AFTER UPDATE OF {changed} ON {table}
+        BEGIN
+            DELETE FROM search_index WHERE rowid = OLD.id * 4 + {code};
+            {insert}
+        END"""
+        triggers[f"{table}_search_delete"] = f"""
+        CREATE TRIGGER {table}_search_delete AFTER DELETE ON {table}
+        BEGIN
+            DELETE FROM search_index WHERE rowid = OLD.id * 4 + {code};
+        END"""
+
+        def refresh(ref):
+            return (
+                f"UPDATE search_index SET aliases =\n"
+                f"                (SELECT group_concat(alias, ' ') FROM {alias_table} WHERE {owner} = {ref}.{owner})\n"
+                f"            WHERE rowid = (SELECT id * 4 + {code} FROM {table} WHERE name = {ref}.{owner});"
+            )
+        triggers[f"{alias_table}_search_insert"] = f"""
+        CREATE TRIGGER {alias_table}_search_insert AFTER INSERT ON {alias_table}
+        BEGIN
+            {refresh('NEW')}
+        END"""
+        triggers[f"{alias_table}_search_update"] = f"""
+        CREATE TRIGGER {alias_table}_search_update AFTER UPDATE OF {owner}, alias ON {alias_table}
+        BEGIN
+            {refresh('OLD')}
+            {refresh('NEW')}
+        END"""
+        triggers[f"{alias_table}_search_delete"] = f"""
+        CREATE TRIGGER {alias_table}_search_delete AFTER DELETE ON {alias_table}
+        BEGIN
+            {refresh('OLD')}
+        END"""
+    return triggers
+
+
+SEARCH_TRIGGERS = _search_triggers()
+
+
+def rebuild_search_index(conn: sqlite3.Connection):
+    """Ricostruisce l'indice di ricerca con un INSERT ... SELECT per tipo"""
+    if not _table_exists(conn, "search_index"):
+        return
+    conn.execute("DELETE FROM search_index")
+    for kind, table, alias_table, owner, codes in _SEARCH_SOURCES:
+        if not _table_exists(conn, table):
+            continue
+        aliases = (
+            f"(SELECT group_concat(a.alias, ' ') FROM {alias_table} a WHERE a.{owner} = t.name)"
+            if _table_exists(conn, alias_table) else "NULL"
+        )
+        conn.execute(f"""
+            INSERT INTO search_index (rowid, kind, name, aliases, codes)
+            SELECT t.id * 4 + {SEARCH_KINDS[kind]}, '{kind}', t.name, {aliases},
+                   {codes.format(t='t')}
+            FROM {table} t
+        """)
+
+
+def _m003_search_index(conn: sqlite3.Connection):
+    """Indice FTS5 su persone, funzioni, job title e relativi alias"""
+    if not _table_exists(conn, "search_index"):
+        try:
+            conn.execute(SEARCH_INDEX_SQL)
+        except sqlite3.OperationalError as e:
+            # SQLite compilato senza FTS5: la ricerca resta sul LIKE
+            logging.warning(f"Indice di ricerca non disponibile: {e}")
+            return
+        conn.execute(f"INSERT INTO search_index (search_index, rank) VALUES ('rank', '{SEARCH_RANK}')")
+    rebuild_search_index(conn)
+    tables = {table for _, table, alias_table, _, _ in _SEARCH_SOURCES} | \
+             {alias_table for _, _, alias_table, _, _ in _SEARCH_SOURCES}
+    if all(_table_exists(conn, table) for table in tables):
+        for name, sql in SEARCH_TRIGGERS.items():
+            _replace_object(conn, "trigger", name, sql)
+
+
+# ----------------------------------------------------------------
+# Gerarchia delle funzioni materializzata (closure table)
+# ----------------------------------------------------------------
+
+FUNCTION_CLOSURE_SQL = """
+    CREATE TABLE function_closure (
+        ancestor_id INTEGER NOT NULL,
+        descendant_id INTEGER NOT NULL,
+        depth INTEGER NOT NULL,
+        PRIMARY KEY (ancestor_id, descendant_id)
+    ) WITHOUT ROWID"""
+
+# Percorso e livello del nodo NEW dopo lo spostamento sotto il nuovo padre
+_NEW_PATH = ("COALESCE((SELECT p.path || ' > ' FROM functions p "
+             "WHERE p.id = NEW.parent_function_id), '') || NEW.name")
+_NEW_LEVEL = "COALESCE((SELECT p.level + 1 FROM functions p WHERE p.id = NEW.parent_function_id), 0)"
+_SUBTREE = "SELECT descendant_id FROM function_closure WHERE ancestor_id = NEW.id"
+
+# Manutenzione incrementale: ogni modifica tocca solo il sottoalbero interessato.
+# I trigger non dipendono dall'ordine rispetto a quelli di allineamento degli id
+# (functions_sync_parent_*): il padre si legge dalla tabella, non da NEW.
+FUNCTION_CLOSURE_TRIGGERS = {
+    "functions_closure_insert": f"""
+        CREATE TRIGGER functions_closure_insert
+            AFTER INSERT ON functions
+        BEGIN
+            INSERT INTO function_closure (ancestor_id, descendant_id, depth)
+            VALUES (NEW.id, NEW.id, 0);
+            INSERT INTO function_closure (ancestor_id, descendant_id, depth)
+            SELECT c.ancestor_id, NEW.id, c.depth + 1 FROM function_closure c
+            WHERE c.descendant_id = (SELECT parent_function_id FROM functions WHERE id = NEW.id);
+            UPDATE functions SET
+                level = COALESCE((SELECT p.level + 1 FROM functions p
+                                  WHERE p.id = functions.parent_function_id), 0),
+                path = COALESCE((SELECT p.path || ' > ' FROM functions p
+                                 WHERE p.id = functions.parent_function_id), '') || name
+            WHERE id = NEW.id;
+            -- Figli inseriti prima del padre (FK differite): si agganciano i sottoalberi
+            INSERT INTO function_closure (ancestor_id, descendant_id, depth)
+            SELECT up.ancestor_id, down.descendant_id, up.depth + down.depth + 1
+            FROM functions child
+            JOIN function_closure down ON down.ancestor_id = child.id
+            JOIN function_closure up ON up.descendant_id = NEW.id
+            WHERE child.parent_function_id = NEW.id AND child.id <> NEW.id;
+            UPDATE functions SET
+                level = level + (SELECT level + 1 FROM functions WHERE id = NEW.id),
+                path = (SELECT path || ' > ' FROM functions WHERE id = NEW.id) || path
+            WHERE id IN ({_SUBTREE} AND depth > 0);
+        END""",
+    "functions_closure_no_cycle": """
+        CREATE TRIGGER functions_closure_no_cycle
+            BEFORE UPDATE OF parent_function_id ON functions
+            WHEN NEW.parent_function_id IS NOT NULL AND EXISTS (
+                SELECT 1 FROM function_closure
+                WHERE ancestor_id = NEW.id AND descendant_id = NEW.parent_function_id
+            )
+        BEGIN
+            SELECT RAISE(ABORT, 'Ciclo nella gerarchia delle funzioni');
+        END""",
+    "functions_closure_move": f"""
+        CREATE TRIGGER functions_closure_move
+            AFTER UPDATE OF parent_function_id ON functions
+            WHEN NEW.parent_function_id IS NOT OLD.parent_function_id
+              AND EXISTS (SELECT 1 FROM function_closure
+                          WHERE ancestor_id = NEW.id AND descendant_id = NEW.id)
+        BEGIN
+            -- Stacca il sottoalbero dai vecchi antenati
+            DELETE FROM function_closure
+            WHERE descendant_id IN ({_SUBTREE})
+              AND ancestor_id NOT IN ({_SUBTREE});
+            -- Lo riattacca agli antenati del nuovo padre
+            INSERT INTO function_closure (ancestor_id, descendant_id, depth)
+            SELECT up.ancestor_id, down.descendant_id, up.depth + down.depth + 1
+            FROM function_closure up, function_closure down
+            WHERE up.descendant_id = NEW.parent_function_id AND down.ancestor_id = NEW.id;
+            -- Il sottoalbero cambia prefisso del percorso e livello di base
+            UPDATE functions SET
+                path = {_NEW_PATH} || substr(path, length(NEW.path) + 1),
+                level = level + {_NEW_LEVEL} - NEW.level
+            WHERE id IN ({_SUBTREE});
+        END""",
+    "functions_closure_rename": f"""
+        CREATE TRIGGER functions_closure_rename
+            AFTER UPDATE OF name ON functions
+            WHEN NEW.name IS NOT OLD.name
+        BEGIN
+            UPDATE functions SET path =
+                substr(path, 1, length(NEW.path) - length(OLD.name)) || NEW.name
+                || substr(path, length(NEW.path) + 1)
+            WHERE id IN ({_SUBTREE});
+        END""",
+    "functions_closure_delete": """
+        CREATE TRIGGER functions_closure_delete
+            AFTER DELETE ON functions
+        BEGIN
+            DELETE FROM function_closure
+            WHERE descendant_id = OLD.id OR ancestor_id = OLD.id;
+        END""",
+}
+
+# Viste sulla gerarchia materializzata: niente più CTE ricorsive a ogni lettura
+CLOSURE_VIEWS = {
+    "function_chart": """
+        CREATE VIEW function_chart AS
+        SELECT f.id, f.name AS function_name, f.reports_to, f.level, f.path
+        FROM functions f
+        WHERE f.level IS NOT NULL""",
+    "organization_chart": """
+        CREATE VIEW organization_chart AS
+        SELECT
+            f.name as function_name,
+            f.reports_to,
+            f.level,
+            f.path,
+            ar.person_name,
+            ar.job_title_name,
+            ar.organizational_unit,
+            ar.ad_interim,
+            ar.reports_to as person_reports_to
+        FROM functions f
+        LEFT JOIN active_roles ar ON ar.function_id = f.id
+        WHERE f.level IS NOT NULL
+        ORDER BY f.level, f.name, ar.person_name""",
+}
+
+
+def rebuild_function_closure(conn: sqlite3.Connection):
+    """Ricalcola closure table, livelli e percorsi con due CTE ricorsive"""
+    if not _table_exists(conn, "function_closure"):
+        return
+    conn.execute("DELETE FROM function_closure")
+    # La profondità limitata al numero di funzioni ferma eventuali cicli nei dati
+    conn.execute("""
+        INSERT INTO function_closure (ancestor_id, descendant_id, depth)
+        WITH RECURSIVE closure(ancestor_id, descendant_id, depth) AS (
+            SELECT id, id, 0 FROM functions
+            UNION ALL
+            SELECT c.ancestor_id, f.id, c.depth + 1
+            FROM closure c JOIN functions f ON f.parent_function_id = c.descendant_id
+            WHERE c.depth < (SELECT COUNT(*) FROM functions)
+        )
+        SELECT ancestor_id, descendant_id, MIN(depth) FROM closure
+        GROUP BY ancestor_id, descendant_id
+    """)
+    conn.execute("DROP TABLE IF EXISTS temp.function_paths")
+    conn.execute("""
+        CREATE TEMP TABLE function_paths AS
+        WITH RECURSIVE tree(id, level, path) AS (
+            SELECT id, 0, name FROM functions WHERE parent_function_id IS NULL
+            UNION ALL
+            SELECT f.id, t.level + 1, t.path || ' > ' || f.name
+            FROM tree t JOIN functions f ON f.parent_function_id = t.id
+        )
+        SELECT id, level, path FROM tree
+    """)
+    conn.execute("CREATE UNIQUE INDEX temp.idx_function_paths ON function_paths(id)")
+    conn.execute("""
+        UPDATE functions SET
+            level = (SELECT level FROM temp.function_paths t WHERE t.id = functions.id),
+            path = (SELECT path FROM temp.function_paths t WHERE t.id = functions.id)
+    """)
+    conn.execute("DROP TABLE temp.function_paths")
+
+
+def _m004_function_closure(conn: sqlite3.Connection):
+    """Closure table (antenato, discendente, profondità) e percorso/livello materializzati"""
+    if not _table_exists(conn, "functions"):
+        return
+    for column, definition in (("level", "INTEGER"), ("path", "TEXT")):
+        if not _column_exists(conn, "functions", column):
+            conn.execute(f"ALTER TABLE functions ADD COLUMN {column} {definition}")
+    if not _table_exists(conn, "function_closure"):
+        conn.execute(FUNCTION_CLOSURE_SQL)
+    _create_index(conn, "idx_function_closure_descendant", "function_closure",
+                  "descendant_id, depth")
+    _create_index(conn, "idx_functions_path", "functions", "path")
+    rebuild_function_closure(conn)
+    for name, sql in FUNCTION_CLOSURE_TRIGGERS.items():
+        _replace_object(conn, "trigger", name, sql)
+    _replace_object(conn, "view", "function_chart", CLOSURE_VIEWS["function_chart"])
+    _replace_object(conn, "view", "organization_chart", CLOSURE_VIEWS["organization_chart"],
+                    only_if_exists=True)
+
+
+# ----------------------------------------------------------------
+# Validità dei ruoli nel tempo
+# ----------------------------------------------------------------
+
+# Fine del periodo di un ruolo (esclusa): un ruolo aperto vale fino a una data
+# sentinella, così "attivo alla data" diventa un confronto di intervallo su
+# un'unica espressione indicizzabile. Le query devono usare questo stesso testo.
+ROLE_PERIOD_END = "IFNULL(end_date, '9999-12-31')"
+
+# (nome, colonna di lookup, indice sostituito): la colonna resta il prefisso,
+# quindi i lookup per id continuano a usare l'indice
+_ROLE_PERIOD_INDEXES = [
+    ("idx_roles_function_period", "function_id", "idx_roles_function_id"),
+    ("idx_roles_person_period", "person_id", "idx_roles_person_id"),
+    ("idx_roles_manager_period", "manager_id", "idx_roles_manager_id"),
+]
+
+
+def _m005_role_periods(conn: sqlite3.Connection):
+    """Indici (id, fine periodo, inizio) per le letture "alla data" dei ruoli"""
+    for name, column, replaces in _ROLE_PERIOD_INDEXES:
+        _create_index(conn, name, "roles", f"{column}, {ROLE_PERIOD_END}, start_date",
+                      replaces=replaces)
+
+
+def _m006_role_history_indexes(conn: sqlite3.Connection):
+    """Indici dello storico ruoli: modifiche recenti, storico di un ruolo, archiviazione"""
+    _create_index(conn, "idx_role_history_change_date", "role_history", "change_date")
+    _create_index(conn, "idx_role_history_role_id", "role_history", "role_id, change_date")
+
+
+def _m007_single_write_triggers(conn: sqlite3.Connection):
+    """Un UPDATE di un ruolo = una scrittura di riga e (se cambia qualcosa) uno storico"""
+    for name, sql in _SINGLE_WRITE_TRIGGERS.items():
+        _replace_object(conn, "trigger", name, sql, only_if_exists=True)
+
+
+# ----------------------------------------------------------------
+# Storico delle funzioni e fotografie dell'organigramma (diff)
+# ----------------------------------------------------------------
+
+FUNCTION_HISTORY_SQL = """
+    CREATE TABLE function_history (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        function_id INTEGER NOT NULL,
+        function_name TEXT NOT NULL,
+        old_reports_to TEXT,
+        new_reports_to TEXT,
+        action TEXT CHECK (action IN ('INSERT', 'UPDATE', 'DELETE')),
+        change_date DATETIME DEFAULT CURRENT_TIMESTAMP
+    )"""
+
+# Spostamenti e non rinomine: la rinomina del padre riscrive reports_to dei
+# figli, ma il nuovo nome è ancora quello del padre di prima
+FUNCTION_HISTORY_TRIGGERS = {
+    "function_audit_insert": """
+        CREATE TRIGGER function_audit_insert
+            AFTER INSERT ON functions
+        BEGIN
+            INSERT INTO function_history (function_id, function_name, new_reports_to, action)
+            VALUES (NEW.id, NEW.name, NEW.reports_to, 'INSERT');
+        END""",
+    "function_audit_move": """
+        CREATE TRIGGER function_audit_move
+            AFTER UPDATE OF reports_to ON functions
+            WHEN NEW.reports_to IS NOT OLD.reports_to
+              AND NEW.reports_to IS NOT (SELECT name FROM functions WHERE id = OLD.parent_function_id)
+        BEGIN
+            INSERT INTO function_history (function_id, function_name, old_reports_to,
+                                          new_reports_to, action)
+            VALUES (NEW.id, NEW.name, OLD.reports_to, NEW.reports_to, 'UPDATE');
+        END""",
+    "function_audit_delete": """
+        CREATE TRIGGER function_audit_delete
+            AFTER DELETE ON functions
+        BEGIN
+            INSERT INTO function_history (function_id, function_name, old_reports_to, action)
+            VALUES (OLD.id, OLD.name, OLD.reports_to, 'DELETE');
+        END""",
+}
+
+# Fotografie con nome: funzioni e ruoli attivi, per id (chiave del merge)
+ORG_SNAPSHOT_SQL = [
+    """CREATE TABLE org_snapshots (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL UNIQUE,
+        taken_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        flags TEXT(25)
+    )""",
+    """CREATE TABLE org_snapshot_functions (
+        snapshot_id INTEGER NOT NULL REFERENCES org_snapshots(id) ON DELETE CASCADE,
+        function_id INTEGER NOT NULL,
+        function_name TEXT NOT NULL,
+        reports_to TEXT,
+        PRIMARY KEY (snapshot_id, function_id)
+    ) WITHOUT ROWID""",
+    """CREATE TABLE org_snapshot_roles (
+        snapshot_id INTEGER NOT NULL REFERENCES org_snapshots(id) ON DELETE CASCADE,
+        role_id INTEGER NOT NULL,
+        person_name TEXT NOT NULL,
+        function_name TEXT NOT NULL,
+        reports_to TEXT,
+        ad_interim BOOLEAN,
+        PRIMARY KEY (snapshot_id, role_id)
+    ) WITHOUT ROWID""",
+]
+
+
+def _m008_org_diff(conn: sqlite3.Connection):
+    """Storico spostamenti funzioni, fotografie con nome, indice sulle date di fine ruolo"""
+    if not _table_exists(conn, "functions"):
+        return
+    if not _table_exists(conn, "function_history"):
+        conn.execute(FUNCTION_HISTORY_SQL)
+        # Punto di partenza: ogni funzione esistente "nasce" alla sua creazione
+        conn.execute("""
+            INSERT INTO function_history (function_id, function_name, new_reports_to,
+                                          action, change_date)
+            SELECT id, name, reports_to, 'INSERT', COALESCE(created_at, CURRENT_TIMESTAMP)
+            FROM functions
+        """)
+    _create_index(conn, "idx_function_history_change_date", "function_history", "change_date")
+    for name, sql in FUNCTION_HISTORY_TRIGGERS.items():
+        _replace_object(conn, "trigger", name, sql)
+    if not _table_exists(conn, "org_snapshots"):
+        for sql in ORG_SNAPSHOT_SQL:
+            conn.execute(sql)
+    _create_index(conn, "idx_roles_end_date", "roles", "end_date", where="end_date IS NOT NULL")
+
+
+# (versione, descrizione, funzione): le versioni sono consecutive e non si riscrivono
+MIGRATIONS: List[Tuple[int, str, Callable[[sqlite3.Connection], None]]] = [
+    (1, "indici keyset per le liste", _m001_keyset_indexes),
+    (2, "chiavi surrogate intere e viste sugli id", _m002_surrogate_keys),
+    (3, "indice di ricerca full-text", _m003_search_index),
+    (4, "closure table della gerarchia funzioni", _m004_function_closure),
+    (5, "indici per la validità dei ruoli alla data", _m005_role_periods),
+    (6, "indici dello storico ruoli", _m006_role_history_indexes),
+    (7, "trigger di timestamp e storico senza scritture doppie", _m007_single_write_triggers),
+    (8, "storico funzioni e fotografie per il diff dell'organigramma", _m008_org_diff),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def apply_migrations(db_path: str, busy_timeout: float = 5.0) -> int:
+    """Applica le migrazioni mancanti e restituisce la versione dello schema.
+
+    Ogni migrazione gira in una transazione insieme all'aggiornamento di
+    user_version: un'interruzione non lascia mai lo schema a metà.
+    """
+    conn = sqlite3.connect(db_path, timeout=busy_timeout, isolation_level=None)
+    try:
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        for number, description, migrate in MIGRATIONS:
+            if number <= version:
+                continue
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Un altro processo potrebbe averla già applicata
+                current = conn.execute("PRAGMA user_version").fetchone()[0]
+                if number > current:
+                    migrate(conn)
+                    conn.execute(f"PRAGMA user_version = {number}")
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            logging.info(f"Migrazione {number} applicata: {description}")
+            version = number
+        return version
+    finally:
+        conn.close()
@@ -1,26 +1,74 @@
-from dataclasses import dataclass
-from typing import Optional, List
+from dataclasses import dataclass, fields
+from typing import Any, ClassVar, Dict, Optional, List, Tuple
 from datetime import datetime, date
 
-@dataclass
-class Function:
+
+class RowModel:
+    """Base dei modelli: costruzione posizionale dalle righe SQLite"""
+    __slots__ = ()
+    # Nomi dei campi nell'ordine delle colonne da selezionare
+    COLUMNS: ClassVar[Tuple[str, ...]] = ()
+
+    @classmethod
+    def from_row(cls, cursor, row):
+        """row_factory sqlite3: crea il modello direttamente dalla tupla"""
+        return cls(*row)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {name: getattr(self, name) for name in self.COLUMNS}
+
+
+def model(cls):
+    """Dataclass con __slots__ (niente __dict__ per istanza) e COLUMNS.
+
+    Equivale a dataclass(slots=True), disponibile solo da Python 3.10.
+    """
+    cls = dataclass(cls)
+    names = tuple(f.name for f in fields(cls))
+    namespace = {
+        key: value for key, value in cls.__dict__.items()
+        if key not in names and key not in ('__dict__', '__weakref__')
+    }
+    namespace['__slots__'] = names
+    namespace['COLUMNS'] = names
+    return type(cls)(cls.__name__, cls.__bases__, namespace)
+
+
+@model
+class Function(RowModel):
     id: Optional[int] = None
     name: str = ""
     reports_to: Optional[str] = None
     flags: Optional[str] = None
     created_at: Optional[datetime] = None
     updated_at: Optional[datetime] = None
+    parent_function_id: Optional[int] = None
+    level: Optional[int] = None
+    path: Optional[str] = None
 
-@dataclass
-class FunctionTreeNode:
+@model
+class FunctionTreeNode(RowModel):
     id: int
     function_name: str
     reports_to: Optional[str] = None
     level: Optional[int] = None
     path: Optional[str] = None
 
-@dataclass
-class JobTitle:
+@model
+class FunctionRollup(RowModel):
+    """Headcount, FTE e interim della funzione (diretti e con le sotto-funzioni)"""
+    function_id: int
+    function_name: str
+    level: Optional[int] = None
+    headcount: int = 0
+    fte: float = 0.0
+    interim: int = 0
+    total_headcount: int = 0
+    total_fte: float = 0.0
+    total_interim: int = 0
+
+@model
+class JobTitle(RowModel):
     id: Optional[int] = None
     name: str = ""
     level: Optional[int] = None
@@ -28,8 +76,8 @@ class JobTitle:
     created_at: Optional[datetime] = None
     updated_at: Optional[datetime] = None
 
-@dataclass
-class Person:
+@model
+class Person(RowModel):
     id: Optional[int] = None
     name: str = ""
     email: Optional[str] = None
@@ -40,8 +88,8 @@ class Person:
     created_at: Optional[datetime] = None
     updated_at: Optional[datetime] = None
 
-@dataclass
-class Role:
+@model
+class Role(RowModel):
     id: Optional[int] = None
     person_name: str = ""
     function_name: str = ""
@@ -55,9 +103,18 @@ class Role:
     flags: Optional[str] = None
     created_at: Optional[datetime] = None
     updated_at: Optional[datetime] = None
+    person_id: Optional[int] = None
+    function_id: Optional[int] = None
+    manager_id: Optional[int] = None
 
-@dataclass
-class OrgChartNode:
+    @classmethod
+    def from_row(cls, cursor, row):
+        role = cls(*row)
+        role.ad_interim = bool(role.ad_interim)
+        return role
+
+@model
+class OrgChartNode(RowModel):
     function_name: str
     level: int
     path: str
@@ -66,4 +123,21 @@ class OrgChartNode:
     organizational_unit: Optional[str] = None
     ad_interim: bool = False
     reports_to: Optional[str] = None
-    person_reports_to: Optional[str] = None
\ No newline at end of file
+    person_reports_to: Optional[str] = None
+
+@model
+class SearchHit(RowModel):
+    kind: str
+    id: int
+    name: str
+    detail: Optional[str] = None
+
+@model
+class OrgChange(RowModel):
+    """Differenza fra due date o fotografie dell'organigramma"""
+    kind: str
+    function_name: str
+    person_name: Optional[str] = None
+    role_id: Optional[int] = None
+    old_value: Any = None
+    new_value: Any = None
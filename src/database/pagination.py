@@ -0,0 +1,158 @@
+# src/database/pagination.py - Paginazione keyset (cursore) per le liste
+import base64
+import binascii
+import json
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+
+class PaginationError(ValueError):
+    """Parametri di paginazione non validi (cursore o ordinamento)"""
+    pass
+
+
+@dataclass
+class Page:
+    """Una pagina di risultati e il cursore per la successiva"""
+    items: List[Any] = field(default_factory=list)
+    next_cursor: Optional[str] = None
+    limit: int = DEFAULT_PAGE_SIZE
+    sort: str = ""
+    descending: bool = False
+
+    @property
+    def has_more(self) -> bool:
+        return self.next_cursor is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+
+@dataclass(frozen=True)
+class SortSpec:
+    """Ordinamento stabile: colonne indicizzate terminate da una chiave univoca"""
+    columns: Tuple[str, ...]
+    nullable: Tuple[str, ...] = ()
+
+    def expressions(self) -> List[str]:
+        """Espressioni SQL delle colonne (NULL normalizzato per il confronto)"""
+        return [
+            f"IFNULL({col}, '')" if col in self.nullable else col
+            for col in self.columns
+        ]
+
+    def key_of(self, item: Any) -> List[Any]:
+        """Valori di ordinamento di una riga (oggetto modello o dict)"""
+        values = []
+        for col in self.columns:
+            value = item[col] if isinstance(item, dict) else getattr(item, col)
+            if value is None and col in self.nullable:
+                value = ''
+            values.append(value)
+        return values
+
+
+def clamp_limit(limit: Optional[int]) -> int:
+    """Limita la dimensione pagina all'intervallo ammesso"""
+    if not limit or limit < 1:
+        return DEFAULT_PAGE_SIZE
+    return min(limit, MAX_PAGE_SIZE)
+
+
+def encode_cursor(sort: str, descending: bool, values: Sequence[Any]) -> str:
+    """Codifica il cursore (ordinamento + chiave dell'ultima riga) in base64 URL-safe"""
+    payload = json.dumps({"s": sort, "d": int(descending), "k": list(values)},
+                         separators=(',', ':'), default=str)
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str, sort: str, descending: bool, size: int) -> List[Any]:
+    """Decodifica il cursore verificando che corrisponda all'ordinamento richiesto"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        values = payload["k"]
+        cursor_sort = payload["s"]
+        cursor_desc = bool(payload["d"])
+    except (binascii.Error, UnicodeError, ValueError, KeyError, TypeError):
+        raise PaginationError("Cursore non valido")
+    if cursor_sort != sort or cursor_desc != descending:
+        raise PaginationError("Cursore generato con un ordinamento diverso")
+    if not isinstance(values, list) or len(values) != size:
+        raise PaginationError("Cursore non valido")
+    # Solo valori che SQLite può confrontare con le colonne di ordinamento
+    if not all(value is None or isinstance(value, (str, int, float)) for value in values):
+        raise PaginationError("Cursore non valido")
+    return values
+
+
+def keyset_query(base_query: str, where: List[str], params: List[Any],
+                 spec: SortSpec, sort: str, descending: bool,
+                 cursor: Optional[str], limit: int) -> Tuple[str, List[Any]]:
+    """Compone la query paginata: filtri, condizione keyset, ORDER BY e LIMIT.
+
+    La condizione sul cursore usa il confronto tra row value, che SQLite
+    risolve con una ricerca sull'indice: il costo per pagina non dipende
+    dalla posizione nella tabella (a differenza di OFFSET).
+    """
+    where = list(where)
+    params = list(params)
+    expressions = spec.expressions()
+
+    if cursor:
+        values = decode_cursor(cursor, sort, descending, len(expressions))
+        placeholders = ", ".join("?" for _ in values)
+        op = "<" if descending else ">"
+        where.append(f"({', '.join(expressions)}) {op} ({placeholders})")
+        params.extend(values)
+
+    query = base_query
+    if where:
+        query += " WHERE " + " AND ".join(where)
+    direction = " DESC" if descending else ""
+    query += " ORDER BY " + ", ".join(f"{expr}{direction}" for expr in expressions)
+    # Una riga in più indica se esiste la pagina successiva
+    query += " LIMIT ?"
+    params.append(limit + 1)
+    return query, params
+
+
+def build_page(items: List[Any], spec: SortSpec, sort: str, descending: bool,
+               limit: int) -> Page:
+    """Taglia la riga di controllo e calcola il cursore della pagina successiva"""
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        next_cursor = encode_cursor(sort, descending, spec.key_of(items[-1]))
+    return Page(items=items, next_cursor=next_cursor, limit=limit,
+                sort=sort, descending=descending)
+
+
+def resolve_sort(sorts: Dict[str, SortSpec], sort: Optional[str], default: str) -> Tuple[str, SortSpec]:
+    """Ordinamento richiesto (o quello di default) tra quelli ammessi"""
+    sort = sort or default
+    if sort not in sorts:
+        raise PaginationError(
+            f"Ordinamento non supportato: {sort} (ammessi: {', '.join(sorts)})"
+        )
+    return sort, sorts[sort]
+
+
+def filter_clauses(filters: Iterable[Tuple[str, Any]]) -> Tuple[List[str], List[Any]]:
+    """Clausole di uguaglianza per i filtri valorizzati.
+
+    Una condizione che contiene già il segnaposto viene usata così com'è.
+    """
+    where, params = [], []
+    for column, value in filters:
+        if value is None:
+            continue
+        where.append(column if '?' in column else f"{column} = ?")
+        params.append(value)
+    return where, params
@@ -0,0 +1,214 @@
+# src/database/pool.py - Pool di connessioni SQLite riutilizzabili
+import sqlite3
+import threading
+import time
+import logging
+from contextlib import contextmanager
+from typing import Dict, Generator, List, Optional, Tuple
+
+
+class PoolTimeoutError(Exception):
+    """Nessuna connessione disponibile entro il timeout richiesto"""
+    pass
+
+
+class ConnectionPool:
+    """Pool limitato di connessioni SQLite.
+
+    Le connessioni vengono create una sola volta (con i PRAGMA configurati)
+    e riutilizzate tra le chiamate. Il pool è thread-aware: un thread che
+    richiede una connessione mentre ne possiede già una riceve la stessa,
+    così le chiamate annidate non consumano slot e non vanno in deadlock.
+    """
+
+    def __init__(self, db_path: str, max_size: int = 8,
+                 max_idle_time: float = 300.0,
+                 health_check_interval: float = 30.0,
+                 acquire_timeout: float = 30.0,
+                 pragmas: Optional[Dict[str, object]] = None,
+                 connect_kwargs: Optional[Dict[str, object]] = None):
+        if max_size < 1:
+            raise ValueError("max_size deve essere almeno 1")
+        self.db_path = db_path
+        self.max_size = max_size
+        self.max_idle_time = max_idle_time
+        self.health_check_interval = health_check_interval
+        self.acquire_timeout = acquire_timeout
+        self.pragmas = dict(pragmas or {})
+        self.connect_kwargs = dict(connect_kwargs or {})
+
+        self._cond = threading.Condition(threading.Lock())
+        self._idle: List[Tuple[sqlite3.Connection, float]] = []  # (conn, last_used)
+        self._size = 0
+        self._closed = False
+        self._local = threading.local()
+        self._owners: Dict[int, sqlite3.Connection] = {}  # thread id -> connessione in uso
+        self._created = 0
+        self._reused = 0
+        self._discarded = 0
+
+    # ================================================================
+    # CICLO DI VITA CONNESSIONI
+    # ================================================================
+
+    def _connect(self) -> sqlite3.Connection:
+        """Apre una nuova connessione e applica i PRAGMA una sola volta"""
+        conn = sqlite3.connect(self.db_path, check_same_thread=False,
+                               **self.connect_kwargs)  # type: ignore[arg-type]
+        conn.row_factory = sqlite3.Row
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name} = {value}")
+        self._created += 1
+        return conn
+
+    def _is_healthy(self, conn: sqlite3.Connection) -> bool:
+        """Verifica che la connessione sia ancora utilizzabile"""
+        try:
+            conn.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def _discard(self, conn: sqlite3.Connection):
+        """Chiude una connessione e libera il suo slot (chiamare con lock)"""
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+        self._size -= 1
+        self._discarded += 1
+        self._cond.notify()
+
+    def _evict_idle(self, now: float):
+        """Chiude le connessioni inattive oltre max_idle_time (chiamare con lock)"""
+        keep = []
+        for conn, last_used in self._idle:
+            if now - last_used > self.max_idle_time:
+                self._discard(conn)
+            else:
+                keep.append((conn, last_used))
+        self._idle = keep
+
+    def acquire(self, timeout: Optional[float] = None) -> sqlite3.Connection:
+        """Preleva una connessione dal pool (o ne crea una nuova se c'è spazio)"""
+        timeout = self.acquire_timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise RuntimeError("Pool di connessioni chiuso")
+
+                now = time.monotonic()
+                self._evict_idle(now)
+
+                # LIFO: la connessione usata più di recente ha la cache più calda
+                while self._idle:
+                    conn, last_used = self._idle.pop()
+                    if (now - last_used > self.health_check_interval
+                            and not self._is_healthy(conn)):
+                        self._discard(conn)
+                        continue
+                    self._reused += 1
+                    return conn
+
+                if self._size < self.max_size:
+                    self._size += 1
+                    break
+
+                remaining = deadline - now
+                if remaining <= 0 or not self._cond.wait(remaining):
+                    raise PoolTimeoutError(
+                        f"Nessuna connessione disponibile dopo {timeout:.1f}s "
+                        f"(max_size={self.max_size})"
+                    )
+
+        # Apertura fuori dal lock: lo slot è già riservato
+        try:
+            return self._connect()
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+
+    def release(self, conn: sqlite3.Connection):
+        """Restituisce una connessione al pool"""
+        with self._cond:
+            if self._closed:
+                self._discard(conn)
+                return
+            try:
+                # Una transazione lasciata aperta non deve arrivare al prossimo utente
+                if conn.in_transaction:
+                    conn.rollback()
+            except sqlite3.Error as e:
+                logging.warning(f"Connessione scartata al rilascio: {e}")
+                self._discard(conn)
+                return
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self) -> Generator[sqlite3.Connection, None, None]:
+        """Connessione del thread corrente (riutilizzata se già presente)"""
+        local = self._local
+        conn = getattr(local, 'conn', None)
+        if conn is not None:
+            local.depth += 1
+            try:
+                yield conn
+            finally:
+                local.depth -= 1
+            return
+
+        conn = self.acquire()
+        thread_id = threading.get_ident()
+        local.conn = conn
+        local.depth = 1
+        self._owners[thread_id] = conn
+        try:
+            yield conn
+        finally:
+            self._owners.pop(thread_id, None)
+            local.conn = None
+            local.depth = 0
+            self.release(conn)
+
+    def current_depth(self) -> int:
+        """Livello di annidamento della connessione del thread corrente"""
+        return getattr(self._local, 'depth', 0)
+
+    def interrupt(self, thread_id: int) -> bool:
+        """Interrompe la query in corso sulla connessione usata da un thread.
+
+        sqlite3.Connection.interrupt() è sicuro da chiamare da un altro thread:
+        lo statement in esecuzione termina con OperationalError('interrupted').
+        """
+        conn = self._owners.get(thread_id)
+        if conn is None:
+            return False
+        conn.interrupt()
+        return True
+
+    def close_all(self):
+        """Chiude tutte le connessioni inattive e impedisce nuove acquisizioni"""
+        with self._cond:
+            self._closed = True
+            while self._idle:
+                conn, _ = self._idle.pop()
+                self._discard(conn)
+            self._cond.notify_all()
+
+    def stats(self) -> Dict[str, int]:
+        """Statistiche di utilizzo del pool"""
+        with self._cond:
+            return {
+                'max_size': self.max_size,
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': self._size - len(self._idle),
+                'created': self._created,
+                'reused': self._reused,
+                'discarded': self._discarded,
+            }
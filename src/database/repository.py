@@ -1,70 +1,269 @@
-from typing import List, Optional, Dict, Tuple
+import re
+from typing import Any, Iterable, List, Optional, Dict, Tuple, Union
 from datetime import datetime, date
 from .connection import DatabaseConnection
-from .models import Function, FunctionTreeNode, JobTitle, Person, Role, OrgChartNode
+from .migrations import ROLE_PERIOD_END, SEARCH_KINDS
+from .models import Function, FunctionRollup, FunctionTreeNode, JobTitle, Person, Role, OrgChartNode, SearchHit
+from .pagination import (Page, SortSpec, build_page, clamp_limit, filter_clauses,
+                         keyset_query, resolve_sort)
+
+# Modalità di lettura per le letture massive
+READ_MODES = ('model', 'tuple', 'columnar')
+
+# Risultato di una lettura: modelli, tuple grezze o colonne {nome: valori}
+ReadResult = Union[List[Any], Dict[str, Tuple]]
+
+
+def select_list(model_cls, alias: Optional[str] = None) -> str:
+    """Colonne da selezionare, nell'ordine dei campi del modello"""
+    prefix = f"{alias}." if alias else ""
+    return ", ".join(f"{prefix}{name}" for name in model_cls.COLUMNS)
+
+
+FUNCTION_COLUMNS = select_list(Function)
+JOB_TITLE_COLUMNS = select_list(JobTitle)
+PERSON_COLUMNS = select_list(Person)
+ROLE_COLUMNS = select_list(Role)
+
+# I riferimenti per nome restano l'API pubblica: il repository li risolve
+# sugli id interi, su cui lavorano join e indici
+PERSON_ID_OF = "(SELECT id FROM persons WHERE name = ?)"
+FUNCTION_ID_OF = "(SELECT id FROM functions WHERE name = ?)"
+
+# Statement condivisi con le operazioni batch (services/batch_operations)
+PERSON_INSERT = """
+INSERT INTO persons (name, email, employee_id, hire_date, status, flags)
+VALUES (?, ?, ?, ?, ?, ?)
+"""
+
+PERSON_ALIAS_INSERT = """
+INSERT OR IGNORE INTO person_aliases (person_name, alias, person_id)
+VALUES (?1, ?2, (SELECT id FROM persons WHERE name = ?1))
+"""
+
+FUNCTION_INSERT = """
+INSERT INTO functions (name, reports_to, flags, parent_function_id)
+VALUES (?1, ?2, ?3, (SELECT id FROM functions WHERE name = ?2))
+"""
+
+JOB_TITLE_INSERT = """
+INSERT INTO job_titles (name, level, flags)
+VALUES (?, ?, ?)
+"""
+
+ROLE_END = """
+UPDATE roles 
+SET end_date = ?, updated_at = CURRENT_TIMESTAMP
+WHERE id = ? AND end_date IS NULL
+"""
+
+ROLE_INSERT = """
+INSERT INTO roles (person_name, function_name, organizational_unit,
+                   job_title_name, percentage, ad_interim, reports_to,
+                   start_date, flags, person_id, function_id, manager_id)
+VALUES (?1, ?2, ?3, ?4, ?5, ?6, ?7, ?8, ?9,
+        (SELECT id FROM persons WHERE name = ?1),
+        (SELECT id FROM functions WHERE name = ?2),
+        (SELECT id FROM persons WHERE name = ?7))
+"""
+
+
+def role_period_clause(alias: str = "") -> str:
+    """Condizione "ruolo valido alla data": inizio <= data < fine.
+
+    Usa due segnaposto, entrambi per la data (vedi period_params).
+    """
+    prefix = f"{alias}." if alias else ""
+    end = ROLE_PERIOD_END.replace("end_date", f"{prefix}end_date")
+    return f"{end} > ? AND ({prefix}start_date IS NULL OR {prefix}start_date <= ?)"
+
+
+def period_params(as_of: date) -> Tuple[str, str]:
+    """Parametri di role_period_clause (date ISO, confrontabili come testo)"""
+    day = as_of.isoformat()
+    return day, day
+
+
+def fts_match_query(text: str) -> Optional[str]:
+    """Espressione MATCH FTS5: ogni parola come prefisso, tutte richieste"""
+    terms = re.findall(r"\w+", text)
+    if not terms:
+        return None
+    # Fra virgolette le parole non vengono lette come operatori (AND, NEAR, ...)
+    return " ".join(f'"{term}"*' for term in terms)
+
 
 class OrganigrammaRepository:
+    # Ordinamenti ammessi per le liste paginate (ognuno coperto da un indice)
+    PERSON_SORTS = {
+        'name': SortSpec(('name',)),
+        'id': SortSpec(('id',)),
+    }
+    FUNCTION_SORTS = {
+        'name': SortSpec(('name',)),
+        'id': SortSpec(('id',)),
+    }
+    JOB_TITLE_SORTS = {
+        'level': SortSpec(('level', 'name'), nullable=('level',)),
+        'name': SortSpec(('name',)),
+    }
+    ROLE_SORTS = {
+        'person': SortSpec(('person_name', 'function_name', 'id')),
+        'function': SortSpec(('function_name', 'id')),
+        'id': SortSpec(('id',)),
+    }
+    
     def __init__(self, db_connection: DatabaseConnection):
         self.db = db_connection
+        self._search_index: Optional[bool] = None
+    
+    def unit_of_work(self):
+        """Transazione a cui i metodi del repository si uniscono (un solo commit)"""
+        return self.db.transaction()
+    
+    def _list_page(self, base_query: str, where: List[str], params: List,
+                   sorts: Dict[str, SortSpec], sort: Optional[str], default_sort: str,
+                   descending: bool, cursor: Optional[str], limit: Optional[int],
+                   factory) -> Page:
+        """Esegue una lista paginata a cursore (keyset)"""
+        sort, spec = resolve_sort(sorts, sort, default_sort)
+        limit = clamp_limit(limit)
+        query, params = keyset_query(base_query, where, params, spec, sort,
+                                     descending, cursor, limit)
+        items = self._fetch(query, params, factory)
+        return build_page(items, spec, sort, descending, limit)
+    
+    # ================================================================
+    # MAPPING RIGHE
+    # ================================================================
     
-    def _dict_to_role(self, row_dict):
-        """Converte dizionario da row database in oggetto Role"""
-        return Role(
-            id=row_dict.get('id'),
-            person_name=row_dict.get('person_name', ''),
-            function_name=row_dict.get('function_name', ''),
-            organizational_unit=row_dict.get('organizational_unit'),
-            job_title_name=row_dict.get('job_title_name'),
-            percentage=row_dict.get('percentage', 1.0),
-            ad_interim=bool(row_dict.get('ad_interim', False)),
-            reports_to=row_dict.get('reports_to'),
-            start_date=row_dict.get('start_date'),
-            end_date=row_dict.get('end_date'),
-            flags=row_dict.get('flags'),
-            created_at=row_dict.get('created_at'),
-            updated_at=row_dict.get('updated_at')
-        )
+    def _fetch(self, query: str, params=(), row_factory=None) -> List[Any]:
+        """SELECT con row_factory sul cursore (None = tuple grezze, senza sqlite3.Row)"""
+        with self.db.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = row_factory
+            return cursor.execute(query, params).fetchall()
+    
+    def _fetch_one(self, query: str, params, model_cls):
+        """Primo modello del risultato (o None)"""
+        with self.db.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = model_cls.from_row
+            return cursor.execute(query, params).fetchone()
+    
+    def _read(self, query: str, params, model_cls, mode: str = 'model') -> ReadResult:
+        """Lettura massiva come modelli, tuple o colonne"""
+        if mode == 'model':
+            return self._fetch(query, params, model_cls.from_row)
+        if mode not in READ_MODES:
+            raise ValueError(f"Modalità di lettura non valida: {mode} (ammesse: {', '.join(READ_MODES)})")
+        rows = self._fetch(query, params)
+        if mode == 'tuple':
+            return rows
+        if not rows:
+            return {name: () for name in model_cls.COLUMNS}
+        return dict(zip(model_cls.COLUMNS, zip(*rows)))
     
     # ================================================================
     # FUNCTIONS - CRUD COMPLETO
     # ================================================================
     
-    def get_all_functions(self) -> List[Function]:
+    def get_all_functions(self, mode: str = 'model') -> ReadResult:
         """Recupera tutte le funzioni"""
-        query = "SELECT * FROM functions ORDER BY name"
-        rows = self.db.execute_query(query)
-        return [Function(**dict(row)) for row in rows]
+        query = f"SELECT {FUNCTION_COLUMNS} FROM functions ORDER BY name"
+        return self._read(query, (), Function, mode)
+    
+    def list_functions(self, reports_to: Optional[str] = None,
+                       limit: Optional[int] = None, cursor: Optional[str] = None,
+                       sort: Optional[str] = None, descending: bool = False) -> Page:
+        """Pagina di funzioni (filtro per funzione padre)"""
+        where, params = filter_clauses([('reports_to', reports_to)])
+        return self._list_page(f"SELECT {FUNCTION_COLUMNS} FROM functions", where, params,
+                               self.FUNCTION_SORTS, sort, 'name', descending,
+                               cursor, limit, Function.from_row)
     
     def get_function_tree(self) -> List[FunctionTreeNode]:
         """Recupera funzioni in formato ad albero"""
+        query = f"""
+        SELECT {select_list(FunctionTreeNode)} FROM function_chart ORDER BY level, function_name
+        """
+        return self._fetch(query, (), FunctionTreeNode.from_row)
+    
+    # Gerarchia: ricerche sull'indice della closure table, niente ricorsione
+    
+    def get_function_ancestors(self, name: str) -> List[Function]:
+        """Antenati di una funzione, dalla radice al padre diretto"""
+        query = f"""
+        SELECT {select_list(Function, 'a')} FROM functions f
+        JOIN function_closure c ON c.descendant_id = f.id AND c.depth > 0
+        JOIN functions a ON a.id = c.ancestor_id
+        WHERE f.name = ?
+        ORDER BY c.depth DESC
+        """
+        return self._fetch(query, (name,), Function.from_row)
+    
+    def get_function_subtree(self, name: str, max_depth: Optional[int] = None,
+                             include_self: bool = True) -> List[FunctionTreeNode]:
+        """Sottoalbero di una funzione in ordine di visita (per percorso)"""
+        query = f"""
+        SELECT {select_list(FunctionTreeNode, 'fc')} FROM functions f
+        JOIN function_closure c ON c.ancestor_id = f.id
+        JOIN function_chart fc ON fc.id = c.descendant_id
+        WHERE f.name = ? AND c.depth >= ?
+        """
+        params: List[Any] = [name, 0 if include_self else 1]
+        if max_depth is not None:
+            query += " AND c.depth <= ?"
+            params.append(max_depth)
+        query += " ORDER BY fc.path"
+        return self._fetch(query, params, FunctionTreeNode.from_row)
+    
+    def is_function_descendant(self, ancestor: str, descendant: str) -> bool:
+        """True se `descendant` è nel sottoalbero di `ancestor` (o è la stessa funzione)"""
         query = """
-        SELECT * FROM function_chart ORDER BY level, function_name
+        SELECT 1 FROM function_closure
+        WHERE ancestor_id = (SELECT id FROM functions WHERE name = ?)
+          AND descendant_id = (SELECT id FROM functions WHERE name = ?)
         """
-        rows = self.db.execute_query(query)
-        return [FunctionTreeNode(**dict(row)) for row in rows]
+        return bool(self._fetch(query, (ancestor, descendant)))
+    
+    def get_function_rollups(self, names: Optional[Iterable[str]] = None) -> List[FunctionRollup]:
+        """Headcount (persone distinte), FTE e interim, diretti e sull'intero sottoalbero"""
+        params = tuple(names) if names is not None else ()
+        where = f"WHERE f.name IN ({', '.join('?' for _ in params)})" if names is not None else ""
+        query = f"""
+        SELECT f.id, f.name, f.level,
+               COUNT(DISTINCT CASE WHEN c.depth = 0 THEN ar.person_id END),
+               ROUND(TOTAL(CASE WHEN c.depth = 0 THEN ar.percentage END), 2),
+               COUNT(CASE WHEN c.depth = 0 AND ar.ad_interim THEN 1 END),
+               COUNT(DISTINCT ar.person_id),
+               ROUND(TOTAL(ar.percentage), 2),
+               COUNT(CASE WHEN ar.ad_interim THEN 1 END)
+        FROM functions f
+        JOIN function_closure c ON c.ancestor_id = f.id
+        LEFT JOIN active_roles ar ON ar.function_id = c.descendant_id
+        {where}
+        GROUP BY f.id
+        ORDER BY f.level, f.name
+        """
+        return self._fetch(query, params, FunctionRollup.from_row)
     
     def get_function(self, name: str) -> Optional[Function]:
         """Recupera singola funzione per nome"""
-        query = "SELECT * FROM functions WHERE name = ?"
-        rows = self.db.execute_query(query, (name,))
-        return Function(**dict(rows[0])) if rows else None
+        query = f"SELECT {FUNCTION_COLUMNS} FROM functions WHERE name = ?"
+        return self._fetch_one(query, (name,), Function)
     
     def get_function_by_id(self, function_id: int) -> Optional[Function]:
         """Recupera singola funzione per ID"""
-        query = "SELECT * FROM functions WHERE id = ?"
-        rows = self.db.execute_query(query, (function_id,))
-        return Function(**dict(rows[0])) if rows else None
+        query = f"SELECT {FUNCTION_COLUMNS} FROM functions WHERE id = ?"
+        return self._fetch_one(query, (function_id,), Function)
     
     def create_function(self, function: Function) -> int:
         """Crea nuova funzione"""
-        query = """
-        INSERT INTO functions (name, reports_to, flags)
-        VALUES (?, ?, ?)
-        """
-        with self.db.get_connection() as conn:
+        with self.db.transaction() as conn:
             cursor = conn.cursor()
-            cursor.execute(query, (function.name, function.reports_to, function.flags))
-            conn.commit()
+            cursor.execute(FUNCTION_INSERT, (function.name, function.reports_to, function.flags))
+            self.db.notify_change('functions', [function.name])
             return cursor.lastrowid # type: ignore
     
     def update_function(self, name: str, function: Function) -> bool:
@@ -74,89 +273,121 @@ class OrganigrammaRepository:
         SET reports_to = ?, flags = ?, updated_at = CURRENT_TIMESTAMP
         WHERE name = ?
         """
-        with self.db.get_connection() as conn:
+        with self.db.transaction() as conn:
             cursor = conn.cursor()
             cursor.execute(query, (function.reports_to, function.flags, name))
-            conn.commit()
+            self.db.notify_change('functions', [name])
             return cursor.rowcount > 0
     
+    def get_function_parents(self) -> Dict[str, Optional[str]]:
+        """Mappa funzione -> funzione a cui riporta (una sola query)"""
+        return dict(self._fetch("SELECT name, reports_to FROM functions"))
+    
+    def move_functions(self, moves: List[Tuple[str, Optional[str]]]) -> int:
+        """Applica gli spostamenti (funzione, nuovo padre) nell'ordine dato"""
+        query = """
+        UPDATE functions
+        SET reports_to = ?, updated_at = CURRENT_TIMESTAMP
+        WHERE name = ?
+        """
+        with self.db.transaction() as conn:
+            cursor = conn.cursor()
+            cursor.executemany(query, [(parent, name) for name, parent in moves])
+            self.db.notify_change('functions', [name for name, _ in moves])
+            return cursor.rowcount
+    
     def delete_function(self, name: str) -> bool:
         """Elimina funzione (solo se non ha dipendenze)"""
-        # Verifica dipendenze
-        deps = self.get_function_dependencies(name)
-        if deps['has_dependencies']:
-            return False
-        
         query = "DELETE FROM functions WHERE name = ?"
-        with self.db.get_connection() as conn:
+        with self.db.transaction() as conn:
+            # Verifica dipendenze
+            deps = self.get_function_dependencies(name)
+            if deps['has_dependencies']:
+                return False
+            
             cursor = conn.cursor()
             cursor.execute(query, (name,))
-            conn.commit()
+            # I ruoli terminati della funzione vengono eliminati in cascata
+            self.db.notify_change('functions', [name])
+            self.db.notify_change('roles')
             return cursor.rowcount > 0
     
     def get_function_dependencies(self, name: str) -> Dict:
         """Verifica dipendenze di una funzione"""
-        with self.db.get_connection() as conn:
-            cursor = conn.cursor()
-            
-            # Funzioni che riportano a questa
-            cursor.execute("SELECT COUNT(*) as count FROM functions WHERE reports_to = ?", (name,))
-            sub_functions = cursor.fetchone()['count']
-            
-            # Ruoli in questa funzione
-            cursor.execute("SELECT COUNT(*) as count FROM roles WHERE function_name = ? AND end_date IS NULL", (name,))
-            active_roles = cursor.fetchone()['count']
-            
-            return {
+        deps = self.get_functions_dependencies([name])
+        return deps.get(name) or {'has_dependencies': False, 'sub_functions': 0, 'active_roles': 0}
+    
+    def get_functions_dependencies(self, names: Optional[Iterable[str]] = None) -> Dict[str, Dict]:
+        """Dipendenze di più funzioni (tutte se names è None) in una sola query.
+        
+        Sotto-funzioni e ruoli attivi si contano sugli indici per id, senza
+        una connessione e due COUNT per ogni funzione.
+        """
+        params = tuple(names) if names is not None else ()
+        query = """
+        SELECT f.name,
+               (SELECT COUNT(*) FROM functions c
+                WHERE c.parent_function_id = f.id) AS sub_functions,
+               (SELECT COUNT(*) FROM roles r
+                WHERE r.function_id = f.id AND r.end_date IS NULL) AS active_roles
+        FROM functions f
+        """
+        if names is not None:
+            query += f" WHERE f.name IN ({', '.join('?' for _ in params)})"
+        return {
+            name: {
                 'has_dependencies': sub_functions > 0 or active_roles > 0,
                 'sub_functions': sub_functions,
                 'active_roles': active_roles
             }
+            for name, sub_functions, active_roles in self._fetch(query, params)
+        }
     
     # ================================================================
     # PERSONS - CRUD COMPLETO
     # ================================================================
     
-    def get_all_persons(self, active_only: bool = True) -> List[Person]:
+    def get_all_persons(self, active_only: bool = True, mode: str = 'model') -> ReadResult:
         """Recupera tutti i dipendenti"""
-        query = "SELECT * FROM persons"
+        query = f"SELECT {PERSON_COLUMNS} FROM persons"
         if active_only:
             query += " WHERE status = 'ACTIVE'"
         query += " ORDER BY name"
-        rows = self.db.execute_query(query)
-        return [Person(**dict(row)) for row in rows]
+        return self._read(query, (), Person, mode)
+    
+    def list_persons(self, status: Optional[str] = None,
+                     limit: Optional[int] = None, cursor: Optional[str] = None,
+                     sort: Optional[str] = None, descending: bool = False) -> Page:
+        """Pagina di dipendenti (filtro per stato)"""
+        where, params = filter_clauses([('status', status)])
+        return self._list_page(f"SELECT {PERSON_COLUMNS} FROM persons", where, params,
+                               self.PERSON_SORTS, sort, 'name', descending,
+                               cursor, limit, Person.from_row)
     
     def get_person(self, name: str) -> Optional[Person]:
         """Recupera singolo dipendente per nome"""
-        query = "SELECT * FROM persons WHERE name = ?"
-        rows = self.db.execute_query(query, (name,))
-        return Person(**dict(rows[0])) if rows else None
+        query = f"SELECT {PERSON_COLUMNS} FROM persons WHERE name = ?"
+        return self._fetch_one(query, (name,), Person)
     
     def get_person_by_id(self, person_id: int) -> Optional[Person]:
         """Recupera singolo dipendente per ID"""
-        query = "SELECT * FROM persons WHERE id = ?"
-        rows = self.db.execute_query(query, (person_id,))
-        return Person(**dict(rows[0])) if rows else None
+        query = f"SELECT {PERSON_COLUMNS} FROM persons WHERE id = ?"
+        return self._fetch_one(query, (person_id,), Person)
     
     def get_person_by_employee_id(self, employee_id: str) -> Optional[Person]:
         """Recupera dipendente per Employee ID"""
-        query = "SELECT * FROM persons WHERE employee_id = ?"
-        rows = self.db.execute_query(query, (employee_id,))
-        return Person(**dict(rows[0])) if rows else None
+        query = f"SELECT {PERSON_COLUMNS} FROM persons WHERE employee_id = ?"
+        return self._fetch_one(query, (employee_id,), Person)
     
     def create_person(self, person: Person) -> int:
         """Crea nuovo dipendente"""
-        query = """
-        INSERT INTO persons (name, email, employee_id, hire_date, status, flags)
-        VALUES (?, ?, ?, ?, ?, ?)
-        """
-        with self.db.get_connection() as conn:
+        with self.db.transaction() as conn:
             cursor = conn.cursor()
-            cursor.execute(query, (
+            cursor.execute(PERSON_INSERT, (
                 person.name, person.email, person.employee_id,
                 person.hire_date, person.status, person.flags
             ))
-            conn.commit()
+            self.db.notify_change('persons', [person.name])
             return cursor.lastrowid # type: ignore
     
     def update_person(self, name: str, person: Person) -> bool:
@@ -167,13 +398,17 @@ class OrganigrammaRepository:
             flags = ?, updated_at = CURRENT_TIMESTAMP
         WHERE name = ?
         """
-        with self.db.get_connection() as conn:
+        with self.db.transaction() as conn:
             cursor = conn.cursor()
+            old_status = conn.execute("SELECT status FROM persons WHERE name = ?", (name,)).fetchone()
             cursor.execute(query, (
                 person.email, person.employee_id, person.hire_date,
                 person.status, person.flags, name
             ))
-            conn.commit()
+            self.db.notify_change('persons', [name])
+            if old_status and old_status[0] != person.status:
+                # Lo status decide chi compare nell'organigramma
+                self.db.notify_change('person_status', [name])
             return cursor.rowcount > 0
     
     def deactivate_person(self, name: str) -> bool:
@@ -183,37 +418,88 @@ class OrganigrammaRepository:
         SET status = 'INACTIVE', updated_at = CURRENT_TIMESTAMP
         WHERE name = ?
         """
-        with self.db.get_connection() as conn:
+        with self.db.transaction() as conn:
             cursor = conn.cursor()
             cursor.execute(query, (name,))
-            conn.commit()
+            self.db.notify_change('persons', [name])
+            self.db.notify_change('person_status', [name])
             return cursor.rowcount > 0
     
     def delete_person(self, name: str) -> bool:
         """Elimina dipendente (solo se non ha ruoli attivi)"""
-        # Verifica ruoli attivi
-        active_roles = self.get_person_roles(name, active_only=True)
-        if active_roles:
-            return False
-        
         query = "DELETE FROM persons WHERE name = ?"
-        with self.db.get_connection() as conn:
+        with self.db.transaction() as conn:
+            # Verifica ruoli attivi
+            active_roles = self.get_person_roles(name, active_only=True)
+            if active_roles:
+                return False
+            
             cursor = conn.cursor()
             cursor.execute(query, (name,))
-            conn.commit()
+            self.db.notify_change('persons', [name])
+            # I ruoli terminati della persona vengono eliminati in cascata
+            self.db.notify_change('roles')
             return cursor.rowcount > 0
     
-    def search_persons(self, search_term: str) -> List[Person]:
-        """Ricerca dipendenti per nome o alias"""
-        query = """
-        SELECT DISTINCT p.* FROM persons p
+    def search_persons(self, search_term: str, limit: int = 100) -> List[Person]:
+        """Ricerca dipendenti per nome, alias, matricola o email (ordinati per rilevanza)"""
+        if not self.has_search_index():
+            return self._search_persons_like(search_term, limit)
+        match = fts_match_query(search_term)
+        if not match:
+            return []
+        query = f"""
+        SELECT {select_list(Person, 'p')} FROM search_index s
+        JOIN persons p ON p.id = s.rowid / 4
+        WHERE search_index MATCH ? AND s.kind = 'person'
+        ORDER BY s.rank
+        LIMIT ?
+        """
+        return self._fetch(query, (match, limit), Person.from_row)
+    
+    def _search_persons_like(self, search_term: str, limit: int) -> List[Person]:
+        """Ricerca con LIKE (SQLite senza FTS5)"""
+        query = f"""
+        SELECT DISTINCT {select_list(Person, 'p')} FROM persons p
         LEFT JOIN person_aliases pa ON p.name = pa.person_name
-        WHERE p.name LIKE ? OR pa.alias LIKE ? OR p.employee_id LIKE ?
+        WHERE p.name LIKE ? OR pa.alias LIKE ? OR p.employee_id LIKE ? OR p.email LIKE ?
         ORDER BY p.name
+        LIMIT ?
         """
         term = f"%{search_term}%"
-        rows = self.db.execute_query(query, (term, term, term))
-        return [Person(**dict(row)) for row in rows]
+        return self._fetch(query, (term, term, term, term, limit), Person.from_row)
+    
+    # ================================================================
+    # RICERCA FULL-TEXT
+    # ================================================================
+    
+    def has_search_index(self) -> bool:
+        """True se il database ha l'indice FTS5 (creato dalla migrazione 3)"""
+        if self._search_index is None:
+            rows = self._fetch(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'search_index'"
+            )
+            self._search_index = bool(rows)
+        return self._search_index
+    
+    def search(self, text: str, kinds: Optional[Iterable[str]] = None,
+               limit: int = 20) -> List[SearchHit]:
+        """Ricerca per prefisso su persone, funzioni e job title, per rilevanza"""
+        match = fts_match_query(text)
+        if not match or not self.has_search_index():
+            return []
+        query = """
+        SELECT kind, rowid / 4, name, codes FROM search_index
+        WHERE search_index MATCH ?
+        """
+        params: List[Any] = [match]
+        kinds = [kind for kind in (kinds or ()) if kind in SEARCH_KINDS]
+        if kinds:
+            query += f" AND kind IN ({', '.join('?' for _ in kinds)})"
+            params.extend(kinds)
+        query += " ORDER BY rank LIMIT ?"
+        params.append(limit)
+        return self._fetch(query, params, SearchHit.from_row)
     
     # ================================================================
     # JOB TITLES - CRUD COMPLETO
@@ -221,26 +507,26 @@ class OrganigrammaRepository:
     
     def get_all_job_titles(self) -> List[JobTitle]:
         """Recupera tutti i job titles"""
-        query = "SELECT * FROM job_titles ORDER BY level, name"
-        rows = self.db.execute_query(query)
-        return [JobTitle(**dict(row)) for row in rows]
+        query = f"SELECT {JOB_TITLE_COLUMNS} FROM job_titles ORDER BY level, name"
+        return self._fetch(query, (), JobTitle.from_row)
+    
+    def list_job_titles(self, limit: Optional[int] = None, cursor: Optional[str] = None,
+                        sort: Optional[str] = None, descending: bool = False) -> Page:
+        """Pagina di job titles"""
+        return self._list_page(f"SELECT {JOB_TITLE_COLUMNS} FROM job_titles", [], [],
+                               self.JOB_TITLE_SORTS, sort, 'level', descending,
+                               cursor, limit, JobTitle.from_row)
     
     def get_job_title(self, name: str) -> Optional[JobTitle]:
         """Recupera singolo job title per nome"""
-        query = "SELECT * FROM job_titles WHERE name = ?"
-        rows = self.db.execute_query(query, (name,))
-        return JobTitle(**dict(rows[0])) if rows else None
+        query = f"SELECT {JOB_TITLE_COLUMNS} FROM job_titles WHERE name = ?"
+        return self._fetch_one(query, (name,), JobTitle)
     
     def create_job_title(self, job_title: JobTitle) -> int:
         """Crea nuovo job title"""
-        query = """
-        INSERT INTO job_titles (name, level, flags)
-        VALUES (?, ?, ?)
-        """
-        with self.db.get_connection() as conn:
+        with self.db.transaction() as conn:
             cursor = conn.cursor()
-            cursor.execute(query, (job_title.name, job_title.level, job_title.flags))
-            conn.commit()
+            cursor.execute(JOB_TITLE_INSERT, (job_title.name, job_title.level, job_title.flags))
             return cursor.lastrowid # type: ignore
     
     def update_job_title(self, name: str, job_title: JobTitle) -> bool:
@@ -250,88 +536,123 @@ class OrganigrammaRepository:
         SET level = ?, flags = ?, updated_at = CURRENT_TIMESTAMP
         WHERE name = ?
         """
-        with self.db.get_connection() as conn:
+        with self.db.transaction() as conn:
             cursor = conn.cursor()
             cursor.execute(query, (job_title.level, job_title.flags, name))
-            conn.commit()
             return cursor.rowcount > 0
     
     def delete_job_title(self, name: str) -> bool:
         """Elimina job title (solo se non in uso)"""
-        # Verifica se in uso
         query_check = "SELECT COUNT(*) as count FROM roles WHERE job_title_name = ? AND end_date IS NULL"
-        rows = self.db.execute_query(query_check, (name,))
-        if rows[0]['count'] > 0:
-            return False
-        
         query = "DELETE FROM job_titles WHERE name = ?"
-        with self.db.get_connection() as conn:
+        with self.db.transaction() as conn:
+            # Verifica se in uso
             cursor = conn.cursor()
+            cursor.execute(query_check, (name,))
+            if cursor.fetchone()['count'] > 0:
+                return False
+            
             cursor.execute(query, (name,))
-            conn.commit()
             return cursor.rowcount > 0
     
     # ================================================================
     # ROLES - CRUD COMPLETO
     # ================================================================
     
-    def get_person_roles(self, person_name: str, active_only: bool = True) -> List[Role]:
-        """Recupera ruoli di una persona"""
-        query = "SELECT * FROM roles WHERE person_name = ?"
-        if active_only:
+    def _get_roles(self, condition: str, params, active_only: bool, order_by: str,
+                   as_of: Optional[date] = None) -> List[Role]:
+        query = f"SELECT {ROLE_COLUMNS} FROM roles WHERE {condition}"
+        if as_of is not None:
+            # Ruoli validi alla data (anche terminati o non ancora iniziati oggi)
+            query += f" AND {role_period_clause()}"
+            params = (*params, *period_params(as_of))
+        elif active_only:
             query += " AND end_date IS NULL"
-        query += " ORDER BY function_name"
-        rows = self.db.execute_query(query, (person_name,))
-        return [Role(**dict(row)) for row in rows]
-    
-    def get_function_roles(self, function_name: str, active_only: bool = True) -> List[Role]:
-        """Recupera ruoli di una funzione"""
-        query = "SELECT * FROM roles WHERE function_name = ?"
+        query += f" ORDER BY {order_by}"
+        return self._fetch(query, params, Role.from_row)
+    
+    def get_person_roles(self, person_name: str, active_only: bool = True,
+                         as_of: Optional[date] = None) -> List[Role]:
+        """Recupera ruoli di una persona (attivi, tutti o validi alla data as_of)"""
+        return self._get_roles(f"person_id = {PERSON_ID_OF}", (person_name,),
+                               active_only, "function_name", as_of)
+    
+    def get_person_roles_by_id(self, person_id: int, active_only: bool = True,
+                               as_of: Optional[date] = None) -> List[Role]:
+        """Recupera ruoli di una persona per ID"""
+        return self._get_roles("person_id = ?", (person_id,), active_only, "function_name", as_of)
+    
+    def get_function_roles(self, function_name: str, active_only: bool = True,
+                           as_of: Optional[date] = None) -> List[Role]:
+        """Recupera ruoli di una funzione (attivi, tutti o validi alla data as_of)"""
+        return self._get_roles(f"function_id = {FUNCTION_ID_OF}", (function_name,),
+                               active_only, "person_name", as_of)
+    
+    def get_function_roles_by_id(self, function_id: int, active_only: bool = True,
+                                 as_of: Optional[date] = None) -> List[Role]:
+        """Recupera ruoli di una funzione per ID"""
+        return self._get_roles("function_id = ?", (function_id,), active_only, "person_name", as_of)
+    
+    def get_all_roles(self, active_only: bool = True, mode: str = 'model') -> ReadResult:
+        """Recupera tutti i ruoli"""
+        query = f"SELECT {ROLE_COLUMNS} FROM roles"
         if active_only:
-            query += " AND end_date IS NULL"
-        query += " ORDER BY person_name"
-        rows = self.db.execute_query(query, (function_name,))
-        return [Role(**dict(row)) for row in rows]
+            query += " WHERE end_date IS NULL"
+        query += " ORDER BY person_name, function_name"
+        return self._read(query, (), Role, mode)
+    
+    def list_roles(self, active_only: bool = True, person_name: Optional[str] = None,
+                   function_name: Optional[str] = None, job_title_name: Optional[str] = None,
+                   organizational_unit: Optional[str] = None, ad_interim: Optional[bool] = None,
+                   limit: Optional[int] = None, cursor: Optional[str] = None,
+                   sort: Optional[str] = None, descending: bool = False) -> Page:
+        """Pagina di ruoli con filtri su persona, funzione, job title, unità e interim"""
+        where, params = filter_clauses([
+            (f'person_id = {PERSON_ID_OF}', person_name),
+            (f'function_id = {FUNCTION_ID_OF}', function_name),
+            ('job_title_name', job_title_name),
+            ('organizational_unit', organizational_unit),
+            ('ad_interim', None if ad_interim is None else int(ad_interim)),
+        ])
+        if active_only:
+            where.append("end_date IS NULL")
+        return self._list_page(f"SELECT {ROLE_COLUMNS} FROM roles", where, params,
+                               self.ROLE_SORTS, sort, 'person', descending,
+                               cursor, limit, Role.from_row)
     
     def get_role(self, role_id: int) -> Optional[Role]:
         """Recupera singolo ruolo per ID"""
-        query = "SELECT * FROM roles WHERE id = ?"
-        rows = self.db.execute_query(query, (role_id,))
-        return Role(**dict(rows[0])) if rows else None
+        query = f"SELECT {ROLE_COLUMNS} FROM roles WHERE id = ?"
+        return self._fetch_one(query, (role_id,), Role)
     
     def create_role(self, role: Role) -> int:
         """Crea nuovo ruolo"""
-        query = """
-        INSERT INTO roles (person_name, function_name, organizational_unit,
-                          job_title_name, percentage, ad_interim, reports_to,
-                          start_date, flags)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """
-        with self.db.get_connection() as conn:
+        with self.db.transaction() as conn:
             cursor = conn.cursor()
-            cursor.execute(query, (
+            cursor.execute(ROLE_INSERT, (
                 role.person_name, role.function_name, role.organizational_unit,
                 role.job_title_name, role.percentage, role.ad_interim,
                 role.reports_to, role.start_date or date.today(), role.flags
             ))
-            conn.commit()
+            self.db.notify_change('roles')
             return cursor.lastrowid # type: ignore
     
     def update_role(self, role_id: int, role: Role) -> bool:
         """Aggiorna ruolo esistente"""
         query = """
         UPDATE roles 
-        SET organizational_unit = ?, job_title_name = ?, percentage = ?,
-            ad_interim = ?, reports_to = ?, flags = ?, updated_at = CURRENT_TIMESTAMP
-        WHERE id = ?
+        SET organizational_unit = ?1, job_title_name = ?2, percentage = ?3,
+            ad_interim = ?4, reports_to = ?5, manager_id = (SELECT id FROM persons WHERE name = ?5),
+            flags = ?6, updated_at = CURRENT_TIMESTAMP
+        WHERE id = ?7
         """
-        with self.db.get_connection() as conn:
+        with self.db.transaction() as conn:
             cursor = conn.cursor()
             cursor.execute(query, (
                 role.organizational_unit, role.job_title_name, role.percentage,
                 role.ad_interim, role.reports_to, role.flags, role_id
             ))
-            conn.commit()
+            self.db.notify_change('roles')
             return cursor.rowcount > 0
     
     def end_role(self, role_id: int, end_date: Optional[date] = None) -> bool:
@@ -339,24 +660,19 @@ class OrganigrammaRepository:
         if not end_date:
             end_date = date.today()
         
-        query = """
-        UPDATE roles 
-        SET end_date = ?, updated_at = CURRENT_TIMESTAMP
-        WHERE id = ? AND end_date IS NULL
-        """
-        with self.db.get_connection() as conn:
+        with self.db.transaction() as conn:
             cursor = conn.cursor()
-            cursor.execute(query, (end_date, role_id))
-            conn.commit()
+            cursor.execute(ROLE_END, (end_date, role_id))
+            self.db.notify_change('roles')
             return cursor.rowcount > 0
     
     def delete_role(self, role_id: int) -> bool:
         """Elimina ruolo permanentemente"""
         query = "DELETE FROM roles WHERE id = ?"
-        with self.db.get_connection() as conn:
+        with self.db.transaction() as conn:
             cursor = conn.cursor()
             cursor.execute(query, (role_id,))
-            conn.commit()
+            self.db.notify_change('roles')
             return cursor.rowcount > 0
     
     def transfer_role(self, role_id: int, new_person_name: str, 
@@ -365,35 +681,29 @@ class OrganigrammaRepository:
         if not transfer_date:
             transfer_date = date.today()
         
-        # Recupera ruolo originale
-        original_role = self.get_role(role_id)
-        if not original_role:
-            return False, None
-        
-        with self.db.get_connection() as conn:
+        with self.db.transaction() as conn:
+            # Recupera ruolo originale
+            original_role = self.get_role(role_id)
+            if not original_role:
+                return False, None
+            
             cursor = conn.cursor()
             
             # Termina ruolo originale
             cursor.execute(
-                "UPDATE roles SET end_date = ? WHERE id = ?",
+                "UPDATE roles SET end_date = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
                 (transfer_date, role_id)
             )
             
             # Crea nuovo ruolo per nuova persona
-            cursor.execute("""
-                INSERT INTO roles (person_name, function_name, organizational_unit,
-                                  job_title_name, percentage, ad_interim, reports_to,
-                                  start_date, flags)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
+            cursor.execute(ROLE_INSERT, (
                 new_person_name, original_role.function_name, original_role.organizational_unit,
                 original_role.job_title_name, original_role.percentage, original_role.ad_interim,
                 original_role.reports_to, transfer_date, original_role.flags
             ))
             
             new_role_id = cursor.lastrowid
-            conn.commit()
-            
+            self.db.notify_change('roles')
             return True, new_role_id
     
     # ================================================================
@@ -408,20 +718,31 @@ class OrganigrammaRepository:
     
     def add_person_alias(self, person_name: str, alias: str, flags: Optional[str] = None) -> bool:
         """Aggiunge alias a una persona"""
-        query = "INSERT OR IGNORE INTO person_aliases (person_name, alias, flags) VALUES (?, ?, ?)"
-        with self.db.get_connection() as conn:
+        query = """
+        INSERT OR IGNORE INTO person_aliases (person_name, alias, flags, person_id)
+        VALUES (?1, ?2, ?3, (SELECT id FROM persons WHERE name = ?1))
+        """
+        with self.db.transaction() as conn:
             cursor = conn.cursor()
             cursor.execute(query, (person_name, alias, flags))
-            conn.commit()
+            self.db.notify_change('persons', [person_name])
             return cursor.rowcount > 0
     
+    def add_person_aliases(self, person_name: str, aliases: List[str]) -> int:
+        """Aggiunge più alias a una persona con un solo statement"""
+        with self.db.transaction() as conn:
+            cursor = conn.cursor()
+            cursor.executemany(PERSON_ALIAS_INSERT, [(person_name, alias) for alias in aliases])
+            self.db.notify_change('persons', [person_name])
+            return cursor.rowcount
+    
     def remove_person_alias(self, person_name: str, alias: str) -> bool:
         """Rimuove alias da una persona"""
         query = "DELETE FROM person_aliases WHERE person_name = ? AND alias = ?"
-        with self.db.get_connection() as conn:
+        with self.db.transaction() as conn:
             cursor = conn.cursor()
             cursor.execute(query, (person_name, alias))
-            conn.commit()
+            self.db.notify_change('persons', [person_name])
             return cursor.rowcount > 0
     
     def get_function_aliases(self, function_name: str) -> List[str]:
@@ -432,104 +753,134 @@ class OrganigrammaRepository:
     
     def add_function_alias(self, function_name: str, alias: str, flags: Optional[str] = None) -> bool:
         """Aggiunge alias a una funzione"""
-        query = "INSERT OR IGNORE INTO function_aliases (function_name, alias, flags) VALUES (?, ?, ?)"
-        with self.db.get_connection() as conn:
+        query = """
+        INSERT OR IGNORE INTO function_aliases (function_name, alias, flags, function_id)
+        VALUES (?1, ?2, ?3, (SELECT id FROM functions WHERE name = ?1))
+        """
+        with self.db.transaction() as conn:
             cursor = conn.cursor()
             cursor.execute(query, (function_name, alias, flags))
-            conn.commit()
             return cursor.rowcount > 0
     
     # ================================================================
     # ORGANIZATION CHART - READONLY
     # ================================================================
     
-    def get_organization_chart(self) -> List[OrgChartNode]:
-        """Recupera organigramma completo"""
-        query = "SELECT * FROM organization_chart ORDER BY level, function_name, person_name"
-        rows = self.db.execute_query(query)
-        return [OrgChartNode(**dict(row)) for row in rows]
-    
-    def get_direct_reports(self, manager_name: str) -> List[Role]:
-        """Recupera persone che riportano a un manager"""
-        query = """
-        SELECT * FROM roles 
-        WHERE reports_to = ? AND end_date IS NULL
-        ORDER BY function_name, person_name
+    def get_organization_chart(self, as_of: Optional[date] = None) -> List[OrgChartNode]:
+        """Recupera organigramma completo (attuale o alla data as_of).
+        
+        Alla data conta solo il periodo dei ruoli: gerarchia delle funzioni
+        e stato delle persone non hanno storico e restano quelli attuali,
+        ma una persona oggi non attiva compare dove lavorava allora.
+        """
+        if as_of is None:
+            query = f"""
+            SELECT {select_list(OrgChartNode)} FROM organization_chart
+            ORDER BY level, function_name, person_name
+            """
+            return self._fetch(query, (), OrgChartNode.from_row)
+        
+        query = f"""
+        SELECT f.name, f.level, f.path, r.person_name, r.job_title_name,
+               r.organizational_unit, r.ad_interim, f.reports_to, r.reports_to
+        FROM functions f
+        LEFT JOIN roles r ON r.function_id = f.id AND {role_period_clause('r')}
+        WHERE f.level IS NOT NULL
+        ORDER BY f.level, f.name, r.person_name
         """
-        rows = self.db.execute_query(query, (manager_name,))
-        return [Role(**dict(row)) for row in rows]
+        return self._fetch(query, period_params(as_of), OrgChartNode.from_row)
+    
+    def get_direct_reports(self, manager_name: str, as_of: Optional[date] = None) -> List[Role]:
+        """Recupera persone che riportano a un manager (oggi o alla data as_of)"""
+        return self._get_roles(f"manager_id = {PERSON_ID_OF}", (manager_name,),
+                               True, "function_name, person_name", as_of)
+    
+    def get_direct_reports_by_id(self, manager_id: int, as_of: Optional[date] = None) -> List[Role]:
+        """Recupera persone che riportano a un manager (per ID)"""
+        return self._get_roles("manager_id = ?", (manager_id,), True,
+                               "function_name, person_name", as_of)
+    
+    def get_interim_roles(self) -> List[Role]:
+        """Ruoli ad interim attivi"""
+        query = f"""
+        SELECT {ROLE_COLUMNS} FROM roles
+        WHERE ad_interim = 1 AND end_date IS NULL
+        ORDER BY start_date DESC
+        """
+        return self._fetch(query, (), Role.from_row)
     
     # ================================================================
     # STATISTICS
     # ================================================================
     
     def get_stats(self) -> Dict:
-        """Recupera statistiche generali"""
-        stats = {}
-        
-        # Conteggi base
-        stats['total_persons'] = self.db.execute_query(
-            "SELECT COUNT(*) as count FROM persons WHERE status='ACTIVE'"
-        )[0]['count']
-        
-        stats['total_functions'] = self.db.execute_query(
-            "SELECT COUNT(*) as count FROM functions"
-        )[0]['count']
-        
-        stats['total_roles'] = self.db.execute_query(
-            "SELECT COUNT(*) as count FROM roles WHERE end_date IS NULL"
-        )[0]['count']
-        
-        stats['interim_roles'] = self.db.execute_query(
-            "SELECT COUNT(*) as count FROM roles WHERE ad_interim=1 AND end_date IS NULL"
-        )[0]['count']
-        
-        # Persone con ruoli multipli
-        multi_role_query = """
-        SELECT COUNT(*) as count FROM (
-            SELECT person_name FROM roles WHERE end_date IS NULL 
-            GROUP BY person_name HAVING COUNT(*) > 1
-        )
-        """
-        stats['multi_role_persons'] = self.db.execute_query(multi_role_query)[0]['count']
-        
-        return stats
+        """Recupera statistiche generali (in cache finché il database non cambia)"""
+        return dict(self.db.cached('stats', self._load_stats))
+    
+    def _load_stats(self) -> Dict:
+        with self.db.read_snapshot() as conn:
+            return self._collect_stats(conn)
+    
+    def _collect_stats(self, conn) -> Dict:
+        """Conteggi base in una sola query, su una connessione (snapshot) già aperta"""
+        row = conn.execute("""
+            SELECT (SELECT COUNT(*) FROM persons WHERE status = 'ACTIVE') AS total_persons,
+                   (SELECT COUNT(*) FROM functions) AS total_functions,
+                   COUNT(*) AS total_roles,
+                   COUNT(CASE WHEN ad_interim = 1 THEN 1 END) AS interim_roles,
+                   -- Persone con ruoli multipli
+                   (SELECT COUNT(*) FROM (
+                        SELECT 1 FROM roles WHERE end_date IS NULL
+                        GROUP BY person_name HAVING COUNT(*) > 1
+                   )) AS multi_role_persons
+            FROM roles
+            WHERE end_date IS NULL
+        """).fetchone()
+        return dict(row)
     
     def get_detailed_stats(self) -> Dict:
-        """Statistiche dettagliate per dashboard admin"""
-        stats = self.get_stats()
-        
-        # Statistiche per funzione
-        function_stats = self.db.execute_query("""
-            SELECT f.name, COUNT(r.id) as role_count
-            FROM functions f
-            LEFT JOIN roles r ON f.name = r.function_name AND r.end_date IS NULL
-            GROUP BY f.name
-            ORDER BY role_count DESC
-        """)
-        stats['functions_by_headcount'] = [dict(row) for row in function_stats]
+        """Statistiche dettagliate per dashboard admin (in cache come get_stats).
         
-        # Job titles più comuni
-        job_title_stats = self.db.execute_query("""
-            SELECT job_title_name, COUNT(*) as count
-            FROM roles 
-            WHERE end_date IS NULL AND job_title_name IS NOT NULL
-            GROUP BY job_title_name
-            ORDER BY count DESC
-            LIMIT 10
-        """)
-        stats['top_job_titles'] = [dict(row) for row in job_title_stats]
-        
-        # Persone con più ruoli
-        multi_role_details = self.db.execute_query("""
-            SELECT person_name, COUNT(*) as role_count
-            FROM roles 
-            WHERE end_date IS NULL
-            GROUP BY person_name
-            HAVING COUNT(*) > 1
-            ORDER BY role_count DESC
-        """)
-        stats['multi_role_details'] = [dict(row) for row in multi_role_details]
+        Tutte le query girano sullo stesso snapshot di sola lettura, così
+        i conteggi sono coerenti tra loro e le scritture non vengono bloccate.
+        """
+        return dict(self.db.cached('detailed_stats', self._load_detailed_stats))
+    
+    def _load_detailed_stats(self) -> Dict:
+        with self.db.read_snapshot() as conn:
+            stats = self._collect_stats(conn)
+            
+            # Statistiche per funzione (conteggio sull'indice parziale dei ruoli attivi)
+            function_stats = conn.execute("""
+                SELECT f.name,
+                       (SELECT COUNT(*) FROM roles r
+                        WHERE r.function_id = f.id AND r.end_date IS NULL) as role_count
+                FROM functions f
+                ORDER BY role_count DESC
+            """).fetchall()
+            stats['functions_by_headcount'] = [dict(row) for row in function_stats]
+            
+            # Job titles più comuni
+            job_title_stats = conn.execute("""
+                SELECT job_title_name, COUNT(*) as count
+                FROM roles 
+                WHERE end_date IS NULL AND job_title_name IS NOT NULL
+                GROUP BY job_title_name
+                ORDER BY count DESC
+                LIMIT 10
+            """).fetchall()
+            stats['top_job_titles'] = [dict(row) for row in job_title_stats]
+            
+            # Persone con più ruoli
+            multi_role_details = conn.execute("""
+                SELECT person_name, COUNT(*) as role_count
+                FROM roles 
+                WHERE end_date IS NULL
+                GROUP BY person_name
+                HAVING COUNT(*) > 1
+                ORDER BY role_count DESC
+            """).fetchall()
+            stats['multi_role_details'] = [dict(row) for row in multi_role_details]
         
         return stats
     
@@ -541,13 +892,14 @@ class OrganigrammaRepository:
         """Aggiorna in massa i report per cambio manager"""
         query = """
         UPDATE roles 
-        SET reports_to = ?, updated_at = CURRENT_TIMESTAMP
-        WHERE reports_to = ? AND end_date IS NULL
+        SET reports_to = ?1, manager_id = (SELECT id FROM persons WHERE name = ?1),
+            updated_at = CURRENT_TIMESTAMP
+        WHERE reports_to = ?2 AND end_date IS NULL
         """
-        with self.db.get_connection() as conn:
+        with self.db.transaction() as conn:
             cursor = conn.cursor()
             cursor.execute(query, (new_manager, old_manager))
-            conn.commit()
+            self.db.notify_change('roles')
             return cursor.rowcount
     
     def bulk_end_person_roles(self, person_name: str, end_date: Optional[date] = None) -> int:
@@ -560,8 +912,97 @@ class OrganigrammaRepository:
         SET end_date = ?, updated_at = CURRENT_TIMESTAMP
         WHERE person_name = ? AND end_date IS NULL
         """
-        with self.db.get_connection() as conn:
+        with self.db.transaction() as conn:
             cursor = conn.cursor()
             cursor.execute(query, (end_date, person_name))
-            conn.commit()
+            self.db.notify_change('roles')
             return cursor.rowcount
+    
+    @staticmethod
+    def _fill_temp_table(conn, name: str, columns: str, rows: Iterable[tuple]):
+        """Tabella temporanea (della connessione) caricata con executemany"""
+        conn.execute(f"DROP TABLE IF EXISTS temp.{name}")
+        conn.execute(f"CREATE TEMP TABLE {name} ({columns})")
+        width = columns.count(',') + 1
+        conn.executemany(f"INSERT INTO temp.{name} VALUES ({', '.join('?' * width)})", rows)
+    
+    def get_missing_persons(self, names: Iterable[str]) -> List[str]:
+        """Nomi (fra quelli dati) senza un dipendente corrispondente"""
+        with self.db.transaction() as conn:
+            self._fill_temp_table(conn, "bulk_names", "name TEXT PRIMARY KEY",
+                                  [(name,) for name in set(names)])
+            rows = conn.execute("""
+                SELECT b.name FROM temp.bulk_names b
+                WHERE NOT EXISTS (SELECT 1 FROM persons p WHERE p.name = b.name)
+                ORDER BY b.name
+            """).fetchall()
+            conn.execute("DROP TABLE temp.bulk_names")
+            return [row[0] for row in rows]
+
+    def get_terminations_before_start(self, end_dates: Dict[str, str]) -> List[str]:
+        """Persone (fra quelle date) con un ruolo attivo iniziato dopo la data di terminazione"""
+        with self.db.transaction() as conn:
+            self._fill_temp_table(conn, "bulk_end_dates",
+                                  "person_name TEXT PRIMARY KEY, end_date DATE NOT NULL",
+                                  end_dates.items())
+            rows = conn.execute("""
+                SELECT DISTINCT t.person_name FROM temp.bulk_end_dates t
+                JOIN roles r ON r.person_name = t.person_name
+                WHERE r.end_date IS NULL AND r.start_date > t.end_date
+                ORDER BY t.person_name
+            """).fetchall()
+            conn.execute("DROP TABLE temp.bulk_end_dates")
+            return [row[0] for row in rows]
+
+    def bulk_update_roles_reports_to_map(self, changes: Dict[str, str]) -> int:
+        """Cambio manager in massa (vecchio -> nuovo) con un solo UPDATE.
+
+        Le sostituzioni sono simultanee: con A -> B e B -> C i report di A
+        passano a B e quelli di B a C.
+        """
+        with self.db.transaction() as conn:
+            self._fill_temp_table(conn, "bulk_manager_changes",
+                                  "old_manager TEXT PRIMARY KEY, new_manager TEXT NOT NULL",
+                                  changes.items())
+            cursor = conn.execute("""
+                UPDATE roles SET
+                    reports_to = (SELECT c.new_manager FROM temp.bulk_manager_changes c
+                                  WHERE c.old_manager = roles.reports_to),
+                    manager_id = (SELECT p.id FROM temp.bulk_manager_changes c
+                                  JOIN persons p ON p.name = c.new_manager
+                                  WHERE c.old_manager = roles.reports_to),
+                    updated_at = CURRENT_TIMESTAMP
+                WHERE end_date IS NULL
+                  AND reports_to IN (SELECT old_manager FROM temp.bulk_manager_changes)
+            """)
+            conn.execute("DROP TABLE temp.bulk_manager_changes")
+            self.db.notify_change('roles')
+            return cursor.rowcount
+    
+    def bulk_terminate_persons(self, end_dates: Dict[str, date]) -> Tuple[int, int]:
+        """Termina più dipendenti (persona -> data): ruoli attivi chiusi e status TERMINATED.
+
+        Due UPDATE in tutto; restituisce (ruoli terminati, dipendenti aggiornati).
+        """
+        with self.db.transaction() as conn:
+            self._fill_temp_table(conn, "bulk_terminations",
+                                  "person_name TEXT PRIMARY KEY, end_date DATE NOT NULL",
+                                  end_dates.items())
+            roles = conn.execute("""
+                UPDATE roles SET
+                    end_date = (SELECT t.end_date FROM temp.bulk_terminations t
+                                WHERE t.person_name = roles.person_name),
+                    updated_at = CURRENT_TIMESTAMP
+                WHERE end_date IS NULL
+                  AND person_name IN (SELECT person_name FROM temp.bulk_terminations)
+            """).rowcount
+            persons = conn.execute("""
+                UPDATE persons SET status = 'TERMINATED', updated_at = CURRENT_TIMESTAMP
+                WHERE status IS NOT 'TERMINATED'
+                  AND name IN (SELECT person_name FROM temp.bulk_terminations)
+            """).rowcount
+            conn.execute("DROP TABLE temp.bulk_terminations")
+            self.db.notify_change('persons', list(end_dates))
+            self.db.notify_change('person_status', list(end_dates))
+            self.db.notify_change('roles')
+            return roles, persons
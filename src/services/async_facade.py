@@ -0,0 +1,133 @@
+# src/services/async_facade.py - Accesso non bloccante al database per gli handler async
+import asyncio
+import functools
+import os
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+from ..database.connection import DatabaseConnection
+
+DEFAULT_TIMEOUT = float(os.environ.get("DB_QUERY_TIMEOUT", "30"))
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+class QueryTimeoutError(Exception):
+    """Operazione database non completata entro il timeout"""
+    pass
+
+
+def get_db_executor(max_workers: int) -> ThreadPoolExecutor:
+    """Executor condiviso dal processo per il lavoro SQLite.
+
+    Il dimensionamento segue quello del pool di connessioni: un thread in
+    più non troverebbe una connessione libera e resterebbe solo in attesa.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=max_workers,
+                                           thread_name_prefix="db-worker")
+        return _executor
+
+
+def shutdown_db_executor():
+    """Arresta l'executor condiviso (alla chiusura dell'applicazione)"""
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False)
+            _executor = None
+
+
+class _Job:
+    """Chiamata sincrona eseguita in un thread dell'executor"""
+
+    def __init__(self, func: Callable, args, kwargs):
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.thread_id: Optional[int] = None
+        self.cancelled = False
+        self.lock = threading.Lock()
+
+    def __call__(self):
+        with self.lock:
+            if self.cancelled:
+                raise asyncio.CancelledError()
+            self.thread_id = threading.get_ident()
+        try:
+            return self.func(*self.args, **self.kwargs)
+        finally:
+            with self.lock:
+                self.thread_id = None
+
+    def cancel(self, db: DatabaseConnection):
+        """Annulla il job: se non è partito non partirà, altrimenti interrompe la query"""
+        with self.lock:
+            self.cancelled = True
+            if self.thread_id is not None:
+                db.interrupt_thread(self.thread_id)
+
+
+class AsyncFacade:
+    """Facciata async su repository o servizio sincroni.
+
+    Ogni metodo del target diventa una coroutine eseguita nell'executor
+    database, così l'event loop di uvicorn non resta bloccato durante le
+    query. Se la richiesta viene annullata o supera il timeout, la query
+    SQLite in corso viene interrotta.
+
+        async_service = AsyncFacade(service, db_connection)
+        data = await async_service.get_dashboard_data()
+        data = await async_service.with_timeout(5).get_dashboard_data()
+    """
+
+    def __init__(self, target: Any, db: DatabaseConnection,
+                 timeout: Optional[float] = DEFAULT_TIMEOUT,
+                 max_workers: Optional[int] = None):
+        self._target = target
+        self._db = db
+        self._timeout = timeout
+        self._executor = get_db_executor(max_workers or db.pool.max_size)
+
+    def with_timeout(self, timeout: Optional[float]) -> "AsyncFacade":
+        """Stessa facciata con un timeout diverso (None = nessun limite)"""
+        facade = AsyncFacade.__new__(AsyncFacade)
+        facade._target = self._target
+        facade._db = self._db
+        facade._timeout = timeout
+        facade._executor = self._executor
+        return facade
+
+    async def run(self, func: Callable, *args, **kwargs) -> Any:
+        """Esegue una funzione sincrona qualsiasi nell'executor database"""
+        job = _Job(func, args, kwargs)
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self._executor, job)
+        try:
+            if self._timeout is None:
+                return await future
+            return await asyncio.wait_for(future, self._timeout)
+        except asyncio.TimeoutError:
+            job.cancel(self._db)
+            name = getattr(func, '__name__', repr(func))
+            logging.warning(f"Timeout database ({self._timeout}s) in {name}")
+            raise QueryTimeoutError(f"Operazione {name} oltre il timeout di {self._timeout}s")
+        except asyncio.CancelledError:
+            job.cancel(self._db)
+            raise
+
+    def __getattr__(self, name: str) -> Callable:
+        attr = getattr(self._target, name)
+        if not callable(attr):
+            return attr
+
+        @functools.wraps(attr)
+        async def wrapper(*args, **kwargs):
+            return await self.run(attr, *args, **kwargs)
+
+        return wrapper
@@ -0,0 +1,649 @@
+# src/services/batch_operations.py - Batch transazionale di operazioni CRUD (API /api/batch)
+import logging
+import math
+import sqlite3
+import time
+from dataclasses import dataclass, field
+from datetime import date
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from ..database.connection import DatabaseConnection
+from ..database.repository import (FUNCTION_INSERT, JOB_TITLE_INSERT, PERSON_ALIAS_INSERT,
+                                   PERSON_INSERT, ROLE_END, ROLE_INSERT)
+from .organigramma_service import OrganigrammaService
+
+MODES = ('atomic', 'best_effort')
+DEFAULT_MAX_OPERATIONS = 10000
+
+# Campi accettati in creazione e in aggiornamento, per entità
+CREATE_FIELDS: Dict[str, Tuple[str, ...]] = {
+    'persons': ('name', 'email', 'employee_id', 'hire_date', 'status', 'flags', 'aliases'),
+    'functions': ('name', 'reports_to', 'flags'),
+    'job_titles': ('name', 'level', 'flags'),
+    'roles': ('person_name', 'function_name', 'organizational_unit', 'job_title_name',
+              'percentage', 'ad_interim', 'reports_to', 'start_date', 'flags'),
+}
+UPDATE_FIELDS: Dict[str, Tuple[str, ...]] = {
+    'persons': ('email', 'employee_id', 'hire_date', 'status', 'flags'),
+    'functions': ('reports_to', 'flags'),
+    'job_titles': ('level', 'flags'),
+    'roles': ('organizational_unit', 'job_title_name', 'percentage', 'ad_interim',
+              'reports_to', 'flags'),
+}
+OPERATIONS: Dict[str, Tuple[str, ...]] = {
+    'persons': ('create', 'update'),
+    'functions': ('create', 'update'),
+    'job_titles': ('create', 'update'),
+    'roles': ('create', 'update', 'end', 'transfer'),
+}
+
+_ENTITY_ALIASES = {
+    'person': 'persons', 'function': 'functions', 'job_title': 'job_titles',
+    'job-titles': 'job_titles', 'role': 'roles',
+}
+
+# Stesse regole dei form CRUD (OrganigrammaService.validate_*)
+_VALIDATORS: Dict[str, Callable[..., List[str]]] = {
+    'persons': OrganigrammaService.validate_person_data,
+    'functions': OrganigrammaService.validate_function_data,
+    'job_titles': OrganigrammaService.validate_job_title_data,
+    'roles': OrganigrammaService.validate_role_data,
+}
+
+_SCALARS = (str, int, float, bool, type(None))
+
+# Chiave della tabella usata nella WHERE degli UPDATE
+_KEY_COLUMN = {'persons': 'name', 'functions': 'name', 'job_titles': 'name', 'roles': 'id'}
+
+# Lunghezza massima delle liste IN (...) nel caricamento dei nomi
+_IN_CHUNK = 500
+
+
+class BatchError(Exception):
+    """Richiesta batch non valida nel suo insieme (modo, numero operazioni)"""
+    pass
+
+
+class _Rejected(Exception):
+    """Operazione scartata in validazione"""
+    pass
+
+
+class _Aborted(Exception):
+    """Modo atomico: un'operazione è fallita, si annulla tutto"""
+    pass
+
+
+class _Retry(Exception):
+    """Modo best_effort: un gruppo è fallito, si ripete isolando i gruppi"""
+    pass
+
+
+@dataclass
+class OperationResult:
+    """Esito di una singola operazione del batch"""
+    index: int
+    entity: str
+    op: str
+    success: bool = False
+    message: str = "Non eseguita"
+    id: Optional[Any] = None
+
+    def to_dict(self) -> Dict:
+        return {'index': self.index, 'entity': self.entity, 'op': self.op,
+                'success': self.success, 'message': self.message, 'id': self.id}
+
+
+@dataclass
+class BatchReport:
+    """Esito del batch: risultati nell'ordine delle operazioni"""
+    mode: str
+    results: List[OperationResult] = field(default_factory=list)
+    committed: bool = False
+    elapsed: float = 0.0
+
+    @property
+    def succeeded(self) -> int:
+        return sum(1 for r in self.results if r.success)
+
+    @property
+    def failed(self) -> int:
+        return len(self.results) - self.succeeded
+
+    def to_dict(self) -> Dict:
+        return {
+            'mode': self.mode,
+            'committed': self.committed,
+            'total': len(self.results),
+            'succeeded': self.succeeded,
+            'failed': self.failed,
+            'elapsed_seconds': round(self.elapsed, 3),
+            'results': [r.to_dict() for r in self.results],
+        }
+
+
+@dataclass
+class _Planned:
+    """Operazione validata, pronta per l'esecuzione"""
+    result: OperationResult
+    group: Tuple
+    params: Tuple
+    extra: Any = None
+
+
+class BatchProcessor:
+    """Esegue una lista ordinata di operazioni CRUD in una transazione.
+
+    Le operazioni vengono validate tutte insieme contro i soli nomi e
+    ruoli che riferiscono (poche query IN sotto il lock di scrittura),
+    tenendo conto di quelle precedenti del batch. Le operazioni consecutive
+    dello stesso tipo (e, per gli aggiornamenti, sugli stessi campi)
+    vengono eseguite con un solo executemany.
+
+    atomic: un'operazione non valida o fallita annulla tutto il batch.
+    best_effort: le operazioni non valide vengono saltate; se un gruppo
+    fallisce in esecuzione il batch viene ripetuto con ogni gruppo in un
+    SAVEPOINT e il gruppo in errore una operazione alla volta, così si
+    scartano solo le operazioni che falliscono.
+
+        report = BatchProcessor(db, mode='best_effort').run([
+            {'op': 'create', 'entity': 'persons', 'data': {'name': 'Mario Rossi'}},
+            {'op': 'end', 'entity': 'roles', 'key': 42, 'data': {'end_date': '2024-06-30'}},
+        ])
+    """
+
+    def __init__(self, db: DatabaseConnection, mode: str = 'atomic',
+                 max_operations: int = DEFAULT_MAX_OPERATIONS):
+        if mode not in MODES:
+            raise BatchError(f"Modo non valido: {mode} (ammessi: {', '.join(MODES)})")
+        self.db = db
+        self.mode = mode
+        self.max_operations = max_operations
+
+    @property
+    def atomic(self) -> bool:
+        return self.mode == 'atomic'
+
+    def run(self, operations: List[Dict]) -> BatchReport:
+        if len(operations) > self.max_operations:
+            raise BatchError(f"Troppe operazioni: {len(operations)} (massimo {self.max_operations})")
+        started = time.perf_counter()
+        # Dentro una transazione già aperta si annulla solo il batch: SAVEPOINT.
+        # Altrimenti niente SAVEPOINT finché non serve (ogni pagina modificata
+        # sotto un SAVEPOINT viene copiata nel sub-journal: executemany molto più lento)
+        isolate = self.db.in_transaction()
+        try:
+            report = self._run(operations, isolate)
+        except _Retry:
+            report = self._run(operations, isolate=True)
+        report.elapsed = time.perf_counter() - started
+        logging.info(f"Batch {self.mode}: {report.succeeded}/{len(report.results)} operazioni "
+                     f"in {report.elapsed:.2f}s")
+        return report
+
+    def _run(self, operations: List[Dict], isolate: bool) -> BatchReport:
+        report = BatchReport(self.mode)
+        planned: List[_Planned] = []
+        try:
+            with self.db.transaction() as conn:
+                planned = self._plan(conn, operations, report)
+                if self.atomic and len(planned) < len(report.results):
+                    for item in planned:
+                        item.result.message = "Non eseguita: batch annullato"
+                    return report
+                if isolate:
+                    conn.execute("SAVEPOINT batch")
+                    try:
+                        self._execute(conn, planned, isolate)
+                    except _Aborted:
+                        conn.execute("ROLLBACK TO batch")
+                        raise
+                    finally:
+                        conn.execute("RELEASE batch")
+                else:
+                    self._execute(conn, planned, isolate)
+                report.committed = True
+        except _Aborted:
+            # L'errore è nel risultato dell'operazione fallita
+            for item in planned:
+                if item.result.success:
+                    item.result.success = False
+                    item.result.message = "Annullata: batch non completato"
+                    item.result.id = None
+        return report
+
+    # ----------------------------------------------------------------
+    # VALIDAZIONE
+    # ----------------------------------------------------------------
+
+    def _plan(self, conn, operations: List[Dict], report: BatchReport) -> List[_Planned]:
+        parsed = []
+        for index, operation in enumerate(operations):
+            operation = operation if isinstance(operation, dict) else {}
+            entity = str(operation.get('entity') or '').strip().lower()
+            entity = _ENTITY_ALIASES.get(entity, entity)
+            op = str(operation.get('op') or '').strip().lower()
+            result = OperationResult(index, entity, op)
+            report.results.append(result)
+            key, data = operation.get('key'), operation.get('data') or {}
+            try:
+                if op not in OPERATIONS.get(entity, ()):
+                    raise _Rejected(f"Operazione non supportata: {op} su {entity}")
+                _check_shape(key, data)
+            except _Rejected as e:
+                result.message = str(e)
+                continue
+            parsed.append((result, key, data))
+
+        self._load_known(conn, parsed)
+        planned = []
+        for result, key, data in parsed:
+            try:
+                planned.append(self._validate(result, key, data))
+            except _Rejected as e:
+                result.message = str(e)
+        return planned
+
+    def _load_known(self, conn, parsed):
+        """Carica i soli nomi e ruoli riferiti dalle operazioni"""
+        persons, functions, job_titles, employee_ids, emails, role_ids = (
+            set(), set(), set(), set(), set(), set())
+        for result, key, data in parsed:
+            if result.entity == 'persons':
+                persons.add(key if result.op == 'update' else data.get('name'))
+                employee_ids.add(data.get('employee_id'))
+                emails.add(data.get('email'))
+            elif result.entity == 'functions':
+                functions.update((key, data.get('name'), data.get('reports_to')))
+            elif result.entity == 'job_titles':
+                job_titles.update((key, data.get('name')))
+            else:
+                persons.update((data.get('person_name'), data.get('reports_to'),
+                                data.get('new_person_name')))
+                functions.add(data.get('function_name'))
+                job_titles.add(data.get('job_title_name'))
+                role_ids.add(key)
+
+        self.persons = _existing(conn, "SELECT name FROM persons WHERE name IN ({})", persons)
+        self.functions = _existing(conn, "SELECT name FROM functions WHERE name IN ({})", functions)
+        self.job_titles = _existing(conn, "SELECT name FROM job_titles WHERE name IN ({})", job_titles)
+        # Proprietario di employee_id ed email, per l'unicità anche negli aggiornamenti
+        self.employee_ids = dict(_rows(
+            conn, "SELECT employee_id, name FROM persons WHERE employee_id IN ({})", employee_ids))
+        self.emails = dict(_rows(conn, "SELECT email, name FROM persons WHERE email IN ({})", emails))
+        # Ruolo -> attivo (end_date assente)
+        ids = {_role_id(value) for value in role_ids} - {None}
+        self.roles = {row[0]: row[1] is None for row in _rows(
+            conn, "SELECT id, end_date FROM roles WHERE id IN ({})", ids)}
+
+    def _validate(self, result: OperationResult, key, data: Dict) -> _Planned:
+        entity, op = result.entity, result.op
+        allowed = {'create': CREATE_FIELDS[entity], 'update': UPDATE_FIELDS[entity],
+                   'end': ('end_date',), 'transfer': ('new_person_name', 'transfer_date')}[op]
+        unknown = set(data) - set(allowed)
+        if unknown:
+            raise _Rejected(f"Campi non ammessi: {', '.join(sorted(unknown))}")
+        values = {name: _clean(name, data[name]) for name in data}
+
+        if entity == 'roles':
+            return self._validate_role(result, key, values)
+        if op == 'create':
+            return self._validate_create(result, values)
+
+        name = _text(key)
+        if not name:
+            raise _Rejected("'key' (nome) richiesto")
+        known = {'persons': self.persons, 'functions': self.functions,
+                 'job_titles': self.job_titles}[entity]
+        if name not in known:
+            raise _Rejected(f"{_NOT_FOUND[entity]}: {name}")
+        if not values:
+            raise _Rejected("Nessun campo da aggiornare")
+        _check(entity, dict(values, name=name), partial=True)
+        if entity == 'persons':
+            self._claim_unique(name, values)
+        if entity == 'functions' and values.get('reports_to'):
+            self._require(self.functions, values['reports_to'], "Funzione padre non trovata")
+        fields = _fields(entity, values)
+        result.id = name
+        return _Planned(result, (entity, op, fields),
+                        tuple(values[f] for f in fields) + (name,))
+
+    def _validate_create(self, result: OperationResult, values: Dict) -> _Planned:
+        entity = result.entity
+        if entity == 'persons':
+            values['status'] = values.get('status') or 'ACTIVE'
+        _check(entity, values)
+        name = values['name']
+        known = {'persons': self.persons, 'functions': self.functions,
+                 'job_titles': self.job_titles}[entity]
+        if name in known:
+            raise _Rejected(f"{_EXISTS[entity]}: {name}")
+
+        if entity == 'persons':
+            self._claim_unique(name, values)
+            aliases = values.get('aliases') or []
+            if not isinstance(aliases, list):
+                raise _Rejected("'aliases' deve essere una lista")
+            params = (name, values.get('email'), values.get('employee_id'),
+                      values.get('hire_date'), values['status'], values.get('flags'))
+            extra = [str(alias).strip() for alias in aliases if str(alias).strip()]
+        elif entity == 'functions':
+            if values.get('reports_to'):
+                self._require(self.functions, values['reports_to'], "Funzione padre non trovata")
+            params, extra = (name, values.get('reports_to'), values.get('flags')), None
+        else:
+            params, extra = (name, values.get('level'), values.get('flags')), None
+
+        known.add(name)
+        return _Planned(result, (entity, 'create'), params, extra)
+
+    def _validate_role(self, result: OperationResult, key, values: Dict) -> _Planned:
+        op = result.op
+        if values.get('job_title_name'):
+            self._require(self.job_titles, values['job_title_name'], "Job title non trovato")
+        if values.get('reports_to'):
+            self._require(self.persons, values['reports_to'], "Responsabile non trovato")
+
+        if op == 'create':
+            if values.get('percentage') is None:
+                values['percentage'] = 1.0
+            _check('roles', values)
+            self._require(self.persons, values['person_name'], "Persona non trovata")
+            self._require(self.functions, values['function_name'], "Funzione non trovata")
+            return _Planned(result, ('roles', 'create'), (
+                values['person_name'], values['function_name'],
+                values.get('organizational_unit'), values.get('job_title_name'),
+                values['percentage'], int(bool(values.get('ad_interim'))),
+                values.get('reports_to'), values.get('start_date') or date.today().isoformat(),
+                values.get('flags')))
+
+        role_id = _role_id(key)
+        if role_id is None or role_id not in self.roles:
+            raise _Rejected(f"Ruolo non trovato: {key}")
+        result.id = role_id
+
+        if op == 'update':
+            if not values:
+                raise _Rejected("Nessun campo da aggiornare")
+            for required in ('percentage', 'ad_interim'):
+                if required in values and values[required] is None:
+                    raise _Rejected(f"Campo '{required}' non può essere vuoto")
+            _check('roles', values, partial=True)
+            if 'ad_interim' in values:
+                values['ad_interim'] = int(values['ad_interim'])
+            fields = _fields('roles', values)
+            return _Planned(result, ('roles', 'update', fields),
+                            tuple(values[f] for f in fields) + (role_id,))
+
+        if not self.roles[role_id]:
+            raise _Rejected(f"Ruolo già terminato: {role_id}")
+        self.roles[role_id] = False
+        if op == 'end':
+            end_date = values.get('end_date') or date.today().isoformat()
+            return _Planned(result, ('roles', 'end'), (end_date, role_id))
+
+        new_person = values.get('new_person_name')
+        if not new_person:
+            raise _Rejected("'new_person_name' richiesto")
+        self._require(self.persons, new_person, "Persona destinataria non trovata")
+        transfer_date = values.get('transfer_date') or date.today().isoformat()
+        return _Planned(result, ('roles', 'transfer'), (transfer_date, role_id),
+                        (new_person, transfer_date, role_id))
+
+    @staticmethod
+    def _require(known: Set[str], name: str, message: str):
+        if name not in known:
+            raise _Rejected(f"{message}: {name}")
+
+    def _claim_unique(self, name: str, values: Dict):
+        """employee_id ed email liberi (o già della stessa persona)"""
+        for column, owners, label in (('employee_id', self.employee_ids, "Employee ID"),
+                                      ('email', self.emails, "Email")):
+            value = values.get(column)
+            if value and owners.get(value, name) != name:
+                raise _Rejected(f"{label} già in uso: {value}")
+        for column, owners in (('employee_id', self.employee_ids), ('email', self.emails)):
+            if values.get(column):
+                owners[values[column]] = name
+
+    # ----------------------------------------------------------------
+    # ESECUZIONE
+    # ----------------------------------------------------------------
+
+    def _execute(self, conn, planned: List[_Planned], isolate: bool):
+        start = 0
+        while start < len(planned):
+            # Gruppo: operazioni consecutive con lo stesso statement
+            end = start + 1
+            while end < len(planned) and planned[end].group == planned[start].group:
+                end += 1
+            self._run_group(conn, planned[start:end], isolate)
+            start = end
+
+    def _run_group(self, conn, group: List[_Planned], isolate: bool):
+        handler = self._handler(group[0].group)
+        if self.atomic or not isolate:
+            try:
+                handler(conn, group)
+            except sqlite3.Error as e:
+                if not self.atomic:
+                    raise _Retry()
+                self._fail(group, e)
+                raise _Aborted()
+            self._succeed(group)
+            return
+
+        conn.execute("SAVEPOINT batch_group")
+        try:
+            handler(conn, group)
+        except sqlite3.Error as e:
+            conn.execute("ROLLBACK TO batch_group")
+            conn.execute("RELEASE batch_group")
+            if len(group) == 1:
+                self._fail(group, e)
+                return
+            # Si ripete un'operazione alla volta per isolare quelle in errore
+            for item in group:
+                self._run_group(conn, [item], isolate)
+            return
+        conn.execute("RELEASE batch_group")
+        self._succeed(group)
+
+    @staticmethod
+    def _fail(group: List[_Planned], error: Exception):
+        message = f"Errore database: {error}" if len(group) == 1 else \
+            f"Errore database nel gruppo di {len(group)} operazioni: {error}"
+        for item in group:
+            item.result.message = message
+
+    @staticmethod
+    def _succeed(group: List[_Planned]):
+        for item in group:
+            item.result.success = True
+            item.result.message = _DONE[item.group[:2]]
+
+    def _handler(self, group: Tuple) -> Callable:
+        entity, op = group[:2]
+        if op == 'update':
+            return self._update
+        return getattr(self, f"_{op}_{entity}")
+
+    @staticmethod
+    def _inserted_ids(conn, group: List[_Planned]):
+        """Id assegnati da un executemany di INSERT: consecutivi sotto il lock di scrittura"""
+        last = conn.execute("SELECT last_insert_rowid()").fetchone()[0]
+        for offset, item in enumerate(reversed(group)):
+            item.result.id = last - offset
+
+    def _create_persons(self, conn, group: List[_Planned]):
+        conn.executemany(PERSON_INSERT, [item.params for item in group])
+        self._inserted_ids(conn, group)
+        aliases = [(item.params[0], alias) for item in group for alias in item.extra]
+        if aliases:
+            conn.executemany(PERSON_ALIAS_INSERT, aliases)
+        self.db.notify_change('persons', [item.params[0] for item in group])
+
+    def _create_functions(self, conn, group: List[_Planned]):
+        conn.executemany(FUNCTION_INSERT, [item.params for item in group])
+        self._inserted_ids(conn, group)
+        self.db.notify_change('functions', [item.params[0] for item in group])
+
+    def _create_job_titles(self, conn, group: List[_Planned]):
+        conn.executemany(JOB_TITLE_INSERT, [item.params for item in group])
+        self._inserted_ids(conn, group)
+
+    def _create_roles(self, conn, group: List[_Planned]):
+        conn.executemany(ROLE_INSERT, [item.params for item in group])
+        self._inserted_ids(conn, group)
+        self.db.notify_change('roles')
+
+    def _update(self, conn, group: List[_Planned]):
+        entity, _, fields = group[0].group
+        assignments = [f"{name} = ?{i}" for i, name in enumerate(fields, start=1)]
+        if entity == 'roles' and 'reports_to' in fields:
+            # Come update_role: manager_id nello stesso UPDATE
+            position = fields.index('reports_to') + 1
+            assignments.append(f"manager_id = (SELECT id FROM persons WHERE name = ?{position})")
+        query = (f"UPDATE {entity} SET {', '.join(assignments)}, updated_at = CURRENT_TIMESTAMP "
+                 f"WHERE {_KEY_COLUMN[entity]} = ?{len(fields) + 1}")
+        conn.executemany(query, [item.params for item in group])
+        keys = [item.params[-1] for item in group]
+        if entity == 'persons':
+            self.db.notify_change('persons', keys)
+            if 'status' in fields:
+                self.db.notify_change('person_status', keys)
+        else:
+            self.db.notify_change(entity, None if entity == 'roles' else keys)
+
+    def _end_roles(self, conn, group: List[_Planned]):
+        conn.executemany(ROLE_END, [item.params for item in group])
+        self.db.notify_change('roles')
+
+    def _transfer_roles(self, conn, group: List[_Planned]):
+        self._end_roles(conn, group)
+        # Il nuovo ruolo copia l'originale con la persona destinataria
+        conn.executemany("""
+            INSERT INTO roles (person_name, function_name, organizational_unit,
+                               job_title_name, percentage, ad_interim, reports_to,
+                               start_date, flags, person_id, function_id, manager_id)
+            SELECT ?1, function_name, organizational_unit, job_title_name, percentage,
+                   ad_interim, reports_to, ?2, flags,
+                   (SELECT id FROM persons WHERE name = ?1), function_id, manager_id
+            FROM roles WHERE id = ?3
+        """, [item.extra for item in group])
+        self._inserted_ids(conn, group)
+
+
+_NOT_FOUND = {'persons': "Dipendente non trovato", 'functions': "Funzione non trovata",
+              'job_titles': "Job title non trovato"}
+_EXISTS = {'persons': "Dipendente già esistente", 'functions': "Funzione già esistente",
+           'job_titles': "Job title già esistente"}
+
+_DONE = {
+    ('persons', 'create'): "Dipendente creato",
+    ('persons', 'update'): "Dipendente aggiornato",
+    ('functions', 'create'): "Funzione creata",
+    ('functions', 'update'): "Funzione aggiornata",
+    ('job_titles', 'create'): "Job title creato",
+    ('job_titles', 'update'): "Job title aggiornato",
+    ('roles', 'create'): "Ruolo creato",
+    ('roles', 'update'): "Ruolo aggiornato",
+    ('roles', 'end'): "Ruolo terminato",
+    ('roles', 'transfer'): "Ruolo trasferito",
+}
+
+
+# ================================================================
+# NORMALIZZAZIONE VALORI
+# ================================================================
+
+def _text(value) -> Optional[str]:
+    if value is None:
+        return None
+    return str(value).strip() or None
+
+
+def _clean(name: str, value):
+    """Valore di un campo nel formato salvato nel database"""
+    if name == 'aliases':
+        return value
+    if name in ('hire_date', 'start_date', 'end_date', 'transfer_date'):
+        text = _text(value)
+        if text is None:
+            return None
+        try:
+            return date.fromisoformat(text[:10]).isoformat()
+        except ValueError:
+            raise _Rejected(f"{name} non valida: {value}")
+    if name == 'percentage':
+        if value is None:
+            return None
+        try:
+            percentage = float(value)
+        except (TypeError, ValueError):
+            raise _Rejected(f"Percentuale non valida: {value}")
+        if not math.isfinite(percentage) or percentage <= 0 or percentage > 1:
+            raise _Rejected("Percentuale deve essere tra 0.01 e 1.0")
+        return percentage
+    if name == 'level':
+        if value is None or value == '':
+            return None
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            raise _Rejected(f"Livello non valido: {value}")
+    if name == 'ad_interim':
+        if isinstance(value, str):
+            return value.strip().lower() in ('1', 'true', 'yes', 'si', 'sì', 'y')
+        return None if value is None else bool(value)
+    if name == 'status':
+        text = _text(value)
+        return text.upper() if text else None
+    return _text(value)
+
+
+def _check_shape(key, data):
+    """'data' oggetto di valori semplici ('aliases' lista di valori semplici), 'key' semplice"""
+    if not isinstance(key, _SCALARS):
+        raise _Rejected("'key' deve essere un valore semplice")
+    if not isinstance(data, dict):
+        raise _Rejected("'data' deve essere un oggetto")
+    for name, value in data.items():
+        if name == 'aliases' and isinstance(value, list):
+            value = next((alias for alias in value if not isinstance(alias, _SCALARS)), None)
+        if not isinstance(value, _SCALARS):
+            raise _Rejected(f"Campo '{name}': valore non ammesso")
+
+
+def _check(entity: str, values: Dict, partial: bool = False):
+    errors = _VALIDATORS[entity](values, partial)
+    if errors:
+        raise _Rejected("; ".join(errors))
+
+
+def _fields(entity: str, values: Dict) -> Tuple[str, ...]:
+    """Campi aggiornati in ordine fisso: stessi campi, stesso statement"""
+    return tuple(name for name in UPDATE_FIELDS[entity] if name in values)
+
+
+def _role_id(value) -> Optional[int]:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _rows(conn, query: str, values: Iterable) -> List[tuple]:
+    """Righe di una query con IN (...) sui valori dati, a blocchi"""
+    values = list({value.strip() if isinstance(value, str) else value for value in values}
+                  - {None, ''})
+    rows = []
+    for start in range(0, len(values), _IN_CHUNK):
+        chunk = values[start:start + _IN_CHUNK]
+        rows.extend(conn.execute(query.format(", ".join("?" * len(chunk))), chunk))
+    return [tuple(row) for row in rows]
+
+
+def _existing(conn, query: str, values: Iterable) -> Set[str]:
+    return {row[0] for row in _rows(conn, query, values)}
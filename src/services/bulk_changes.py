@@ -0,0 +1,84 @@
+# src/services/bulk_changes.py - Letture di mappature per i cambi in blocco (manager, terminazioni)
+import codecs
+import csv
+import io
+from datetime import date
+from typing import IO, Dict, Iterable, Iterator, List, Optional, Tuple
+
+MANAGER_COLUMNS = ('old_manager', 'new_manager')
+TERMINATION_COLUMNS = ('person_name', 'termination_date')
+
+
+class BulkChangeError(Exception):
+    """Mappatura non valida (riga malformata, data errata, nome ripetuto)"""
+    pass
+
+
+def text_lines(stream: IO) -> Iterator[str]:
+    """Righe di un file caricato (UTF-8, BOM tollerato)"""
+    if not isinstance(stream, io.TextIOBase):
+        stream = codecs.getreader('utf-8-sig')(stream)
+    return iter(stream)
+
+
+def _rows(lines: Iterable[str], columns: Tuple[str, ...]) -> Iterator[Tuple[int, List[str]]]:
+    """Righe CSV non vuote come (numero riga, valori nell'ordine di columns).
+
+    Separatore dedotto dal contenuto (';', tab o ','); un'intestazione
+    con i nomi delle colonne è facoltativa e può cambiarne l'ordine.
+    """
+    lines = [line for line in lines if line.strip()]
+    if not lines:
+        return
+    delimiter = next((d for d in (';', '\t', ',') if any(d in line for line in lines)), ',')
+    reader = csv.reader(lines, delimiter=delimiter)
+    order = list(range(len(columns)))
+    for line_no, row in enumerate(reader, start=1):
+        row = [value.strip() for value in row]
+        if line_no == 1:
+            header = [value.lower() for value in row]
+            if columns[0] in header:
+                order = [header.index(name) if name in header else None for name in columns]
+                continue
+        yield line_no, [row[i] if i is not None and i < len(row) else '' for i in order]
+
+
+def _add_change(changes: Dict[str, str], old: str, new: str, where: str):
+    old, new = (old or '').strip(), (new or '').strip()
+    if not old or not new:
+        raise BulkChangeError(f"{where}: indicare vecchio e nuovo manager")
+    if changes.get(old, new) != new:
+        raise BulkChangeError(f"{where}: {old} ha più di un nuovo manager")
+    if old != new:
+        changes[old] = new
+
+
+def manager_changes(pairs: Iterable[Tuple[str, str]]) -> Dict[str, str]:
+    """Mappatura vecchio -> nuovo manager; scarta le coppie che non cambiano nulla"""
+    changes: Dict[str, str] = {}
+    for position, (old, new) in enumerate(pairs, start=1):
+        _add_change(changes, old, new, f"Cambio {position}")
+    return changes
+
+
+def read_manager_changes(lines: Iterable[str]) -> Dict[str, str]:
+    """CSV old_manager,new_manager (o due colonne senza intestazione)"""
+    changes: Dict[str, str] = {}
+    for line_no, (old, new) in _rows(lines, MANAGER_COLUMNS):
+        _add_change(changes, old, new, f"Riga {line_no}")
+    return changes
+
+
+def read_terminations(lines: Iterable[str]) -> Dict[str, Optional[date]]:
+    """CSV person_name[,termination_date]: persona -> data (None = data predefinita)"""
+    terminations: Dict[str, Optional[date]] = {}
+    for line_no, (name, when) in _rows(lines, TERMINATION_COLUMNS):
+        if not name:
+            raise BulkChangeError(f"Riga {line_no}: nome dipendente mancante")
+        if name in terminations:
+            raise BulkChangeError(f"Riga {line_no}: {name} indicato più di una volta")
+        try:
+            terminations[name] = date.fromisoformat(when[:10]) if when else None
+        except ValueError:
+            raise BulkChangeError(f"Riga {line_no}: data non valida: {when}")
+    return terminations
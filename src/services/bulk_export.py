@@ -0,0 +1,201 @@
+# src/services/bulk_export.py - Export in streaming (NDJSON / CSV) a memoria costante
+import csv
+import io
+import json
+import os
+import sqlite3
+import threading
+from typing import Iterator, List, Optional
+
+from ..database.connection import DatabaseConnection
+from .history_archive import HISTORY_COLUMNS, HistoryArchive
+
+# Sorgenti esportabili: tabella o vista con ordinamento stabile
+EXPORT_QUERIES = {
+    'functions': "SELECT * FROM functions ORDER BY name",
+    'job_titles': "SELECT * FROM job_titles ORDER BY name",
+    'persons': "SELECT * FROM persons ORDER BY name",
+    'roles': "SELECT * FROM roles ORDER BY id",
+    # Seguono le righe degli archivi annuali (vedi ExportStream)
+    'role_history': f"SELECT {HISTORY_COLUMNS} FROM role_history ORDER BY id",
+    # La vista ha già il suo ORDER BY (livello, funzione, persona)
+    'organization_chart': "SELECT * FROM organization_chart",
+}
+
+EXPORT_ENTITIES = tuple(EXPORT_QUERIES)
+EXPORT_FORMATS = ('ndjson', 'csv')
+
+MEDIA_TYPES = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+
+class BulkExportError(Exception):
+    """Richiesta di export non valida"""
+    pass
+
+
+class ExportStream:
+    """Cursore di export su uno snapshot, letto un blocco alla volta.
+
+    Ogni blocco può essere prodotto da un thread diverso (executor,
+    threadpool di Starlette): la connessione è presa dal pool di sola
+    lettura senza legarla al thread e la lettura è protetta da un lock.
+
+    Per role_history, dopo la tabella principale si leggono gli archivi
+    annuali dal più vecchio, saltando le righe ancora presenti nello
+    snapshot (archiviazione interrotta o in corso).
+    """
+
+    def __init__(self, db: DatabaseConnection, entity: str, fmt: str, chunk_size: int):
+        self.db = db
+        self.entity = entity
+        self.fmt = fmt
+        self.chunk_size = chunk_size
+        self.rows = 0
+        self._lock = threading.Lock()
+        self._busy = False
+        self._header_sent = False
+        self._archives = ([path for _, path in reversed(HistoryArchive(db).archives())]
+                          if entity == 'role_history' else [])
+        self._archive_conn: Optional[sqlite3.Connection] = None
+        self._conn = db.open_snapshot()
+        try:
+            self._cursor = self._conn.execute(EXPORT_QUERIES[entity])
+        except Exception:
+            db.release_snapshot(self._conn)
+            raise
+        self.columns: List[str] = [col[0] for col in self._cursor.description]
+
+    def next_chunk(self) -> Optional[bytes]:
+        """Prossimo blocco codificato (None a fine dati)"""
+        with self._lock:
+            if self._conn is None:
+                return None
+            self._busy = True
+            try:
+                rows = self._fetch()
+            finally:
+                self._busy = False
+            if not rows:
+                self._close_locked()
+                if self.fmt == 'csv' and not self._header_sent:
+                    return self._encode_csv([])
+                return None
+            self.rows += len(rows)
+            if self.fmt == 'csv':
+                return self._encode_csv(rows)
+            return self._encode_ndjson(rows)
+
+    def _fetch(self) -> list:
+        while True:
+            rows = self._cursor.fetchmany(self.chunk_size)
+            if not rows:
+                if not self._open_next_archive():
+                    return rows
+                continue
+            if self._archive_conn is not None:
+                rows = self._not_in_snapshot(rows)
+                if not rows:
+                    continue
+            return rows
+
+    def _open_next_archive(self) -> bool:
+        """Passa il cursore al prossimo archivio annuale (False se finiti)"""
+        if not self._archives:
+            return False
+        self._cursor.close()
+        self._close_archive()
+        path = self._archives.pop(0)
+        self._archive_conn = sqlite3.connect(f"file:{os.path.abspath(path)}?mode=ro",
+                                             uri=True, check_same_thread=False)
+        self._cursor = self._archive_conn.execute(
+            f"SELECT {HISTORY_COLUMNS} FROM role_history ORDER BY id")
+        return True
+
+    def _not_in_snapshot(self, rows) -> list:
+        ids = [row[0] for row in rows]
+        present = set()
+        # A blocchi: le build SQLite meno recenti ammettono 999 parametri
+        for start in range(0, len(ids), 500):
+            part = ids[start:start + 500]
+            present.update(row[0] for row in self._conn.execute(
+                f"SELECT id FROM role_history WHERE id IN ({', '.join('?' for _ in part)})", part))
+        return [row for row in rows if row[0] not in present] if present else rows
+
+    def _close_archive(self):
+        if self._archive_conn is not None:
+            self._archive_conn.close()
+            self._archive_conn = None
+
+    def _encode_ndjson(self, rows) -> bytes:
+        columns = self.columns
+        dumps = json.dumps
+        lines = [dumps(dict(zip(columns, row)), ensure_ascii=False) for row in rows]
+        lines.append('')
+        return '\n'.join(lines).encode('utf-8')
+
+    def _encode_csv(self, rows) -> bytes:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        if not self._header_sent:
+            writer.writerow(self.columns)
+            self._header_sent = True
+        writer.writerows(rows)
+        return buffer.getvalue().encode('utf-8')
+
+    def close(self):
+        """Chiude lo snapshot (anche a export interrotto dal client)"""
+        if self._busy and self._conn is not None:
+            # Un blocco è in lettura in un altro thread: lo interrompe
+            (self._archive_conn or self._conn).interrupt()
+        with self._lock:
+            self._close_locked()
+
+    def _close_locked(self):
+        if self._conn is None:
+            return
+        self._cursor.close()
+        self._close_archive()
+        self._archives = []
+        self.db.release_snapshot(self._conn)
+        self._conn = None
+
+    def __iter__(self) -> Iterator[bytes]:
+        try:
+            while True:
+                chunk = self.next_chunk()
+                if chunk is None:
+                    return
+                yield chunk
+        finally:
+            self.close()
+
+
+class BulkExporter:
+    """Export di tabelle e viste senza materializzare il risultato.
+
+    Le righe vengono lette con fetchmany e codificate a blocchi, quindi la
+    memoria usata non dipende dal numero di righe esportate.
+
+        exporter = BulkExporter(db)
+        for chunk in exporter.open('persons', 'ndjson'):
+            out.write(chunk)
+    """
+
+    def __init__(self, db: DatabaseConnection, chunk_size: int = 1000):
+        self.db = db
+        self.chunk_size = chunk_size
+
+    def open(self, entity: str, fmt: str = 'ndjson') -> ExportStream:
+        """Apre un export su uno snapshot coerente del database"""
+        if entity not in EXPORT_QUERIES:
+            raise BulkExportError(
+                f"Entità non esportabile: {entity} (ammesse: {', '.join(EXPORT_ENTITIES)})"
+            )
+        if fmt not in EXPORT_FORMATS:
+            raise BulkExportError(
+                f"Formato non supportato: {fmt} (ammessi: {', '.join(EXPORT_FORMATS)})"
+            )
+        return ExportStream(self.db, entity, fmt, self.chunk_size)
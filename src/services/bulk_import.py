@@ -0,0 +1,610 @@
+# src/services/bulk_import.py - Import massivo in streaming (CSV / JSON / NDJSON)
+import codecs
+import csv
+import io
+import json
+import time
+import logging
+from dataclasses import dataclass, field
+from datetime import date
+from typing import IO, Dict, Iterator, List, Optional, Set, Tuple
+
+from ..database.connection import DatabaseConnection
+from ..database.migrations import (FUNCTION_CLOSURE_TRIGGERS, ID_SYNC_TRIGGERS, SEARCH_TRIGGERS,
+                                   backfill_surrogate_ids, rebuild_function_closure,
+                                   rebuild_search_index)
+
+# Colonne accettate per entità, nell'ordine usato per l'INSERT
+ENTITY_COLUMNS: Dict[str, Tuple[str, ...]] = {
+    'functions': ('name', 'reports_to', 'flags'),
+    'job_titles': ('name', 'level', 'flags'),
+    'persons': ('name', 'email', 'employee_id', 'hire_date', 'status', 'flags'),
+    'person_aliases': ('person_name', 'alias', 'flags'),
+    'function_aliases': ('function_name', 'alias', 'flags'),
+    'roles': ('person_name', 'function_name', 'organizational_unit', 'job_title_name',
+              'percentage', 'ad_interim', 'reports_to', 'start_date', 'end_date', 'flags'),
+}
+
+ENTITIES = tuple(ENTITY_COLUMNS)
+FORMATS = ('csv', 'json', 'ndjson')
+
+_ENTITY_ALIASES = {
+    'function': 'functions', 'job_title': 'job_titles', 'person': 'persons',
+    'person_alias': 'person_aliases', 'function_alias': 'function_aliases', 'role': 'roles',
+}
+
+_INSERT_VERB = {
+    # Gli alias hanno PK composta: i duplicati si ignorano
+    'person_aliases': 'INSERT OR IGNORE',
+    'function_aliases': 'INSERT OR IGNORE',
+}
+
+VALID_STATUSES = ('ACTIVE', 'INACTIVE', 'TERMINATED')
+
+# Indici dei ruoli ricostruiti solo se l'import vale almeno questa quota dei ruoli esistenti
+INDEX_REBUILD_RATIO = 0.5
+
+
+class BulkImportError(Exception):
+    """Errore bloccante durante l'import (formato non valido, vincoli violati)"""
+    pass
+
+
+class _RowRejected(Exception):
+    """Riga scartata in validazione"""
+    pass
+
+
+class _Unresolved(Exception):
+    """Riga che riferisce un nome non (ancora) noto"""
+    pass
+
+
+@dataclass
+class ImportReport:
+    """Esito di un import massivo"""
+    inserted: Dict[str, int] = field(default_factory=dict)
+    rejected: Dict[str, int] = field(default_factory=dict)
+    errors: List[str] = field(default_factory=list)
+    elapsed: float = 0.0
+
+    @property
+    def total_inserted(self) -> int:
+        return sum(self.inserted.values())
+
+    @property
+    def rows_per_sec(self) -> float:
+        return self.total_inserted / self.elapsed if self.elapsed > 0 else 0.0
+
+    def to_dict(self) -> Dict:
+        return {
+            'inserted': self.inserted,
+            'rejected': self.rejected,
+            'total_inserted': self.total_inserted,
+            'total_rejected': sum(self.rejected.values()),
+            'errors': self.errors,
+            'elapsed_seconds': round(self.elapsed, 3),
+            'rows_per_sec': round(self.rows_per_sec, 1),
+        }
+
+
+# ================================================================
+# LETTORI IN STREAMING
+# ================================================================
+
+def _normalize_entity(name: Optional[str]) -> Optional[str]:
+    if not name:
+        return None
+    key = name.strip().lower().replace('-', '_')
+    key = _ENTITY_ALIASES.get(key, key)
+    if key not in ENTITY_COLUMNS:
+        raise BulkImportError(f"Entità sconosciuta: {name}")
+    return key
+
+
+def _text_stream(stream: IO) -> IO[str]:
+    """Garantisce uno stream di testo (UTF-8, BOM tollerato)"""
+    if isinstance(stream, io.TextIOBase):
+        return stream
+    return codecs.getreader('utf-8-sig')(stream)
+
+
+class _JsonStreamReader:
+    """Decodifica incrementale di array/oggetti JSON senza caricare tutto il file"""
+
+    def __init__(self, stream: IO[str], chunk_size: int = 1 << 16):
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self) -> bool:
+        if self.eof:
+            return False
+        chunk = self.stream.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        # Compatta il buffer già consumato
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        """Primo carattere significativo (salta spazi), '' a fine stream"""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in ' \t\r\n':
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return ''
+
+    def expect(self, char: str):
+        found = self.peek()
+        if found != char:
+            raise BulkImportError(f"JSON non valido: atteso '{char}', trovato '{found or 'EOF'}'")
+        self.pos += 1
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                obj, end = self.decoder.raw_decode(self.buf, self.pos)
+                # Un numero a fine buffer potrebbe continuare nel chunk successivo
+                if end < len(self.buf) or self.eof:
+                    self.pos = end
+                    return obj
+            except json.JSONDecodeError as e:
+                if self.eof:
+                    raise BulkImportError(f"JSON non valido: {e}")
+            if not self._fill():
+                self.eof = True
+
+    def array(self) -> Iterator:
+        self.expect('[')
+        if self.peek() == ']':
+            self.pos += 1
+            return
+        while True:
+            yield self.value()
+            sep = self.peek()
+            self.pos += 1
+            if sep == ']':
+                return
+            if sep != ',':
+                raise BulkImportError(f"JSON non valido: atteso ',' o ']', trovato '{sep or 'EOF'}'")
+
+
+def iter_records(stream: IO, fmt: str,
+                 entity: Optional[str] = None) -> Iterator[Tuple[str, Dict]]:
+    """Produce coppie (entità, record) leggendo lo stream un pezzo alla volta.
+
+    - csv: una sola entità, indicata da `entity`
+    - ndjson: un oggetto per riga; l'entità è `entity` o il campo "entity"
+    - json: array di record oppure oggetto {"persons": [...], "roles": [...]}
+    """
+    entity = _normalize_entity(entity)
+    text = _text_stream(stream)
+
+    if fmt == 'csv':
+        if not entity:
+            raise BulkImportError("Per il formato CSV è necessario indicare l'entità")
+        for row in csv.DictReader(text):
+            yield entity, row
+
+    elif fmt == 'ndjson':
+        for line_no, line in enumerate(text, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise BulkImportError(f"Riga {line_no}: JSON non valido ({e})")
+            yield _record_entity(record, entity), record
+
+    elif fmt == 'json':
+        reader = _JsonStreamReader(text)
+        first = reader.peek()
+        if first == '[':
+            for record in reader.array():
+                yield _record_entity(record, entity), record
+        elif first == '{':
+            reader.expect('{')
+            while reader.peek() != '}':
+                key = _normalize_entity(reader.value())
+                reader.expect(':')
+                for record in reader.array():
+                    yield key, record  # type: ignore[misc]
+                if reader.peek() == ',':
+                    reader.pos += 1
+            reader.expect('}')
+        else:
+            raise BulkImportError("JSON non valido: atteso un array o un oggetto")
+
+    else:
+        raise BulkImportError(f"Formato non supportato: {fmt}")
+
+
+def _record_entity(record, entity: Optional[str]) -> str:
+    if not isinstance(record, dict):
+        raise BulkImportError(f"Record non valido (atteso oggetto): {str(record)[:80]}")
+    own = record.pop('entity', None) or record.pop('type', None)
+    resolved = entity or _normalize_entity(own)
+    if not resolved:
+        raise BulkImportError("Record senza entità: usare il campo 'entity' o indicarla")
+    return resolved
+
+
+def guess_format(filename: Optional[str]) -> Optional[str]:
+    """Deduce il formato dall'estensione del file"""
+    if not filename:
+        return None
+    lower = filename.lower()
+    for ext, fmt in (('.ndjson', 'ndjson'), ('.jsonl', 'ndjson'),
+                     ('.json', 'json'), ('.csv', 'csv')):
+        if lower.endswith(ext):
+            return fmt
+    return None
+
+
+# ================================================================
+# IMPORTER
+# ================================================================
+
+class BulkImporter:
+    """Import massivo ad alto throughput.
+
+    Le righe vengono validate contro insiemi di nomi in memoria (niente
+    query di controllo per riga), accumulate in batch e scritte con
+    executemany in un'unica transazione. Il trigger di audit sui ruoli
+    viene sospeso durante il caricamento e lo storico viene scritto con
+    un solo INSERT ... SELECT finale.
+    """
+
+    def __init__(self, db: DatabaseConnection, batch_size: int = 5000,
+                 max_errors: int = 100, strict: bool = False,
+                 rebuild_indexes: Optional[bool] = None):
+        self.db = db
+        self.batch_size = batch_size
+        self.max_errors = max_errors
+        self.strict = strict
+        # None = automatico (in base ai ruoli già presenti), True/False = forzato
+        self.rebuild_indexes = rebuild_indexes
+
+    def import_stream(self, stream: IO, fmt: str,
+                      entity: Optional[str] = None) -> ImportReport:
+        """Importa tutti i record dello stream in una transazione"""
+        return self.import_records(iter_records(stream, fmt, entity))
+
+    def import_records(self, records: Iterator[Tuple[str, Dict]]) -> ImportReport:
+        report = ImportReport(
+            inserted={name: 0 for name in ENTITIES},
+            rejected={name: 0 for name in ENTITIES},
+        )
+        started = time.perf_counter()
+
+        with self.db.get_connection() as conn:
+            # Le FK sono già validate in memoria sotto il lock di scrittura:
+            # il controllo per riga di SQLite sarebbe solo lavoro duplicato.
+            # (foreign_keys si può cambiare solo fuori da una transazione)
+            standalone = not conn.in_transaction
+            if standalone:
+                conn.execute("PRAGMA foreign_keys = OFF")
+            try:
+                self._run_import(conn, records, report)
+            finally:
+                if standalone:
+                    conn.execute("PRAGMA foreign_keys = ON")
+
+        report.elapsed = time.perf_counter() - started
+        logging.info(f"Import completato: {report.total_inserted} righe in "
+                     f"{report.elapsed:.2f}s ({report.rows_per_sec:.0f} righe/s)")
+        return report
+
+    def _run_import(self, conn, records: Iterator[Tuple[str, Dict]], report: ImportReport):
+        with self.db.transaction():
+            # Se l'import è annidato in un'altra transazione le FK restano attive:
+            # si verificano al commit, così l'ordine delle righe nei batch è libero
+            conn.execute("PRAGMA defer_foreign_keys = ON")
+            self._load_known(conn)
+            audit_trigger = self._suspend_role_audit(conn)
+            # Gli id interi si allineano alla fine con un UPDATE per tabella
+            sync_triggers = self._suspend_triggers(conn, ID_SYNC_TRIGGERS)
+            # Anche l'indice di ricerca: ricostruito una volta sola alla fine
+            search_triggers = self._suspend_triggers(conn, SEARCH_TRIGGERS)
+            closure_triggers = self._suspend_triggers(conn, FUNCTION_CLOSURE_TRIGGERS)
+            max_role_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM roles").fetchone()[0]
+            self._existing_roles = conn.execute("SELECT COUNT(*) FROM roles").fetchone()[0]
+            self._dropped_indexes: List[str] = []
+
+            batches: Dict[str, List[tuple]] = {name: [] for name in ENTITIES}
+            pending: List[Tuple[str, Dict, int]] = []
+
+            for line_no, (entity, record) in enumerate(records, start=1):
+                self._accept(conn, entity, record, line_no, batches, pending, report)
+
+            # Righe che riferivano nomi comparsi più avanti nello stream:
+            # si ripassano finché qualcuna si risolve (es. catene di funzioni)
+            while pending:
+                retry, pending = pending, []
+                for entity, record, line_no in retry:
+                    self._accept(conn, entity, record, line_no, batches, pending, report)
+                if len(pending) == len(retry):
+                    for entity, record, line_no in pending:
+                        self._accept(conn, entity, record, line_no, batches, None, report)
+                    break
+
+            for entity in ENTITIES:
+                self._flush(conn, entity, batches, report)
+
+            backfill_surrogate_ids(conn)
+            for trigger_sql in sync_triggers:
+                conn.execute(trigger_sql)
+
+            # Gerarchia ricalcolata una volta, dopo l'allineamento degli id padre
+            if report.inserted['functions']:
+                rebuild_function_closure(conn)
+            for trigger_sql in closure_triggers:
+                conn.execute(trigger_sql)
+
+            if any(count for entity, count in report.inserted.items() if entity != 'roles'):
+                rebuild_search_index(conn)
+            if report.inserted['persons'] or report.inserted['person_aliases']:
+                # Cache in memoria sulle persone (typeahead): ricostruite dopo il commit
+                self.db.notify_change('persons')
+            for entity in ('functions', 'roles'):
+                if report.inserted[entity]:
+                    # Pagine renderizzate in cache (organigramma, funzioni)
+                    self.db.notify_change(entity)
+            for trigger_sql in search_triggers:
+                conn.execute(trigger_sql)
+
+            # Ricostruire un indice a fine caricamento costa meno che
+            # aggiornarlo riga per riga
+            for index_sql in self._dropped_indexes:
+                conn.execute(index_sql)
+
+            if audit_trigger:
+                self._write_role_history(conn, max_role_id)
+                conn.execute(audit_trigger)
+
+            if self.strict and any(report.rejected.values()):
+                raise BulkImportError(
+                    f"Import annullato: {sum(report.rejected.values())} righe non valide "
+                    f"({'; '.join(report.errors[:5])})"
+                )
+
+    # ----------------------------------------------------------------
+
+    def _load_known(self, conn):
+        """Carica in memoria i nomi già presenti per validare le FK"""
+        def names(query):
+            return {row[0] for row in conn.execute(query) if row[0] is not None}
+
+        self.functions: Set[str] = names("SELECT name FROM functions")
+        self.job_titles: Set[str] = names("SELECT name FROM job_titles")
+        self.persons: Set[str] = names("SELECT name FROM persons")
+        self.employee_ids: Set[str] = names("SELECT employee_id FROM persons")
+        self.emails: Set[str] = names("SELECT email FROM persons")
+
+    def _suspend_role_audit(self, conn) -> Optional[str]:
+        """Rimuove (nella transazione) il trigger di audit sugli insert dei ruoli"""
+        row = conn.execute(
+            "SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = 'role_audit_insert'"
+        ).fetchone()
+        if not row:
+            return None
+        conn.execute("DROP TRIGGER role_audit_insert")
+        return row[0]
+
+    def _suspend_triggers(self, conn, names) -> List[str]:
+        """Rimuove (nella transazione) i trigger indicati, restituendone l'SQL"""
+        placeholders = ", ".join("?" for _ in names)
+        rows = conn.execute(
+            f"SELECT name, sql FROM sqlite_master WHERE type = 'trigger' AND name IN ({placeholders})",
+            tuple(names)
+        ).fetchall()
+        for name, _ in rows:
+            conn.execute(f"DROP TRIGGER {name}")
+        return [sql for _, sql in rows]
+
+    def _suspend_role_indexes(self, conn):
+        """Rimuove (nella transazione) gli indici secondari dei ruoli, ricreati a fine import"""
+        rows = conn.execute(
+            "SELECT name, sql FROM sqlite_master "
+            "WHERE type = 'index' AND tbl_name = 'roles' AND sql IS NOT NULL"
+        ).fetchall()
+        for name, sql in rows:
+            conn.execute(f"DROP INDEX {name}")
+            self._dropped_indexes.append(sql)
+
+    def _write_role_history(self, conn, max_role_id: int):
+        """Storico dei ruoli importati con un solo statement set-based"""
+        conn.execute("""
+            INSERT INTO role_history (
+                role_id, person_name, function_name, organizational_unit,
+                job_title_name, percentage, ad_interim, reports_to,
+                start_date, end_date, action, flags
+            )
+            SELECT id, person_name, function_name, organizational_unit,
+                   job_title_name, percentage, ad_interim, reports_to,
+                   start_date, end_date, 'INSERT', flags
+            FROM roles WHERE id > ?
+        """, (max_role_id,))
+
+    def _accept(self, conn, entity, record, line_no, batches, pending, report):
+        try:
+            row = self._validate(entity, record)
+        except _Unresolved as e:
+            if pending is not None:
+                pending.append((entity, record, line_no))
+                return
+            self._reject(report, entity, line_no, str(e))
+            return
+        except _RowRejected as e:
+            self._reject(report, entity, line_no, str(e))
+            return
+
+        batch = batches[entity]
+        batch.append(row)
+        if len(batch) >= self.batch_size:
+            if entity == 'roles' and not self._dropped_indexes and self._rebuild_role_indexes(
+                    report.inserted['roles'] + len(batch)):
+                self._suspend_role_indexes(conn)
+            self._flush(conn, entity, batches, report)
+
+    def _rebuild_role_indexes(self, incoming: int) -> bool:
+        """Conviene ricostruire gli indici dei ruoli invece di aggiornarli?
+
+        Ricostruire costa come ordinare l'intera tabella: ripaga solo se i
+        ruoli in arrivo sono una quota consistente di quelli già presenti.
+        """
+        if self.rebuild_indexes is not None:
+            return self.rebuild_indexes
+        return incoming >= self._existing_roles * INDEX_REBUILD_RATIO
+
+    def _reject(self, report: ImportReport, entity: str, line_no: int, message: str):
+        report.rejected[entity] += 1
+        if len(report.errors) < self.max_errors:
+            report.errors.append(f"{entity} #{line_no}: {message}")
+
+    def _flush(self, conn, entity: str, batches: Dict[str, List[tuple]], report: ImportReport):
+        batch = batches[entity]
+        if not batch:
+            return
+        columns = ENTITY_COLUMNS[entity]
+        verb = _INSERT_VERB.get(entity, 'INSERT')
+        query = (f"{verb} INTO {entity} ({', '.join(columns)}) "
+                 f"VALUES ({', '.join('?' * len(columns))})")
+        cursor = conn.executemany(query, batch)
+        report.inserted[entity] += cursor.rowcount
+        batches[entity] = []
+
+    # ----------------------------------------------------------------
+    # VALIDAZIONE
+    # ----------------------------------------------------------------
+
+    @staticmethod
+    def _text(record: Dict, key: str) -> Optional[str]:
+        value = record.get(key)
+        if value is None or value == '':
+            return None
+        if type(value) is not str:
+            return str(value)
+        return value.strip() or None
+
+    @staticmethod
+    def _date(value: Optional[str], label: str) -> Optional[str]:
+        if value is None:
+            return None
+        try:
+            return date.fromisoformat(value[:10]).isoformat()
+        except ValueError:
+            raise _RowRejected(f"{label} non valida: {value}")
+
+    def _require(self, record: Dict, key: str) -> str:
+        value = self._text(record, key)
+        if not value:
+            raise _RowRejected(f"campo '{key}' richiesto")
+        return value
+
+    def _validate(self, entity: str, record: Dict) -> tuple:
+        text = self._text
+
+        if entity == 'functions':
+            name = self._require(record, 'name')
+            reports_to = text(record, 'reports_to')
+            if name in self.functions:
+                raise _RowRejected(f"funzione già esistente: {name}")
+            if reports_to and reports_to not in self.functions:
+                raise _Unresolved(f"funzione padre sconosciuta: {reports_to}")
+            self.functions.add(name)
+            return (name, reports_to, text(record, 'flags'))
+
+        if entity == 'job_titles':
+            name = self._require(record, 'name')
+            if name in self.job_titles:
+                raise _RowRejected(f"job title già esistente: {name}")
+            level = text(record, 'level')
+            try:
+                level_value = int(level) if level is not None else None
+            except ValueError:
+                raise _RowRejected(f"livello non valido: {level}")
+            self.job_titles.add(name)
+            return (name, level_value, text(record, 'flags'))
+
+        if entity == 'persons':
+            name = self._require(record, 'name')
+            email = text(record, 'email')
+            employee_id = text(record, 'employee_id')
+            status = (text(record, 'status') or 'ACTIVE').upper()
+            if name in self.persons:
+                raise _RowRejected(f"dipendente già esistente: {name}")
+            if employee_id and employee_id in self.employee_ids:
+                raise _RowRejected(f"employee ID già in uso: {employee_id}")
+            if email and email in self.emails:
+                raise _RowRejected(f"email già in uso: {email}")
+            if status not in VALID_STATUSES:
+                raise _RowRejected(f"status non valido: {status}")
+            hire_date = self._date(text(record, 'hire_date'), 'hire_date')
+            self.persons.add(name)
+            if employee_id:
+                self.employee_ids.add(employee_id)
+            if email:
+                self.emails.add(email)
+            return (name, email, employee_id, hire_date, status, text(record, 'flags'))
+
+        if entity == 'person_aliases':
+            person_name = self._require(record, 'person_name')
+            alias = self._require(record, 'alias')
+            if person_name not in self.persons:
+                raise _Unresolved(f"persona sconosciuta: {person_name}")
+            return (person_name, alias, text(record, 'flags'))
+
+        if entity == 'function_aliases':
+            function_name = self._require(record, 'function_name')
+            alias = self._require(record, 'alias')
+            if function_name not in self.functions:
+                raise _Unresolved(f"funzione sconosciuta: {function_name}")
+            return (function_name, alias, text(record, 'flags'))
+
+        # roles
+        person_name = self._require(record, 'person_name')
+        function_name = self._require(record, 'function_name')
+        job_title_name = text(record, 'job_title_name')
+        reports_to = text(record, 'reports_to')
+        if person_name not in self.persons:
+            raise _Unresolved(f"persona sconosciuta: {person_name}")
+        if function_name not in self.functions:
+            raise _Unresolved(f"funzione sconosciuta: {function_name}")
+        if job_title_name and job_title_name not in self.job_titles:
+            raise _Unresolved(f"job title sconosciuto: {job_title_name}")
+        if reports_to and reports_to not in self.persons:
+            raise _Unresolved(f"responsabile sconosciuto: {reports_to}")
+
+        percentage_raw = text(record, 'percentage')
+        try:
+            percentage = float(percentage_raw) if percentage_raw is not None else 1.0
+        except ValueError:
+            raise _RowRejected(f"percentuale non valida: {percentage_raw}")
+        if percentage <= 0 or percentage > 1:
+            raise _RowRejected("percentuale deve essere tra 0.01 e 1.0")
+
+        interim_raw = record.get('ad_interim')
+        if isinstance(interim_raw, str):
+            ad_interim = interim_raw.strip().lower() in ('1', 'true', 'yes', 'si', 'sì', 'y')
+        else:
+            ad_interim = bool(interim_raw)
+
+        start_date = self._date(text(record, 'start_date'), 'start_date') or date.today().isoformat()
+        end_date = self._date(text(record, 'end_date'), 'end_date')
+        if end_date and end_date < start_date:
+            raise _RowRejected("end_date precedente a start_date")
+
+        return (person_name, function_name, text(record, 'organizational_unit'),
+                job_title_name, percentage, int(ad_interim), reports_to,
+                start_date, end_date, text(record, 'flags'))
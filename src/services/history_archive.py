@@ -0,0 +1,220 @@
+# src/services/history_archive.py - Archiviazione per anno dello storico ruoli (role_history)
+import glob
+import logging
+import os
+import re
+import sqlite3
+import time
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from ..database.connection import DatabaseConnection
+
+# Giorni di storico che restano nel database principale
+DEFAULT_RETENTION_DAYS = 365
+
+HISTORY_COLUMNS = ("id, role_id, person_name, function_name, organizational_unit, "
+                   "job_title_name, percentage, ad_interim, reports_to, start_date, "
+                   "end_date, action, changed_by, change_date, flags")
+
+# Stesse colonne di role_history; l'id resta quello originale
+_ARCHIVE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS {schema}.role_history (
+    id INTEGER PRIMARY KEY,
+    role_id INTEGER,
+    person_name TEXT NOT NULL,
+    function_name TEXT NOT NULL,
+    organizational_unit TEXT,
+    job_title_name TEXT,
+    percentage REAL,
+    ad_interim BOOLEAN,
+    reports_to TEXT,
+    start_date DATE,
+    end_date DATE,
+    action TEXT,
+    changed_by TEXT,
+    change_date DATETIME,
+    flags TEXT(25)
+);
+CREATE INDEX IF NOT EXISTS {schema}.idx_role_history_change_date ON role_history(change_date);
+CREATE INDEX IF NOT EXISTS {schema}.idx_role_history_role_id ON role_history(role_id, change_date);
+"""
+
+ARCHIVE_ALIAS = "history_archive"
+ARCHIVE_FILE = re.compile(r"role_history_(\d{4})\.db$")
+
+# Filtri ammessi nelle letture dello storico: parametro -> condizione
+_HISTORY_FILTERS = {
+    'role_id': "role_id = ?",
+    'person_name': "person_name = ?",
+    'function_name': "function_name = ?",
+    'since': "change_date >= ?",
+    'until': "change_date < ?",
+}
+
+
+@dataclass
+class ArchiveReport:
+    """Esito di un'archiviazione: righe spostate per anno"""
+    cutoff: str
+    archived: Dict[int, int] = field(default_factory=dict)
+    elapsed: float = 0.0
+
+    @property
+    def total_archived(self) -> int:
+        return sum(self.archived.values())
+
+    def to_dict(self) -> Dict:
+        return {
+            'cutoff': self.cutoff,
+            'archived': self.archived,
+            'total_archived': self.total_archived,
+            'elapsed_seconds': round(self.elapsed, 3),
+        }
+
+
+class HistoryArchive:
+    """Storico ruoli diviso fra database principale e un file SQLite per anno.
+
+    Le righe più vecchie della retention vengono spostate (ATTACH + INSERT
+    + DELETE in un'unica transazione per anno) in archive/role_history_AAAA.db
+    accanto al database; le letture con history() partono dalle righe
+    recenti e proseguono negli archivi, dal più recente, solo finché serve.
+
+    Con il database in WAL il commit non è atomico fra i due file: dopo
+    un'interruzione alcune righe possono trovarsi in entrambi. Rilanciare
+    archive() completa lo spostamento e history() non le ripete.
+
+        archive = HistoryArchive(db)
+        report = archive.archive(retention_days=365)
+        rows = archive.history(person_name='Mario Rossi', limit=50)
+    """
+
+    def __init__(self, db: DatabaseConnection, archive_dir: Optional[str] = None):
+        self.db = db
+        self.archive_dir = archive_dir or os.path.join(
+            os.path.dirname(db.db_path) or '.', 'archive')
+
+    def archive_path(self, year: int) -> str:
+        return os.path.join(self.archive_dir, f"role_history_{year}.db")
+
+    def archives(self) -> List[Tuple[int, str]]:
+        """File di archivio presenti, dal più recente"""
+        found = []
+        for path in glob.glob(os.path.join(self.archive_dir, "role_history_*.db")):
+            match = ARCHIVE_FILE.search(path)
+            if match:
+                found.append((int(match.group(1)), path))
+        return sorted(found, reverse=True)
+
+    # ----------------------------------------------------------------
+    # ARCHIVIAZIONE
+    # ----------------------------------------------------------------
+
+    def archive(self, retention_days: int = DEFAULT_RETENTION_DAYS,
+                today: Optional[date] = None) -> ArchiveReport:
+        """Sposta negli archivi annuali le modifiche più vecchie di retention_days"""
+        cutoff = (today or date.today()) - timedelta(days=retention_days)
+        return self.archive_before(cutoff)
+
+    def archive_before(self, cutoff: date) -> ArchiveReport:
+        """Sposta negli archivi annuali le modifiche anteriori a cutoff"""
+        started = time.perf_counter()
+        report = ArchiveReport(cutoff.isoformat())
+        rows = self.db.execute_query(
+            "SELECT DISTINCT CAST(substr(change_date, 1, 4) AS INTEGER) FROM role_history "
+            "WHERE change_date < ?", (report.cutoff,))
+        years = sorted(row[0] for row in rows if row[0])
+        if years:
+            os.makedirs(self.archive_dir, exist_ok=True)
+        for year in years:
+            # Righe dell'anno, senza superare la data limite
+            end = min(f"{year + 1}-01-01", report.cutoff)
+            report.archived[year] = self._move_year(year, f"{year}-01-01", end)
+        report.elapsed = time.perf_counter() - started
+        if report.total_archived:
+            logging.info(f"Storico ruoli archiviato: {report.total_archived} righe "
+                         f"anteriori al {report.cutoff} in {report.elapsed:.2f}s")
+        return report
+
+    def _move_year(self, year: int, start: str, end: str) -> int:
+        condition = "change_date >= ? AND change_date < ?"
+        with self.db.get_connection() as conn:
+            # ATTACH non è ammesso dentro una transazione: prima si collega il file
+            conn.execute(f"ATTACH DATABASE ? AS {ARCHIVE_ALIAS}", (self.archive_path(year),))
+            try:
+                with self.db.transaction():
+                    self._create_archive_schema(conn)
+                    conn.execute(
+                        f"INSERT OR IGNORE INTO {ARCHIVE_ALIAS}.role_history ({HISTORY_COLUMNS}) "
+                        f"SELECT {HISTORY_COLUMNS} FROM main.role_history WHERE {condition}",
+                        (start, end))
+                    moved = conn.execute(
+                        f"DELETE FROM main.role_history WHERE {condition}", (start, end)).rowcount
+            finally:
+                conn.execute(f"DETACH DATABASE {ARCHIVE_ALIAS}")
+        return moved
+
+    @staticmethod
+    def _create_archive_schema(conn: sqlite3.Connection):
+        # executescript farebbe COMMIT della transazione aperta: un'istruzione alla volta
+        for statement in _ARCHIVE_SCHEMA.format(schema=ARCHIVE_ALIAS).split(';'):
+            if statement.strip():
+                conn.execute(statement)
+
+    def purge_before(self, year: int) -> List[int]:
+        """Elimina gli archivi degli anni precedenti a year (retention definitiva)"""
+        purged = []
+        for archive_year, path in self.archives():
+            if archive_year < year:
+                os.remove(path)
+                purged.append(archive_year)
+        if purged:
+            logging.info(f"Archivi storico eliminati: {sorted(purged)}")
+        return sorted(purged)
+
+    # ----------------------------------------------------------------
+    # LETTURA
+    # ----------------------------------------------------------------
+
+    def history(self, limit: int = 100, **filters) -> List[Dict]:
+        """Modifiche più recenti per prime, da database principale e archivi.
+
+        Filtri: role_id, person_name, function_name, since, until (date ISO).
+        Gli archivi di anni esclusi da since/until non vengono aperti.
+        """
+        unknown = set(filters) - set(_HISTORY_FILTERS)
+        if unknown:
+            raise ValueError(f"Filtri storico non validi: {', '.join(sorted(unknown))}")
+        active = {name: str(value) for name, value in filters.items() if value is not None}
+        conditions = [_HISTORY_FILTERS[name] for name in active] or ["1"]
+        query = (f"SELECT {HISTORY_COLUMNS} FROM role_history "
+                 f"WHERE {' AND '.join(conditions)} ORDER BY change_date DESC, id DESC LIMIT ?")
+        params = tuple(active.values())
+
+        rows = [dict(row) for row in self.db.execute_query(query, (*params, limit))]
+        seen = {row['id'] for row in rows}
+        since_year = int(active['since'][:4]) if 'since' in active else None
+        until_year = int(active['until'][:4]) if 'until' in active else None
+        for year, path in self.archives():
+            if len(rows) >= limit or (since_year is not None and year < since_year):
+                break
+            if until_year is not None and year > until_year:
+                continue
+            for row in self._read_archive(path, query, (*params, limit)):
+                if row['id'] not in seen:
+                    seen.add(row['id'])
+                    rows.append(row)
+                    if len(rows) >= limit:
+                        break
+        return rows
+
+    @staticmethod
+    def _read_archive(path: str, query: str, params) -> List[Dict]:
+        conn = sqlite3.connect(f"file:{os.path.abspath(path)}?mode=ro", uri=True)
+        conn.row_factory = sqlite3.Row
+        try:
+            return [dict(row) for row in conn.execute(query, params)]
+        finally:
+            conn.close()
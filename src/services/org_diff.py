@@ -0,0 +1,344 @@
+# src/services/org_diff.py - Differenze dell'organigramma fra due date o due fotografie
+import itertools
+import json
+import sqlite3
+import threading
+from datetime import date, timedelta
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from ..database.connection import DatabaseConnection
+from ..database.models import OrgChange
+from .history_archive import ARCHIVE_ALIAS, HistoryArchive
+
+# history_missing: ruolo senza versioni registrate prima di un estremo
+# (anteriore all'audit o archivio eliminato), stato non ricostruibile
+CHANGE_KINDS = ('function_added', 'function_removed', 'function_moved',
+                'role_added', 'role_ended', 'role_moved',
+                'manager_changed', 'interim_changed', 'history_missing')
+
+# Stato di un ruolo: (persona, funzione, responsabile, interim, inizio, fine)
+_ROLE_STATE_COLUMNS = ('person_name', 'function_name', 'reports_to', 'ad_interim',
+                       'start_date', 'end_date')
+_ROLE_STATE = ", ".join("{0}." + column for column in _ROLE_STATE_COLUMNS)
+
+
+def _first(values: List[str]) -> str:
+    """Primo valore non NULL (COALESCE vuole almeno due argomenti)"""
+    return values[0] if len(values) == 1 else f"COALESCE({', '.join(values)})"
+
+
+def _date_roles_query(schemas: Sequence[str]) -> str:
+    """Ruoli da confrontare: modificati nell'intervallo (storico) o che vi
+    iniziano o finiscono per data; per ognuno l'ultima versione registrata
+    prima di ciascun estremo, con seek sull'indice (role_id, change_date).
+
+    schemas: 'main' seguito dagli archivi collegati, dal più recente. Gli
+    archivi hanno solo modifiche più vecchie di quelle del principale, quindi
+    l'ultima versione è la prima trovata in quest'ordine (COALESCE non valuta
+    i seek successivi); gli id sono quelli originali, unici in tutti i file.
+    """
+    def seek(bound: str) -> str:
+        return _first([f"(SELECT h.id FROM {schema}.role_history h "
+                       f"WHERE h.role_id = c.role_id AND h.change_date < :{bound} "
+                       f"ORDER BY h.change_date DESC, h.id DESC LIMIT 1)" for schema in schemas])
+
+    def state(prefix: str) -> str:
+        return ", ".join(_first([f"{prefix}{i}.{column}" for i in range(len(schemas))])
+                         for column in _ROLE_STATE_COLUMNS)
+
+    def join(prefix: str, key: str) -> str:
+        return "\n".join(f"LEFT JOIN {schema}.role_history {prefix}{i} ON {prefix}{i}.id = s.{key}"
+                         for i, schema in enumerate(schemas))
+
+    changed = "\n    UNION\n    ".join(
+        f"SELECT role_id FROM {schema}.role_history "
+        f"WHERE change_date >= :lower AND change_date < :upper" for schema in schemas)
+    return f"""
+WITH candidates(role_id) AS (
+    {changed}
+    UNION
+    SELECT id FROM roles WHERE start_date > :start AND start_date <= :end
+    UNION
+    SELECT id FROM roles WHERE end_date > :start AND end_date <= :end
+),
+states AS (
+    SELECT role_id, {seek('lower')} AS before_id, {seek('upper')} AS after_id
+    FROM candidates c
+    WHERE role_id IS NOT NULL
+)
+SELECT s.role_id, s.before_id IS NOT NULL, {state('b')},
+       s.after_id IS NOT NULL, {state('a')},
+       r.id IS NOT NULL, r.created_at < :lower, r.created_at < :upper, {_ROLE_STATE.format('r')}
+FROM states s
+{join('b', 'before_id')}
+{join('a', 'after_id')}
+LEFT JOIN roles r ON r.id = s.role_id
+ORDER BY s.role_id
+"""
+
+
+_DATE_FUNCTIONS_QUERY = """
+SELECT function_id, function_name, old_reports_to, new_reports_to, action
+FROM function_history
+WHERE change_date >= :lower AND change_date < :upper
+ORDER BY function_id, change_date, id
+"""
+
+_SNAPSHOT_FUNCTIONS_QUERY = """
+SELECT function_id, function_name, reports_to FROM org_snapshot_functions
+WHERE snapshot_id = ? ORDER BY function_id
+"""
+
+_SNAPSHOT_ROLES_QUERY = """
+SELECT role_id, person_name, function_name, reports_to, ad_interim FROM org_snapshot_roles
+WHERE snapshot_id = ? ORDER BY role_id
+"""
+
+
+class OrgDiffError(Exception):
+    """Richiesta di confronto non valida"""
+    pass
+
+
+def merge_join(left: Iterator[tuple], right: Iterator[tuple]) -> Iterator[Tuple]:
+    """Sort-merge di due sequenze ordinate sul primo campo: (sinistra, destra) per chiave"""
+    l, r = next(left, None), next(right, None)
+    while l is not None or r is not None:
+        if r is None or (l is not None and l[0] < r[0]):
+            yield l, None
+            l = next(left, None)
+        elif l is None or r[0] < l[0]:
+            yield None, r
+            r = next(right, None)
+        else:
+            yield l, r
+            l, r = next(left, None), next(right, None)
+
+
+def _active(state: Optional[tuple], day: str) -> bool:
+    """Ruolo valido alla data: inizio <= giorno < fine"""
+    if state is None:
+        return False
+    start, end = state[4], state[5]
+    return (start is None or str(start)[:10] <= day) and (end is None or str(end)[:10] > day)
+
+
+def _role_changes(role_id: int, before: Optional[tuple], after: Optional[tuple],
+                  start: str, end: str) -> Iterator[OrgChange]:
+    was, now = _active(before, start), _active(after, end)
+    if not was and not now:
+        return
+    if not was:
+        yield OrgChange('role_added', after[1], after[0], role_id, None, after[2])
+        return
+    if not now:
+        yield OrgChange('role_ended', before[1], before[0], role_id, before[2], None)
+        return
+    yield from _compare_roles(role_id, before, after)
+
+
+def _compare_roles(role_id: int, before: tuple, after: tuple) -> Iterator[OrgChange]:
+    """Differenze fra due versioni (persona, funzione, responsabile, interim, ...) di un ruolo"""
+    person, function = after[0], after[1]
+    if before[1] != function:
+        yield OrgChange('role_moved', function, person, role_id, before[1], function)
+    if before[2] != after[2]:
+        yield OrgChange('manager_changed', function, person, role_id, before[2], after[2])
+    if bool(before[3]) != bool(after[3]):
+        yield OrgChange('interim_changed', function, person, role_id,
+                        bool(before[3]), bool(after[3]))
+
+
+class DiffStream:
+    """Differenze lette da uno snapshot e codificate in NDJSON a blocchi.
+
+    Come ExportStream: la connessione di sola lettura resta aperta finché
+    il confronto non è finito o close() viene chiamato (client disconnesso).
+    """
+
+    def __init__(self, db: DatabaseConnection,
+                 producer: Callable[..., Iterator[OrgChange]], chunk_size: int,
+                 attach: Sequence[Tuple[str, str]] = ()):
+        self.db = db
+        self.chunk_size = chunk_size
+        self.changes = 0
+        self._lock = threading.Lock()
+        self._conn = db.open_snapshot(attach)
+        self._iter = producer(self._conn)
+
+    def next_chunk(self) -> Optional[bytes]:
+        """Prossimo blocco di righe NDJSON (None a fine confronto)"""
+        with self._lock:
+            if self._conn is None:
+                return None
+            batch = list(itertools.islice(self._iter, self.chunk_size))
+            if not batch:
+                self._close_locked()
+                return None
+            self.changes += len(batch)
+            lines = [json.dumps(change.to_dict(), ensure_ascii=False, default=str)
+                     for change in batch]
+            lines.append('')
+            return '\n'.join(lines).encode('utf-8')
+
+    def close(self):
+        with self._lock:
+            self._close_locked()
+
+    def _close_locked(self):
+        if self._conn is None:
+            return
+        self._iter.close()
+        self.db.release_snapshot(self._conn)
+        self._conn = None
+
+    def __iter__(self) -> Iterator[bytes]:
+        try:
+            while True:
+                chunk = self.next_chunk()
+                if chunk is None:
+                    return
+                yield chunk
+        finally:
+            self.close()
+
+
+class OrgDiff:
+    """Confronto dell'organigramma fra due date o due fotografie salvate.
+
+    Fra due date: spostamenti delle funzioni da function_history, ruoli
+    aggiunti/terminati e cambi di responsabile o interim dalle versioni di
+    role_history prima di ciascun estremo (solo i ruoli toccati
+    nell'intervallo, con seek sugli indici), compresi gli archivi annuali
+    collegati allo snapshot. Un ruolo esistente senza versioni registrate
+    esce come history_missing. Fra due fotografie: merge dei
+    due elenchi ordinati per id. In entrambi i casi nessun organigramma
+    viene ricostruito in memoria e le differenze escono una alla volta.
+
+        stream = OrgDiff(db).between_dates(date(2024, 1, 1), date(2024, 6, 30))
+        for chunk in stream:
+            out.write(chunk)
+    """
+
+    def __init__(self, db: DatabaseConnection, chunk_size: int = 1000):
+        self.db = db
+        self.chunk_size = chunk_size
+        self.archive = HistoryArchive(db)
+
+    # ----------------------------------------------------------------
+    # CONFRONTO
+    # ----------------------------------------------------------------
+
+    def between_dates(self, start: date, end: date) -> DiffStream:
+        """Differenze fra la situazione a fine giornata start e quella a fine giornata end"""
+        if start > end:
+            raise OrgDiffError("La data iniziale deve precedere quella finale")
+        upper = end + timedelta(days=1)
+        params = {
+            'start': start.isoformat(), 'end': end.isoformat(),
+            # Modifiche registrate fino a fine giornata
+            'lower': (start + timedelta(days=1)).isoformat(),
+            'upper': upper.isoformat(),
+        }
+        # Gli archivi degli anni successivi contengono solo modifiche oltre upper
+        attach = [(f"{ARCHIVE_ALIAS}_{year}", path)
+                  for year, path in self.archive.archives() if year <= upper.year]
+        query = _date_roles_query(['main'] + [alias for alias, _ in attach])
+        try:
+            return DiffStream(self.db, lambda conn: self._date_changes(conn, query, params),
+                              self.chunk_size, attach)
+        except sqlite3.OperationalError as e:
+            raise OrgDiffError(f"Archivi dello storico non leggibili: {e}")
+
+    def _date_changes(self, conn, query: str, params: Dict[str, str]) -> Iterator[OrgChange]:
+        rows = conn.execute(_DATE_FUNCTIONS_QUERY, params)
+        for function_id, group in itertools.groupby(rows, key=lambda row: row[0]):
+            group = list(group)
+            first, last = group[0], group[-1]
+            created, deleted = first[4] == 'INSERT', last[4] == 'DELETE'
+            if created and not deleted:
+                yield OrgChange('function_added', last[1], new_value=last[3])
+            elif deleted and not created:
+                yield OrgChange('function_removed', last[1], old_value=first[2])
+            elif not created and not deleted and first[2] != last[3]:
+                yield OrgChange('function_moved', last[1], old_value=first[2], new_value=last[3])
+
+        for row in conn.execute(query, params):
+            role_id = row[0]
+            before = row[2:8] if row[1] else None
+            after = row[9:15] if row[8] else None
+            exists, created_before, created_by_end, current = row[15], row[16], row[17], row[18:24]
+            # Il ruolo esisteva ma non ha versioni registrate: la versione
+            # attuale non dice com'era alla data, meglio segnalarlo
+            if exists and ((before is None and created_before)
+                           or (after is None and created_by_end)):
+                yield OrgChange('history_missing', current[1], current[0], role_id)
+                continue
+            yield from _role_changes(role_id, before, after, params['start'], params['end'])
+
+    def between_snapshots(self, old_name: str, new_name: str) -> DiffStream:
+        """Differenze fra due fotografie salvate con save_snapshot()"""
+        old_id, new_id = self._snapshot_id(old_name), self._snapshot_id(new_name)
+        return DiffStream(self.db, lambda conn: self._snapshot_changes(conn, old_id, new_id),
+                          self.chunk_size)
+
+    def _snapshot_changes(self, conn, old_id: int, new_id: int) -> Iterator[OrgChange]:
+        functions = merge_join(iter(conn.execute(_SNAPSHOT_FUNCTIONS_QUERY, (old_id,))),
+                               iter(conn.execute(_SNAPSHOT_FUNCTIONS_QUERY, (new_id,))))
+        for old, new in functions:
+            if old is None:
+                yield OrgChange('function_added', new[1], new_value=new[2])
+            elif new is None:
+                yield OrgChange('function_removed', old[1], old_value=old[2])
+            elif old[2] != new[2]:
+                yield OrgChange('function_moved', new[1], old_value=old[2], new_value=new[2])
+
+        roles = merge_join(iter(conn.execute(_SNAPSHOT_ROLES_QUERY, (old_id,))),
+                           iter(conn.execute(_SNAPSHOT_ROLES_QUERY, (new_id,))))
+        for old, new in roles:
+            if old is None:
+                yield OrgChange('role_added', new[2], new[1], new[0], None, new[3])
+            elif new is None:
+                yield OrgChange('role_ended', old[2], old[1], old[0], old[3], None)
+            else:
+                yield from _compare_roles(new[0], old[1:], new[1:])
+
+    # ----------------------------------------------------------------
+    # FOTOGRAFIE
+    # ----------------------------------------------------------------
+
+    def save_snapshot(self, name: str, flags: Optional[str] = None) -> int:
+        """Fotografa funzioni e ruoli attivi con un nome (due INSERT ... SELECT)"""
+        with self.db.transaction() as conn:
+            snapshot_id = conn.execute(
+                "INSERT INTO org_snapshots (name, flags) VALUES (?, ?)", (name, flags)
+            ).lastrowid
+            conn.execute("""
+                INSERT INTO org_snapshot_functions (snapshot_id, function_id, function_name, reports_to)
+                SELECT ?, id, name, reports_to FROM functions
+            """, (snapshot_id,))
+            conn.execute("""
+                INSERT INTO org_snapshot_roles (snapshot_id, role_id, person_name, function_name,
+                                                reports_to, ad_interim)
+                SELECT ?, id, person_name, function_name, reports_to, ad_interim
+                FROM roles WHERE end_date IS NULL
+            """, (snapshot_id,))
+            return snapshot_id
+
+    def list_snapshots(self) -> List[Dict]:
+        rows = self.db.execute_query("""
+            SELECT s.id, s.name, s.taken_at, s.flags,
+                   (SELECT COUNT(*) FROM org_snapshot_roles r WHERE r.snapshot_id = s.id) AS roles
+            FROM org_snapshots s ORDER BY s.taken_at DESC, s.id DESC
+        """)
+        return [dict(row) for row in rows]
+
+    def delete_snapshot(self, name: str) -> bool:
+        with self.db.transaction() as conn:
+            return conn.execute("DELETE FROM org_snapshots WHERE name = ?", (name,)).rowcount > 0
+
+    def _snapshot_id(self, name: str) -> int:
+        rows = self.db.execute_query("SELECT id FROM org_snapshots WHERE name = ?", (name,))
+        if not rows:
+            raise OrgDiffError(f"Fotografia non trovata: {name}")
+        return rows[0][0]
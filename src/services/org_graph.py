@@ -0,0 +1,253 @@
+# src/services/org_graph.py - Snapshot immutabile dell'organigramma in memoria
+import logging
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from ..database.connection import DatabaseConnection
+from ..database.models import (Function, FunctionRollup, FunctionTreeNode, OrgChartNode,
+                               Person, Role)
+from ..database.repository import FUNCTION_COLUMNS, PERSON_COLUMNS, ROLE_COLUMNS
+
+NO_PARENT = -1
+
+
+class OrgGraph:
+    """Fotografia in sola lettura di funzioni, persone e ruoli attivi.
+
+    Le funzioni stanno in una tupla ordinata per (livello, nome) e la
+    gerarchia in array di posizioni (padre e figli di ogni funzione); i
+    ruoli attivi sono già raggruppati per funzione, per persona e per
+    responsabile; organigramma e rollup (headcount, FTE, interim) sono
+    precalcolati. Il grafo non viene mai
+    modificato: un aggiornamento ne costruisce uno nuovo (vedi OrgGraphCache),
+    quindi i lettori non hanno bisogno di lock. Gli oggetti restituiti sono
+    condivisi fra le richieste e vanno trattati in sola lettura.
+    """
+
+    __slots__ = ('version', 'functions', 'parents', 'children', 'chart',
+                 '_rollups', '_function_pos', '_persons', '_roles_by_function',
+                 '_roles_by_person', '_reports_by_manager')
+
+    def __init__(self, version: int, functions: List[Function],
+                 persons: List[Person], roles: List[Role]):
+        self.version = version
+
+        # Funzioni: posizione nell'array, padre e figli per posizione
+        functions.sort(key=lambda f: (f.level is None, f.level or 0, f.name))
+        self.functions: Tuple[Function, ...] = tuple(functions)
+        self._function_pos: Dict[str, int] = {f.name: pos for pos, f in enumerate(functions)}
+        pos_by_id = {f.id: pos for pos, f in enumerate(functions)}
+        parents = [pos_by_id.get(f.parent_function_id, NO_PARENT) for f in functions]
+        children: List[List[int]] = [[] for _ in functions]
+        for pos, parent in enumerate(parents):
+            if parent != NO_PARENT:
+                children[parent].append(pos)
+        self.parents: Tuple[int, ...] = tuple(parents)
+        self.children: Tuple[Tuple[int, ...], ...] = tuple(map(tuple, children))
+
+        self._persons: Dict[str, Person] = {p.name: p for p in persons}
+        active_ids = {p.id for p in persons if p.status == 'ACTIVE'}
+
+        # Ruoli attivi raggruppati (stessi ordinamenti delle query del repository)
+        by_function: Dict[int, List[Role]] = {}
+        by_person: Dict[int, List[Role]] = {}
+        by_manager: Dict[int, List[Role]] = {}
+        for role in roles:
+            if role.function_id is not None:
+                by_function.setdefault(role.function_id, []).append(role)
+            if role.person_id is not None:
+                by_person.setdefault(role.person_id, []).append(role)
+            if role.manager_id is not None:
+                by_manager.setdefault(role.manager_id, []).append(role)
+        self._roles_by_function = _sorted_groups(by_function, lambda r: r.person_name)
+        self._roles_by_person = _sorted_groups(by_person, lambda r: r.function_name)
+        self._reports_by_manager = _sorted_groups(
+            by_manager, lambda r: (r.function_name, r.person_name))
+
+        # Organigramma: una riga per persona attiva, o una vuota per funzione
+        staffed = [[r for r in self._roles_by_function.get(f.id, ()) if r.person_id in active_ids]
+                   for f in functions]
+        chart: List[OrgChartNode] = []
+        for function, function_roles in zip(functions, staffed):
+            if function.level is None:
+                break
+            for role in function_roles:
+                chart.append(OrgChartNode(
+                    function.name, function.level, function.path, role.person_name,
+                    role.job_title_name, role.organizational_unit, role.ad_interim,
+                    function.reports_to, role.reports_to,
+                ))
+            if not function_roles:
+                chart.append(OrgChartNode(function.name, function.level, function.path,
+                                          None, None, None, None, function.reports_to))
+        self.chart: Tuple[OrgChartNode, ...] = tuple(chart)
+        self._rollups = self._compute_rollups(staffed)
+
+    def _compute_rollups(self, staffed: List[List[Role]]) -> Dict[str, FunctionRollup]:
+        """Una passata dalle foglie alla radice: i valori dei figli confluiscono nel padre.
+
+        Le persone si contano una volta sola anche se hanno ruoli in più
+        sotto-funzioni: gli insiemi dei figli si uniscono nel più grande.
+        """
+        # Visita in ampiezza dalle radici: ogni figlio viene dopo il padre
+        order = [pos for pos, parent in enumerate(self.parents) if parent == NO_PARENT]
+        for pos in order:
+            order.extend(self.children[pos])
+
+        rollups: Dict[str, FunctionRollup] = {}
+        totals: Dict[int, Tuple[set, float, int]] = {}
+        for pos in reversed(order):
+            function = self.functions[pos]
+            people = {role.person_id for role in staffed[pos]}
+            headcount = len(people)
+            direct_fte = fte = sum(role.percentage or 0 for role in staffed[pos])
+            direct_interim = interim = sum(1 for role in staffed[pos] if role.ad_interim)
+            for child in self.children[pos]:
+                child_people, child_fte, child_interim = totals.pop(child)
+                if len(child_people) > len(people):
+                    people, child_people = child_people, people
+                people |= child_people
+                fte += child_fte
+                interim += child_interim
+            totals[pos] = (people, fte, interim)
+            rollups[function.name] = FunctionRollup(
+                function.id, function.name, function.level, headcount,
+                round(direct_fte, 2), direct_interim, len(people), round(fte, 2), interim,
+            )
+        return rollups
+
+    @classmethod
+    def load(cls, db: DatabaseConnection) -> 'OrgGraph':
+        """Legge il database da un unico snapshot e costruisce il grafo"""
+        # Versione letta prima dello snapshot: un commit intermedio fa solo
+        # ricostruire una volta di più, mai servire dati vecchi come nuovi
+        version = db.data_version()
+        with db.read_snapshot() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = Function.from_row
+            functions = cursor.execute(f"SELECT {FUNCTION_COLUMNS} FROM functions").fetchall()
+            cursor.row_factory = Person.from_row
+            persons = cursor.execute(f"SELECT {PERSON_COLUMNS} FROM persons").fetchall()
+            cursor.row_factory = Role.from_row
+            roles = cursor.execute(
+                f"SELECT {ROLE_COLUMNS} FROM roles WHERE end_date IS NULL"
+            ).fetchall()
+        return cls(version, functions, persons, roles)
+
+    # ----------------------------------------------------------------
+    # LETTURE
+    # ----------------------------------------------------------------
+
+    def get_person(self, name: str) -> Optional[Person]:
+        return self._persons.get(name)
+
+    def get_function(self, name: str) -> Optional[Function]:
+        pos = self._function_pos.get(name)
+        return self.functions[pos] if pos is not None else None
+
+    def get_person_roles(self, person_name: str) -> List[Role]:
+        """Ruoli attivi della persona, per funzione"""
+        person = self._persons.get(person_name)
+        return list(self._roles_by_person.get(person.id, ())) if person else []
+
+    def get_function_roles(self, function_name: str) -> List[Role]:
+        """Ruoli attivi della funzione, per persona"""
+        function = self.get_function(function_name)
+        return list(self._roles_by_function.get(function.id, ())) if function else []
+
+    def get_direct_reports(self, manager_name: str) -> List[Role]:
+        """Ruoli attivi che riportano alla persona"""
+        person = self._persons.get(manager_name)
+        return list(self._reports_by_manager.get(person.id, ())) if person else []
+
+    def get_function_ancestors(self, name: str) -> List[Function]:
+        """Catena dei responsabili, dalla radice al padre diretto"""
+        pos = self._function_pos.get(name)
+        chain = []
+        while pos is not None and self.parents[pos] != NO_PARENT:
+            pos = self.parents[pos]
+            chain.append(self.functions[pos])
+        chain.reverse()
+        return chain
+
+    def get_sub_functions(self, name: str) -> List[FunctionTreeNode]:
+        """Funzioni figlie dirette, per nome (stesso livello: già in ordine)"""
+        pos = self._function_pos.get(name)
+        if pos is None:
+            return []
+        return [FunctionTreeNode(f.id, f.name, f.reports_to, f.level, f.path)
+                for f in (self.functions[child] for child in self.children[pos])]
+
+    def get_organization_chart(self) -> List[OrgChartNode]:
+        return list(self.chart)
+
+    def get_function_rollup(self, name: str) -> Optional[FunctionRollup]:
+        return self._rollups.get(name)
+
+    def get_function_rollups(self) -> List[FunctionRollup]:
+        """Rollup di tutte le funzioni, per livello e nome"""
+        return [self._rollups[f.name] for f in self.functions if f.name in self._rollups]
+
+
+def _sorted_groups(groups: Dict[int, List[Role]], key) -> Dict[int, Tuple[Role, ...]]:
+    return {group_id: tuple(sorted(items, key=key)) for group_id, items in groups.items()}
+
+
+class OrgGraphCache:
+    """Tiene il grafo corrente e lo sostituisce quando il database cambia.
+
+    Ogni lettura confronta PRAGMA data_version (pochi microsecondi) con la
+    versione del grafo: se coincidono il grafo viene restituito senza lock.
+    Dopo un commit (anche di un altro processo, es. CLI di import) current()
+    restituisce None e avvia la ricostruzione in background: nel frattempo
+    il chiamante legge da SQLite, quindi vede subito le proprie modifiche,
+    e il nuovo grafo sostituisce il vecchio con un'unica assegnazione
+    (copy-on-write). Chi ha già un riferimento continua a usare il vecchio.
+
+        graph = OrgGraphCache.for_database(db).current()
+        roles = graph.get_function_roles('CDA') if graph else repo.get_function_roles('CDA')
+    """
+
+    def __init__(self, db: DatabaseConnection):
+        self.db = db
+        self._graph: Optional[OrgGraph] = None
+        # Tenuto per tutta la ricostruzione: una sola alla volta
+        self._building = threading.Lock()
+
+    @classmethod
+    def for_database(cls, db: DatabaseConnection) -> 'OrgGraphCache':
+        """Cache condivisa da tutte le connessioni allo stesso database"""
+        return db.shared('org_graph', lambda: cls(db))
+
+    def current(self) -> Optional[OrgGraph]:
+        """Grafo allineato all'ultimo commit, o None se va ricostruito"""
+        graph = self._graph
+        if graph is not None and graph.version == self.db.data_version():
+            return graph
+        if self._building.acquire(blocking=False):
+            threading.Thread(target=self._rebuild, name='org-graph', daemon=True).start()
+        return None
+
+    def build(self):
+        """Costruisce il grafo nel thread corrente (avvio dell'applicazione)"""
+        with self._building:
+            self._load()
+
+    def _rebuild(self):
+        try:
+            self._load()
+        except Exception as e:
+            logging.error(f"Errore costruzione grafo organigramma: {e}")
+        finally:
+            self._building.release()
+
+    def _load(self):
+        graph = self._graph
+        if graph is not None and graph.version == self.db.data_version():
+            return
+        started = time.perf_counter()
+        graph = OrgGraph.load(self.db)
+        self._graph = graph
+        logging.info(f"Grafo organigramma: {len(graph.functions)} funzioni, "
+                     f"{len(graph.chart)} righe in {time.perf_counter() - started:.2f}s")
@@ -1,7 +1,13 @@
+import math
 from typing import List, Optional, Dict, Tuple
 from datetime import date
 from ..database.repository import OrganigrammaRepository
-from ..database.models import Person, Role, Function, JobTitle, OrgChartNode
+from ..database.models import (Person, Role, Function, FunctionRollup, JobTitle, OrgChartNode,
+                               SearchHit)
+from .history_archive import HistoryArchive
+from .org_diff import OrgDiff
+from .org_graph import OrgGraph, OrgGraphCache
+from .typeahead import TypeaheadEntry, TypeaheadIndex
 
 class CRUDValidationError(Exception):
     """Eccezione per errori di validazione CRUD"""
@@ -10,6 +16,10 @@ class CRUDValidationError(Exception):
 class OrganigrammaService:
     def __init__(self, repository: OrganigrammaRepository):
         self.repo = repository
+        self.typeahead = TypeaheadIndex.for_database(repository.db)
+        self.graph = OrgGraphCache.for_database(repository.db)
+        self.history = HistoryArchive(repository.db)
+        self.diff = OrgDiff(repository.db)
     
     # ================================================================
     # PERSONS - CRUD SERVICE LAYER
@@ -22,29 +32,32 @@ class OrganigrammaService:
             if not person_data.get('name', '').strip():
                 return False, "Nome richiesto", None
             
-            # Verifica duplicati
-            if self.repo.get_person(person_data['name']):
-                return False, "Dipendente già esistente", None
-            
-            if person_data.get('employee_id'):
-                if self.repo.get_person_by_employee_id(person_data['employee_id']):
-                    return False, "Employee ID già in uso", None
-            
-            # Crea oggetto Person
-            person = Person(
-                name=person_data['name'],
-                email=person_data.get('email'),
-                employee_id=person_data.get('employee_id'),
-                hire_date=person_data.get('hire_date'),
-                status=person_data.get('status', 'ACTIVE'),
-                flags=person_data.get('flags')
-            )
-            
-            person_id = self.repo.create_person(person)
-            
-            # Aggiungi aliases se presenti
-            for alias in person_data.get('aliases', []):
-                self.repo.add_person_alias(person.name, alias)
+            # Verifiche, inserimento e alias in un'unica transazione
+            with self.repo.unit_of_work():
+                # Verifica duplicati
+                if self.repo.get_person(person_data['name']):
+                    return False, "Dipendente già esistente", None
+                
+                if person_data.get('employee_id'):
+                    if self.repo.get_person_by_employee_id(person_data['employee_id']):
+                        return False, "Employee ID già in uso", None
+                
+                # Crea oggetto Person
+                person = Person(
+                    name=person_data['name'],
+                    email=person_data.get('email'),
+                    employee_id=person_data.get('employee_id'),
+                    hire_date=person_data.get('hire_date'),
+                    status=person_data.get('status', 'ACTIVE'),
+                    flags=person_data.get('flags')
+                )
+                
+                person_id = self.repo.create_person(person)
+                
+                # Aggiungi aliases se presenti
+                aliases = person_data.get('aliases') or []
+                if aliases:
+                    self.repo.add_person_aliases(person.name, aliases)
             
             return True, "Dipendente creato con successo", person_id
             
@@ -54,19 +67,20 @@ class OrganigrammaService:
     def update_person(self, person_name: str, person_data: Dict) -> Tuple[bool, str]:
         """Aggiorna dipendente esistente"""
         try:
-            # Verifica esistenza
-            existing = self.repo.get_person(person_name)
-            if not existing:
-                return False, "Dipendente non trovato"
-            
-            # Aggiorna oggetto
-            existing.email = person_data.get('email', existing.email)
-            existing.employee_id = person_data.get('employee_id', existing.employee_id)
-            existing.hire_date = person_data.get('hire_date', existing.hire_date)
-            existing.status = person_data.get('status', existing.status)
-            existing.flags = person_data.get('flags', existing.flags)
-            
-            success = self.repo.update_person(person_name, existing)
+            with self.repo.unit_of_work():
+                # Verifica esistenza
+                existing = self.repo.get_person(person_name)
+                if not existing:
+                    return False, "Dipendente non trovato"
+                
+                # Aggiorna oggetto
+                existing.email = person_data.get('email', existing.email)
+                existing.employee_id = person_data.get('employee_id', existing.employee_id)
+                existing.hire_date = person_data.get('hire_date', existing.hire_date)
+                existing.status = person_data.get('status', existing.status)
+                existing.flags = person_data.get('flags', existing.flags)
+                
+                success = self.repo.update_person(person_name, existing)
             return success, "Dipendente aggiornato" if success else "Errore aggiornamento"
             
         except Exception as e:
@@ -75,12 +89,13 @@ class OrganigrammaService:
     def delete_person(self, person_name: str) -> Tuple[bool, str]:
         """Elimina dipendente (con controlli)"""
         try:
-            # Verifica ruoli attivi
-            active_roles = self.repo.get_person_roles(person_name, active_only=True)
-            if active_roles:
-                return False, f"Impossibile eliminare: {len(active_roles)} ruoli attivi"
-            
-            success = self.repo.delete_person(person_name)
+            with self.repo.unit_of_work():
+                # Verifica ruoli attivi
+                active_roles = self.repo.get_person_roles(person_name, active_only=True)
+                if active_roles:
+                    return False, f"Impossibile eliminare: {len(active_roles)} ruoli attivi"
+                
+                success = self.repo.delete_person(person_name)
             return success, "Dipendente eliminato" if success else "Errore eliminazione"
             
         except Exception as e:
@@ -96,17 +111,18 @@ class OrganigrammaService:
             if not function_data.get('name', '').strip():
                 return False, "Nome funzione richiesto", None
             
-            # Verifica duplicati
-            if self.repo.get_function(function_data['name']):
-                return False, "Funzione già esistente", None
-            
-            function = Function(
-                name=function_data['name'],
-                reports_to=function_data.get('reports_to'),
-                flags=function_data.get('flags')
-            )
-            
-            function_id = self.repo.create_function(function)
+            with self.repo.unit_of_work():
+                # Verifica duplicati
+                if self.repo.get_function(function_data['name']):
+                    return False, "Funzione già esistente", None
+                
+                function = Function(
+                    name=function_data['name'],
+                    reports_to=function_data.get('reports_to'),
+                    flags=function_data.get('flags')
+                )
+                
+                function_id = self.repo.create_function(function)
             return True, "Funzione creata con successo", function_id
             
         except Exception as e:
@@ -115,14 +131,15 @@ class OrganigrammaService:
     def update_function(self, function_name: str, function_data: Dict) -> Tuple[bool, str]:
         """Aggiorna funzione esistente"""
         try:
-            existing = self.repo.get_function(function_name)
-            if not existing:
-                return False, "Funzione non trovata"
-            
-            existing.reports_to = function_data.get('reports_to', existing.reports_to)
-            existing.flags = function_data.get('flags', existing.flags)
-            
-            success = self.repo.update_function(function_name, existing)
+            with self.repo.unit_of_work():
+                existing = self.repo.get_function(function_name)
+                if not existing:
+                    return False, "Funzione non trovata"
+                
+                existing.reports_to = function_data.get('reports_to', existing.reports_to)
+                existing.flags = function_data.get('flags', existing.flags)
+                
+                success = self.repo.update_function(function_name, existing)
             return success, "Funzione aggiornata" if success else "Errore aggiornamento"
             
         except Exception as e:
@@ -131,12 +148,13 @@ class OrganigrammaService:
     def delete_function(self, function_name: str) -> Tuple[bool, str]:
         """Elimina funzione (con controlli dipendenze)"""
         try:
-            deps = self.repo.get_function_dependencies(function_name)
-            if deps['has_dependencies']:
-                msg = f"Impossibile eliminare: {deps['sub_functions']} sotto-funzioni, {deps['active_roles']} ruoli attivi"
-                return False, msg
-            
-            success = self.repo.delete_function(function_name)
+            with self.repo.unit_of_work():
+                deps = self.repo.get_function_dependencies(function_name)
+                if deps['has_dependencies']:
+                    msg = f"Impossibile eliminare: {deps['sub_functions']} sotto-funzioni, {deps['active_roles']} ruoli attivi"
+                    return False, msg
+                
+                success = self.repo.delete_function(function_name)
             return success, "Funzione eliminata" if success else "Errore eliminazione"
             
         except Exception as e:
@@ -155,12 +173,6 @@ class OrganigrammaService:
             if not role_data.get('function_name'):
                 return False, "Nome funzione richiesto", None
             
-            # Verifica esistenza persona e funzione
-            if not self.repo.get_person(role_data['person_name']):
-                return False, "Persona non trovata", None
-            if not self.repo.get_function(role_data['function_name']):
-                return False, "Funzione non trovata", None
-            
             role = Role(
                 person_name=role_data['person_name'],
                 function_name=role_data['function_name'],
@@ -173,7 +185,14 @@ class OrganigrammaService:
                 flags=role_data.get('flags')
             )
             
-            role_id = self.repo.create_role(role)
+            with self.repo.unit_of_work():
+                # Verifica esistenza persona e funzione
+                if not self.repo.get_person(role.person_name):
+                    return False, "Persona non trovata", None
+                if not self.repo.get_function(role.function_name):
+                    return False, "Funzione non trovata", None
+                
+                role_id = self.repo.create_role(role)
             return True, "Ruolo creato con successo", role_id
             
         except Exception as e:
@@ -182,18 +201,19 @@ class OrganigrammaService:
     def update_role(self, role_id: int, role_data: Dict) -> Tuple[bool, str]:
         """Aggiorna ruolo esistente"""
         try:
-            existing = self.repo.get_role(role_id)
-            if not existing:
-                return False, "Ruolo non trovato"
-            
-            existing.organizational_unit = role_data.get('organizational_unit', existing.organizational_unit)
-            existing.job_title_name = role_data.get('job_title_name', existing.job_title_name)
-            existing.percentage = float(role_data.get('percentage', existing.percentage))
-            existing.ad_interim = bool(role_data.get('ad_interim', existing.ad_interim))
-            existing.reports_to = role_data.get('reports_to', existing.reports_to)
-            existing.flags = role_data.get('flags', existing.flags)
-            
-            success = self.repo.update_role(role_id, existing)
+            with self.repo.unit_of_work():
+                existing = self.repo.get_role(role_id)
+                if not existing:
+                    return False, "Ruolo non trovato"
+                
+                existing.organizational_unit = role_data.get('organizational_unit', existing.organizational_unit)
+                existing.job_title_name = role_data.get('job_title_name', existing.job_title_name)
+                existing.percentage = float(role_data.get('percentage', existing.percentage))
+                existing.ad_interim = bool(role_data.get('ad_interim', existing.ad_interim))
+                existing.reports_to = role_data.get('reports_to', existing.reports_to)
+                existing.flags = role_data.get('flags', existing.flags)
+                
+                success = self.repo.update_role(role_id, existing)
             return success, "Ruolo aggiornato" if success else "Errore aggiornamento"
             
         except Exception as e:
@@ -211,11 +231,12 @@ class OrganigrammaService:
                      transfer_date: Optional[date] = None) -> Tuple[bool, str, Optional[int]]:
         """Trasferisce ruolo ad altra persona"""
         try:
-            # Verifica esistenza nuova persona
-            if not self.repo.get_person(new_person_name):
-                return False, "Persona destinataria non trovata", None
-            
-            success, new_role_id = self.repo.transfer_role(role_id, new_person_name, transfer_date)
+            with self.repo.unit_of_work():
+                # Verifica esistenza nuova persona
+                if not self.repo.get_person(new_person_name):
+                    return False, "Persona destinataria non trovata", None
+                
+                success, new_role_id = self.repo.transfer_role(role_id, new_person_name, transfer_date)
             return success, "Ruolo trasferito" if success else "Errore trasferimento", new_role_id
             
         except Exception as e:
@@ -231,16 +252,17 @@ class OrganigrammaService:
             if not job_title_data.get('name', '').strip():
                 return False, "Nome job title richiesto", None
             
-            if self.repo.get_job_title(job_title_data['name']):
-                return False, "Job title già esistente", None
-            
-            job_title = JobTitle(
-                name=job_title_data['name'],
-                level=job_title_data.get('level'),
-                flags=job_title_data.get('flags')
-            )
-            
-            job_title_id = self.repo.create_job_title(job_title)
+            with self.repo.unit_of_work():
+                if self.repo.get_job_title(job_title_data['name']):
+                    return False, "Job title già esistente", None
+                
+                job_title = JobTitle(
+                    name=job_title_data['name'],
+                    level=job_title_data.get('level'),
+                    flags=job_title_data.get('flags')
+                )
+                
+                job_title_id = self.repo.create_job_title(job_title)
             return True, "Job title creato con successo", job_title_id
             
         except Exception as e:
@@ -249,14 +271,15 @@ class OrganigrammaService:
     def update_job_title(self, job_title_name: str, job_title_data: Dict) -> Tuple[bool, str]:
         """Aggiorna job title esistente"""
         try:
-            existing = self.repo.get_job_title(job_title_name)
-            if not existing:
-                return False, "Job title non trovato"
-            
-            existing.level = job_title_data.get('level', existing.level)
-            existing.flags = job_title_data.get('flags', existing.flags)
-            
-            success = self.repo.update_job_title(job_title_name, existing)
+            with self.repo.unit_of_work():
+                existing = self.repo.get_job_title(job_title_name)
+                if not existing:
+                    return False, "Job title non trovato"
+                
+                existing.level = job_title_data.get('level', existing.level)
+                existing.flags = job_title_data.get('flags', existing.flags)
+                
+                success = self.repo.update_job_title(job_title_name, existing)
             return success, "Job title aggiornato" if success else "Errore aggiornamento"
             
         except Exception as e:
@@ -280,46 +303,99 @@ class OrganigrammaService:
     def reorganize_function(self, function_name: str, new_reports_to: Optional[str]) -> Tuple[bool, str]:
         """Sposta funzione nella gerarchia"""
         try:
-            # Verifica cicli nella gerarchia
-            if new_reports_to and self._would_create_cycle(function_name, new_reports_to):
-                return False, "Operazione creerebbe un ciclo nella gerarchia"
-            
-            function = self.repo.get_function(function_name)
-            if not function:
-                return False, "Funzione non trovata"
-            
-            function.reports_to = new_reports_to
-            success = self.repo.update_function(function_name, function)
+            with self.repo.unit_of_work():
+                # Verifica cicli nella gerarchia
+                if new_reports_to and self._would_create_cycle(function_name, new_reports_to):
+                    return False, "Operazione creerebbe un ciclo nella gerarchia"
+                
+                function = self.repo.get_function(function_name)
+                if not function:
+                    return False, "Funzione non trovata"
+                
+                function.reports_to = new_reports_to
+                success = self.repo.update_function(function_name, function)
             return success, "Funzione riorganizzata" if success else "Errore riorganizzazione"
             
         except Exception as e:
             return False, f"Errore durante la riorganizzazione: {str(e)}"
     
+    def reorganize_functions(self, moves: Dict[str, Optional[str]]) -> Tuple[bool, str, int]:
+        """Sposta più funzioni insieme: tutte o nessuna, in una transazione"""
+        if not moves:
+            return False, "Nessuno spostamento indicato", 0
+        try:
+            with self.repo.unit_of_work():
+                parents = self.repo.get_function_parents()
+                errors = self._validate_moves(parents, moves)
+                if errors:
+                    return False, "; ".join(errors), 0
+                
+                # Gerarchia finale: validata tutta insieme, non mossa per mossa
+                final = {**parents, **moves}
+                depths = self._function_depths(final, moves)
+                cyclic = sorted(name for name, depth in depths.items() if depth is None)
+                if cyclic:
+                    return False, f"Operazione creerebbe un ciclo nella gerarchia: {', '.join(cyclic)}", 0
+                
+                # Dall'alto in basso: quando una funzione si sposta, la catena
+                # del nuovo padre è già quella finale e non può contenerla
+                ordered = sorted(moves.items(), key=lambda move: depths[move[0]])
+                moved = self.repo.move_functions(ordered)
+            return True, f"{moved} funzioni riorganizzate", moved
+        
+        except Exception as e:
+            return False, f"Errore durante la riorganizzazione: {str(e)}", 0
+    
+    @staticmethod
+    def _validate_moves(parents: Dict[str, Optional[str]],
+                        moves: Dict[str, Optional[str]]) -> List[str]:
+        errors = []
+        for name, new_parent in moves.items():
+            if name not in parents:
+                errors.append(f"Funzione non trovata: {name}")
+            elif new_parent is not None and new_parent not in parents:
+                errors.append(f"Funzione padre non trovata: {new_parent}")
+            elif new_parent == name:
+                errors.append(f"Una funzione non può riportare a se stessa: {name}")
+        return errors
+    
+    @staticmethod
+    def _function_depths(parents: Dict[str, Optional[str]],
+                         names) -> Dict[str, Optional[int]]:
+        """Profondità nella gerarchia indicata (None se la catena contiene un ciclo)"""
+        depths: Dict[str, Optional[int]] = {}
+        for name in names:
+            chain, node = [], name
+            # Risale fino a una radice o a un nodo già calcolato
+            while node is not None and node not in depths and node not in chain:
+                chain.append(node)
+                node = parents.get(node)
+            if node is None:
+                depth = -1
+            elif node in depths:
+                depth = depths[node]
+            else:
+                # La catena è tornata su se stessa: ciclo
+                depth = None
+            for link in reversed(chain):
+                depth = None if depth is None else depth + 1
+                depths[link] = depth
+        return {name: depths[name] for name in names}
+    
     def _would_create_cycle(self, function_name: str, new_parent: str) -> bool:
         """Verifica se assegnare new_parent come parent di function_name creerebbe un ciclo"""
-        current = new_parent
-        visited = set()
-        
-        while current:
-            if current == function_name:
-                return True
-            if current in visited:
-                break  # Ciclo esistente, ma non coinvolge function_name
-            visited.add(current)
-            
-            parent_function = self.repo.get_function(current)
-            current = parent_function.reports_to if parent_function else None
-        
-        return False
+        # Ciclo se il nuovo padre sta nel sottoalbero della funzione (closure table)
+        return self.repo.is_function_descendant(function_name, new_parent)
     
     def bulk_change_manager(self, old_manager: str, new_manager: str) -> Tuple[bool, str, int]:
         """Cambia manager per tutti i report"""
         try:
-            # Verifica esistenza nuovo manager
-            if not self.repo.get_person(new_manager):
-                return False, "Nuovo manager non trovato", 0
-            
-            affected_count = self.repo.bulk_update_roles_reports_to(old_manager, new_manager)
+            with self.repo.unit_of_work():
+                # Verifica esistenza nuovo manager
+                if not self.repo.get_person(new_manager):
+                    return False, "Nuovo manager non trovato", 0
+                
+                affected_count = self.repo.bulk_update_roles_reports_to(old_manager, new_manager)
             return True, f"{affected_count} ruoli aggiornati", affected_count
             
         except Exception as e:
@@ -331,55 +407,143 @@ class OrganigrammaService:
             if not termination_date:
                 termination_date = date.today()
             
-            # Termina tutti i ruoli
-            roles_count = self.repo.bulk_end_person_roles(person_name, termination_date)
+            # Ruoli e stato persona cambiano insieme o per niente
+            with self.repo.unit_of_work():
+                # Termina tutti i ruoli
+                roles_count = self.repo.bulk_end_person_roles(person_name, termination_date)
+                
+                # Disattiva persona
+                person_success, person_msg = self.update_person(person_name, {'status': 'TERMINATED'})
+                if not person_success:
+                    raise CRUDValidationError(person_msg)
             
-            # Disattiva persona
-            person_success, person_msg = self.update_person(person_name, {'status': 'TERMINATED'})
+            return True, f"Dipendente terminato, {roles_count} ruoli terminati", roles_count
+                
+        except CRUDValidationError as e:
+            return False, f"Errore durante terminazione: {e}", 0
+        except Exception as e:
+            return False, f"Errore durante la terminazione: {str(e)}", 0
+    
+    def bulk_change_managers(self, changes: Dict[str, str]) -> Tuple[bool, str, int]:
+        """Cambia più manager (vecchio -> nuovo) in una transazione, con un solo UPDATE"""
+        try:
+            changes = {old: new for old, new in changes.items() if old != new}
+            if not changes:
+                return False, "Nessun cambio manager indicato", 0
+            
+            with self.repo.unit_of_work():
+                missing = self.repo.get_missing_persons(changes.values())
+                if missing:
+                    return False, f"Nuovi manager non trovati: {self._name_list(missing)}", 0
+                
+                affected_count = self.repo.bulk_update_roles_reports_to_map(changes)
+            return True, f"{affected_count} ruoli aggiornati, manager sostituiti: {len(changes)}", affected_count
             
-            if person_success:
-                return True, f"Dipendente terminato, {roles_count} ruoli terminati", roles_count
-            else:
-                return False, f"Errore durante terminazione: {person_msg}", roles_count
+        except Exception as e:
+            return False, f"Errore durante il cambio manager: {str(e)}", 0
+    
+    def terminate_employees(self, terminations: Dict[str, Optional[date]],
+                            termination_date: Optional[date] = None) -> Tuple[bool, str, int]:
+        """Termina più dipendenti e i loro ruoli (persona -> data, default termination_date o oggi)"""
+        try:
+            if not terminations:
+                return False, "Nessun dipendente indicato", 0
+            default_date = termination_date or date.today()
+            end_dates = {name: (when or default_date).isoformat()
+                         for name, when in terminations.items()}
+            
+            # Tutto o niente: nomi sconosciuti annullano l'operazione
+            with self.repo.unit_of_work():
+                missing = self.repo.get_missing_persons(end_dates)
+                if missing:
+                    return False, f"Dipendenti non trovati: {self._name_list(missing)}", 0
+                # Il vincolo valid_dates fallirebbe sul primo ruolo: si segnalano tutti i nomi
+                early = self.repo.get_terminations_before_start(end_dates)
+                if early:
+                    return False, ("Data di terminazione precedente all'inizio di un ruolo attivo: "
+                                   f"{self._name_list(early)}"), 0
                 
+                roles_count, _ = self.repo.bulk_terminate_persons(end_dates)
+            return True, f"{len(end_dates)} dipendenti terminati, {roles_count} ruoli terminati", roles_count
+            
         except Exception as e:
             return False, f"Errore durante la terminazione: {str(e)}", 0
     
+    @staticmethod
+    def _name_list(names: List[str], limit: int = 10) -> str:
+        shown = ', '.join(names[:limit])
+        return shown + (f" e altri {len(names) - limit}" if len(names) > limit else '')
+    
     # ================================================================
     # VALIDATION HELPERS
     # ================================================================
     
-    def validate_person_data(self, person_data: Dict) -> List[str]:
-        """Valida dati persona"""
+    @staticmethod
+    def validate_person_data(person_data: Dict, partial: bool = False) -> List[str]:
+        """Valida dati persona (partial: solo i campi presenti, per gli aggiornamenti)"""
         errors = []
         
-        if not person_data.get('name', '').strip():
+        if not partial and not (person_data.get('name') or '').strip():
             errors.append("Nome richiesto")
         
         if person_data.get('email') and '@' not in person_data['email']:
             errors.append("Email non valida")
         
-        if person_data.get('status') not in ['ACTIVE', 'INACTIVE', 'TERMINATED']:
+        if (not partial or 'status' in person_data) and \
+                person_data.get('status') not in ['ACTIVE', 'INACTIVE', 'TERMINATED']:
             errors.append("Status non valido")
         
         return errors
     
-    def validate_role_data(self, role_data: Dict) -> List[str]:
-        """Valida dati ruolo"""
+    @staticmethod
+    def validate_role_data(role_data: Dict, partial: bool = False) -> List[str]:
+        """Valida dati ruolo (partial: solo i campi presenti, per gli aggiornamenti)"""
         errors = []
         
-        if not role_data.get('person_name'):
+        if not partial and not role_data.get('person_name'):
             errors.append("Nome persona richiesto")
         
-        if not role_data.get('function_name'):
+        if not partial and not role_data.get('function_name'):
             errors.append("Nome funzione richiesto")
         
-        try:
-            percentage = float(role_data.get('percentage', 1.0))
-            if percentage <= 0 or percentage > 1:
-                errors.append("Percentuale deve essere tra 0.01 e 1.0")
-        except (ValueError, TypeError):
-            errors.append("Percentuale non valida")
+        if not partial or 'percentage' in role_data:
+            try:
+                percentage = float(role_data.get('percentage', 1.0))
+                if not math.isfinite(percentage) or percentage <= 0 or percentage > 1:
+                    errors.append("Percentuale deve essere tra 0.01 e 1.0")
+            except (ValueError, TypeError):
+                errors.append("Percentuale non valida")
+        
+        return errors
+    
+    @staticmethod
+    def validate_function_data(function_data: Dict, partial: bool = False) -> List[str]:
+        """Valida dati funzione"""
+        errors = []
+        
+        name = (function_data.get('name') or '').strip()
+        if not partial and not name:
+            errors.append("Nome richiesto")
+        
+        if name and function_data.get('reports_to') == name:
+            errors.append("Una funzione non può riportare a se stessa")
+        
+        return errors
+    
+    @staticmethod
+    def validate_job_title_data(job_title_data: Dict, partial: bool = False) -> List[str]:
+        """Valida dati job title"""
+        errors = []
+        
+        if not partial and not (job_title_data.get('name') or '').strip():
+            errors.append("Nome richiesto")
+        
+        level = job_title_data.get('level')
+        if level is not None and level != '':
+            try:
+                int(level)
+            except (ValueError, TypeError):
+                errors.append("Livello non valido")
         
         return errors
     
@@ -401,14 +565,48 @@ class OrganigrammaService:
             return []
         return self.repo.search_persons(query)
     
-    def get_employee_profile(self, person_name: str) -> Optional[Dict]:
-        """Profilo completo dipendente con ruoli e reporting"""
-        person = self.repo.get_person(person_name)
+    def quick_search_employees(self, query: str, limit: int = 10) -> List[TypeaheadEntry]:
+        """Ricerca per prefisso (typeahead) sull'indice in memoria"""
+        if len(query.strip()) < 2:
+            return []
+        return self.typeahead.search(query, limit)
+    
+    def search(self, query: str, kinds: Optional[List[str]] = None,
+               limit: int = 20) -> List[SearchHit]:
+        """Ricerca globale (persone, funzioni, job title) per la quick search"""
+        if len(query.strip()) < 2:
+            return []
+        return self.repo.search(query, kinds, limit)
+    
+    def _snapshot(self) -> Optional[OrgGraph]:
+        """Grafo in memoria, o None se va letto SQLite: grafo in ricostruzione
+        oppure transazione aperta (che vede dati non ancora committati)"""
+        if self.repo.db.in_transaction():
+            return None
+        return self.graph.current()
+    
+    def get_employee_profile(self, person_name: str, as_of: Optional[date] = None) -> Optional[Dict]:
+        """Profilo completo dipendente con ruoli e reporting (oggi o alla data as_of)"""
+        if as_of is not None:
+            person = self.repo.get_person(person_name)
+            if not person:
+                return None
+            roles = self.repo.get_person_roles(person_name, as_of=as_of)
+            reports = self.repo.get_direct_reports(person_name, as_of=as_of)
+            return {
+                'person': person,
+                'roles': roles,
+                'direct_reports': reports,
+                'reports_count': len(reports)
+            }
+        
+        source = self._snapshot() or self.repo
+        person = source.get_person(person_name)
         if not person:
             return None
         
-        roles = self.repo.get_person_roles(person_name)
-        reports = self.repo.get_direct_reports(person_name)
+        roles = source.get_person_roles(person_name)
+        reports = source.get_direct_reports(person_name)
         
         return {
             'person': person,
@@ -417,35 +615,107 @@ class OrganigrammaService:
             'reports_count': len(reports)
         }
     
-    def get_organization_tree(self) -> List[OrgChartNode]:
-        """Organigramma completo strutturato"""
-        return self.repo.get_organization_chart()
+    def get_organization_tree(self, as_of: Optional[date] = None) -> List[OrgChartNode]:
+        """Organigramma completo strutturato (il passato si legge da SQLite)"""
+        if as_of is not None:
+            return self.repo.get_organization_chart(as_of)
+        return (self._snapshot() or self.repo).get_organization_chart()
+    
+    def get_function_roles(self, function_name: str, active_only: bool = True,
+                           as_of: Optional[date] = None) -> List[Role]:
+        """Ruoli di una funzione (gli attivi dal grafo in memoria)"""
+        if as_of is not None or not active_only:
+            return self.repo.get_function_roles(function_name, active_only, as_of)
+        return (self._snapshot() or self.repo).get_function_roles(function_name)
+    
+    def get_person_roles(self, person_name: str, as_of: Optional[date] = None) -> List[Role]:
+        """Ruoli della persona attivi oggi o validi alla data as_of"""
+        if as_of is not None:
+            return self.repo.get_person_roles(person_name, as_of=as_of)
+        return (self._snapshot() or self.repo).get_person_roles(person_name)
+    
+    def get_direct_reports(self, manager_name: str, as_of: Optional[date] = None) -> List[Role]:
+        """Ruoli che riportano alla persona, oggi o alla data as_of"""
+        if as_of is not None:
+            return self.repo.get_direct_reports(manager_name, as_of)
+        return (self._snapshot() or self.repo).get_direct_reports(manager_name)
+    
+    def get_function_rollups(self) -> List[FunctionRollup]:
+        """Headcount, FTE e interim di ogni funzione, diretti e cumulati"""
+        return (self._snapshot() or self.repo).get_function_rollups()
+    
+    def get_function_rollup(self, function_name: str) -> Optional[FunctionRollup]:
+        """Headcount, FTE e interim di una funzione e delle sue sotto-funzioni"""
+        graph = self._snapshot()
+        if graph is not None:
+            return graph.get_function_rollup(function_name)
+        rollups = self.repo.get_function_rollups([function_name])
+        return rollups[0] if rollups else None
     
     def get_function_details(self, function_name: str) -> Optional[Dict]:
         """Dettagli funzione con persone assegnate"""
-        function = self.repo.get_function(function_name)
-        if not function:
-            return None
+        graph = self._snapshot()
+        if graph is None:
+            function = self.repo.get_function(function_name)
+            if not function:
+                return None
+            ancestors = self.repo.get_function_ancestors(function_name)
+            sub_functions = self.repo.get_function_subtree(function_name, max_depth=1,
+                                                           include_self=False)
+            roles = self.repo.get_function_roles(function_name)
+            names = [function_name, *(sub.function_name for sub in sub_functions)]
+            rollups = {r.function_name: r for r in self.repo.get_function_rollups(names)}
+        else:
+            function = graph.get_function(function_name)
+            if not function:
+                return None
+            ancestors = graph.get_function_ancestors(function_name)
+            sub_functions = graph.get_sub_functions(function_name)
+            roles = graph.get_function_roles(function_name)
+            rollups = {name: graph.get_function_rollup(name)
+                       for name in [function_name, *(sub.function_name for sub in sub_functions)]}
         
-        roles = self.repo.get_function_roles(function_name)
         return {
             'function': function,
+            'ancestors': ancestors,
+            'sub_functions': sub_functions,
             'roles': roles,
-            'headcount': len(roles)
+            'headcount': len(roles),
+            'rollup': rollups.get(function_name),
+            'sub_rollups': rollups
         }
     
     def _get_recent_changes(self, limit: int = 10) -> List[Dict]:
         """Modifiche recenti (implementazione con audit trail)"""
-        query = """
-        SELECT * FROM role_history 
-        ORDER BY change_date DESC 
-        LIMIT ?
-        """
-        rows = self.repo.db.execute_query(query, (limit,))
-        return [dict(row) for row in rows]
+        return self.history.history(limit)
+    
+    def get_role_history(self, limit: int = 100, **filters) -> List[Dict]:
+        """Storico modifiche dei ruoli, anche dagli archivi annuali (più recenti per prime)"""
+        return self.history.history(limit, **filters)
+    
+    def save_org_snapshot(self, name: str, flags: Optional[str] = None) -> Tuple[bool, str, Optional[int]]:
+        """Salva una fotografia dell'organigramma attuale per i confronti successivi"""
+        name = (name or '').strip()
+        if not name:
+            return False, "Nome fotografia richiesto", None
+        if any(s['name'] == name for s in self.diff.list_snapshots()):
+            return False, f"Fotografia '{name}' già esistente", None
+        try:
+            snapshot_id = self.diff.save_snapshot(name, flags)
+            return True, f"Fotografia '{name}' salvata", snapshot_id
+        except Exception as e:
+            return False, f"Errore salvataggio fotografia: {str(e)}", None
+    
+    def list_org_snapshots(self) -> List[Dict]:
+        """Fotografie salvate, dalla più recente"""
+        return self.diff.list_snapshots()
+    
+    def delete_org_snapshot(self, name: str) -> Tuple[bool, str]:
+        """Elimina una fotografia salvata"""
+        if self.diff.delete_snapshot(name):
+            return True, f"Fotografia '{name}' eliminata"
+        return False, f"Fotografia '{name}' non trovata"
     
     def _get_interim_roles(self) -> List[Role]:
         """Ruoli ad interim attivi"""
-        query = "SELECT * FROM roles WHERE ad_interim=1 AND end_date IS NULL ORDER BY start_date DESC"
-        rows = self.repo.db.execute_query(query)
-        return [Role(**dict(row)) for row in rows]
\ No newline at end of file
+        return self.repo.get_interim_roles()
\ No newline at end of file
@@ -0,0 +1,275 @@
+# src/services/typeahead.py - Indice in memoria per la ricerca rapida dei dipendenti
+import logging
+import re
+import sys
+import threading
+import time
+import unicodedata
+from bisect import bisect_left, insort
+from typing import Dict, List, Optional, Set, Tuple
+
+from ..database.connection import DatabaseConnection
+from ..database.models import RowModel, model
+
+_WORD = re.compile(r"\w+")
+
+
+def normalize(text: Optional[str]) -> str:
+    """Minuscolo, senza accenti e punteggiatura ('Niccolò D'Amico' -> 'niccolo d amico')"""
+    if not text:
+        return ""
+    if not text.isascii():
+        decomposed = unicodedata.normalize('NFKD', text)
+        text = "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+    return " ".join(_WORD.findall(text.casefold()))
+
+
+@model
+class TypeaheadEntry(RowModel):
+    id: int
+    name: str
+    employee_id: Optional[str] = None
+    status: Optional[str] = None
+
+
+class _Indexed:
+    """Voce indicizzata: dati restituiti, chiavi complete e parole normalizzate"""
+    __slots__ = ('entry', 'keys', 'tokens', 'updated_at', 'aliases')
+
+    def __init__(self, entry: TypeaheadEntry, aliases: List[str], updated_at: Optional[str]):
+        self.entry = entry
+        # Per confrontare l'indice con il database (vedi TypeaheadIndex._fingerprint)
+        self.updated_at = updated_at or ""
+        self.aliases = len(aliases)
+        texts = [entry.name, entry.employee_id, *aliases]
+        keys = {key for key in map(normalize, texts) if key}
+        # Tuple e stringhe internate: le parole si ripetono fra migliaia di persone
+        self.keys: Tuple[str, ...] = tuple(keys)
+        self.tokens: Tuple[str, ...] = tuple({sys.intern(token) for key in keys
+                                              for token in key.split()})
+
+
+class TypeaheadIndex:
+    """Ricerca per prefisso su nomi, alias e matricole, tutta in memoria.
+
+    Due liste ordinate di (chiave, id) interrogate con bisect: le chiavi
+    complete (il nome inizia con la ricerca) e le singole parole (ogni
+    parola cercata è il prefisso di una parola della persona). Le modifiche
+    arrivano dalle notifiche 'persons' dopo il commit: le persone toccate
+    vengono ricaricate alla ricerca successiva, un import ricostruisce tutto.
+    Le scritture di altri processi non notificano nulla: a ogni cambio di
+    PRAGMA data_version si confronta un'impronta delle persone (conteggi,
+    id e updated_at massimi) con l'indice e, se differisce, si ricostruisce.
+
+        index = TypeaheadIndex.for_database(db)
+        index.search('mar ros', limit=10)
+    """
+
+    TOPIC = 'persons'
+    # Oltre questa soglia ricostruire costa meno che aggiornare voce per voce
+    MAX_REFRESH = 1000
+    # Candidati esaminati al massimo per ricerca (limite al caso peggiore)
+    MAX_SCAN = 2000
+
+    def __init__(self, db: DatabaseConnection):
+        self.db = db
+        self._lock = threading.RLock()
+        self._items: Dict[int, _Indexed] = {}
+        self._by_name: Dict[str, int] = {}
+        self._keys: List[Tuple[str, int]] = []
+        self._tokens: List[Tuple[str, int]] = []
+        self._stale = True
+        self._dirty: Set[str] = set()
+        # data_version dell'ultimo confronto con il database
+        self._version: Optional[int] = None
+        db.subscribe(self.TOPIC, self.invalidate)
+
+    @classmethod
+    def for_database(cls, db: DatabaseConnection) -> 'TypeaheadIndex':
+        """Indice condiviso da tutte le connessioni allo stesso database"""
+        return db.shared('typeahead', lambda: cls(db))
+
+    # ----------------------------------------------------------------
+    # AGGIORNAMENTO
+    # ----------------------------------------------------------------
+
+    def invalidate(self, names: Optional[Set[str]] = None):
+        """Segna da ricaricare le persone indicate (None = tutto l'indice)"""
+        with self._lock:
+            if names is None:
+                self._stale = True
+                self._dirty.clear()
+            elif not self._stale:
+                self._dirty.update(names)
+
+    def build(self):
+        """(Ri)costruisce l'indice leggendo persone e alias da uno snapshot"""
+        started = time.perf_counter()
+        with self._lock:
+            self._stale = False
+            self._dirty.clear()
+        # Versione letta prima del caricamento: un commit nel frattempo
+        # porta a un nuovo confronto alla ricerca successiva
+        version = self.db.data_version()
+        items = self._load()
+        keys = sorted((key, pid) for pid, item in items.items() for key in item.keys)
+        tokens = sorted((token, pid) for pid, item in items.items() for token in item.tokens)
+        with self._lock:
+            self._items = items
+            self._by_name = {item.entry.name: pid for pid, item in items.items()}
+            self._keys = keys
+            self._tokens = tokens
+            self._version = version
+        logging.info(f"Indice typeahead: {len(items)} persone in "
+                     f"{time.perf_counter() - started:.2f}s")
+
+    def _load(self, names: Optional[List[str]] = None) -> Dict[int, _Indexed]:
+        where, params = "", ()
+        if names is not None:
+            where = f"WHERE p.name IN ({', '.join('?' for _ in names)})"
+            params = tuple(names)
+        with self.db.read_snapshot() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = TypeaheadEntry.from_row
+            entries = cursor.execute(
+                f"SELECT p.id, p.name, p.employee_id, p.status FROM persons p {where}", params
+            ).fetchall()
+            updated = dict(conn.execute(f"SELECT p.id, p.updated_at FROM persons p {where}", params))
+            aliases: Dict[str, List[str]] = {}
+            for person_name, alias in conn.execute(
+                f"SELECT pa.person_name, pa.alias FROM person_aliases pa "
+                f"{where.replace('p.name', 'pa.person_name')}", params
+            ):
+                aliases.setdefault(person_name, []).append(alias)
+        return {entry.id: _Indexed(entry, aliases.get(entry.name, []), updated.get(entry.id))
+                for entry in entries}
+
+    def _fingerprint(self) -> Tuple:
+        """Impronta delle persone nel database, da confrontare con _indexed_fingerprint"""
+        with self.db.read_snapshot() as conn:
+            persons = conn.execute(
+                "SELECT COUNT(*), COALESCE(MAX(id), 0), COALESCE(MAX(updated_at), '') FROM persons"
+            ).fetchone()
+            aliases = conn.execute(
+                "SELECT COUNT(*) FROM person_aliases pa JOIN persons p ON p.name = pa.person_name"
+            ).fetchone()
+        return (*persons, aliases[0])
+
+    def _indexed_fingerprint(self) -> Tuple:
+        with self._lock:
+            items = list(self._items.values())
+        return (len(items), max((item.entry.id for item in items), default=0),
+                max((item.updated_at for item in items), default=''),
+                sum(item.aliases for item in items))
+
+    def _refresh(self):
+        """Ricarica solo le persone modificate dall'ultima ricerca"""
+        with self._lock:
+            names, self._dirty = sorted(self._dirty), set()
+        fresh = self._load(names)
+        with self._lock:
+            for name in names:
+                pid = self._by_name.get(name)
+                if pid is not None:
+                    self._remove(pid)
+            for pid, item in fresh.items():
+                self._remove(pid)
+                self._add(pid, item)
+
+    def _add(self, pid: int, item: _Indexed):
+        self._items[pid] = item
+        self._by_name[item.entry.name] = pid
+        for key in item.keys:
+            insort(self._keys, (key, pid))
+        for token in item.tokens:
+            insort(self._tokens, (token, pid))
+
+    def _remove(self, pid: int):
+        item = self._items.pop(pid, None)
+        if item is None:
+            return
+        self._by_name.pop(item.entry.name, None)
+        for sorted_list, values in ((self._keys, item.keys), (self._tokens, item.tokens)):
+            for value in values:
+                pos = bisect_left(sorted_list, (value, pid))
+                if pos < len(sorted_list) and sorted_list[pos] == (value, pid):
+                    del sorted_list[pos]
+
+    @property
+    def is_fresh(self) -> bool:
+        """True se la ricerca non deve prima rileggere il database"""
+        return (not self._stale and not self._dirty
+                and self._version == self.db.data_version())
+
+    def _ensure_fresh(self):
+        if self._stale or len(self._dirty) > self.MAX_REFRESH:
+            self.build()
+            return
+        version = self.db.data_version()
+        if self._dirty:
+            self._refresh()
+        if version != self._version:
+            # Commit dopo l'ultimo confronto: se le persone indicizzate non
+            # tornano con il database li ha fatti un altro processo
+            if self._fingerprint() != self._indexed_fingerprint():
+                self.build()
+                return
+            with self._lock:
+                self._version = version
+
+    # ----------------------------------------------------------------
+    # RICERCA
+    # ----------------------------------------------------------------
+
+    def search(self, query: str, limit: int = 10) -> List[TypeaheadEntry]:
+        """Prime `limit` persone: prima chi inizia con la ricerca, poi per parola"""
+        text = normalize(query)
+        if not text or limit < 1:
+            return []
+        self._ensure_fresh()
+        terms = text.split()
+
+        with self._lock:
+            found: Dict[int, None] = {}
+            for pid in self._prefix_range(self._keys, text):
+                found.setdefault(pid)
+                if len(found) >= limit:
+                    break
+
+            if len(found) < limit:
+                # La parola con meno corrispondenze guida la scansione
+                driver = min(terms, key=lambda term: self._prefix_count(self._tokens, term))
+                others = list(terms)
+                others.remove(driver)
+                for scanned, pid in enumerate(self._prefix_range(self._tokens, driver)):
+                    if scanned >= self.MAX_SCAN:
+                        break
+                    if pid in found:
+                        continue
+                    tokens = self._items[pid].tokens
+                    if all(any(token.startswith(term) for token in tokens) for term in others):
+                        found[pid] = None
+                        if len(found) >= limit:
+                            break
+
+            return [self._items[pid].entry for pid in found]
+
+    @staticmethod
+    def _prefix_count(sorted_list: List[Tuple[str, int]], prefix: str) -> int:
+        """Numero di voci con la chiave che inizia con il prefisso (due bisect)"""
+        return (bisect_left(sorted_list, (prefix + "\U0010ffff",))
+                - bisect_left(sorted_list, (prefix,)))
+
+    @staticmethod
+    def _prefix_range(sorted_list: List[Tuple[str, int]], prefix: str):
+        """Id delle voci la cui chiave inizia con il prefisso, in ordine di chiave"""
+        pos = bisect_left(sorted_list, (prefix,))
+        while pos < len(sorted_list):
+            key, pid = sorted_list[pos]
+            if not key.startswith(prefix):
+                return
+            yield pid
+            pos += 1
+
+    def __len__(self) -> int:
+        return len(self._items)
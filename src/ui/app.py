@@ -1,15 +1,21 @@
 # src/ui/app.py - Versione pulita
-from fastapi import FastAPI, Request, HTTPException
+from fastapi import FastAPI, Request, HTTPException, Query
 from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse
-from typing import Optional
+from fastapi.responses import HTMLResponse, JSONResponse, Response
+from typing import Optional, Tuple
+from datetime import date
+from urllib.parse import quote, urlencode
 import os
 import logging
 
 from ..database.connection import DatabaseConnection
+from ..database.migrations import SEARCH_KINDS
 from ..database.repository import OrganigrammaRepository
 from ..services.organigramma_service import OrganigrammaService
+from ..services.async_facade import AsyncFacade, QueryTimeoutError, shutdown_db_executor
+from ..web.etag import ConditionalGetMiddleware
+from ..web.fragments import FragmentCache
 
 # Configurazione logging
 logging.basicConfig(level=logging.INFO)
@@ -23,14 +29,26 @@ try:
     db_connection = DatabaseConnection()
     repository = OrganigrammaRepository(db_connection)
     service = OrganigrammaService(repository)
+    # Facciate async: il lavoro SQLite gira nell'executor, non sull'event loop
+    async_repository = AsyncFacade(repository, db_connection)
+    async_service = AsyncFacade(service, db_connection)
     logger.info("Database e servizi inizializzati con successo")
 except Exception as e:
     logger.error(f"Errore inizializzazione: {e}")
     raise
 
+# GET condizionali: 304 senza eseguire la route finché il database non cambia
+CONDITIONAL_GET_PATHS = ['/organization', '/functions', '/api/stats',
+                         '/api/functions', '/api/persons']
+app.add_middleware(ConditionalGetMiddleware, db=db_connection, paths=CONDITIONAL_GET_PATHS)
+
 # Setup templates
 templates = Jinja2Templates(directory="src/web/templates")
 
+# HTML già renderizzato di organigramma e funzioni, valido finché il database non cambia.
+# Le pagine in cache non devono dipendere dalla richiesta (il contesto non la contiene)
+fragment_cache = FragmentCache(int(os.environ.get("FRAGMENT_CACHE_MB", "32")) * 1024 * 1024)
+
 # Mount static files se esistono
 static_path = "src/web/static"
 if os.path.exists(static_path):
@@ -56,12 +74,14 @@ except ImportError as e:
 async def dashboard(request: Request):
     """Dashboard principale"""
     try:
-        data = service.get_dashboard_data()
+        data = await async_service.get_dashboard_data()
         return templates.TemplateResponse("dashboard.html", {
             "request": request,
             "title": "Dashboard",
             **data
         })
+    except QueryTimeoutError:
+        raise
     except Exception as e:
         logger.error(f"Errore dashboard: {e}")
         raise HTTPException(500, "Errore interno del server")
@@ -71,9 +91,9 @@ async def employees_list(request: Request, search: Optional[str] = None):
     """Lista dipendenti"""
     try:
         if search:
-            employees = service.search_employees(search)
+            employees = await async_service.search_employees(search)
         else:
-            employees = repository.get_all_persons()
+            employees = await async_repository.get_all_persons()
         
         return templates.TemplateResponse("employees.html", {
             "request": request,
@@ -81,6 +101,8 @@ async def employees_list(request: Request, search: Optional[str] = None):
             "employees": employees,
             "search_query": search or ""
         })
+    except QueryTimeoutError:
+        raise
     except Exception as e:
         logger.error(f"Errore lista dipendenti: {e}")
         raise HTTPException(500, "Errore interno del server")
@@ -89,7 +111,7 @@ async def employees_list(request: Request, search: Optional[str] = None):
 async def employee_profile(request: Request, person_name: str):
     """Profilo dipendente"""
     try:
-        profile = service.get_employee_profile(person_name)
+        profile = await async_service.get_employee_profile(person_name)
         if not profile:
             raise HTTPException(404, "Dipendente non trovato")
         
@@ -100,20 +122,45 @@ async def employee_profile(request: Request, person_name: str):
         })
     except HTTPException:
         raise
+    except QueryTimeoutError:
+        raise
     except Exception as e:
         logger.error(f"Errore profilo dipendente {person_name}: {e}")
         raise HTTPException(500, "Errore interno del server")
 
+# Argomenti (notify_change) da cui dipendono le pagine in cache
+PAGE_TOPICS = ('functions', 'roles', 'person_status')
+
+def render_cached(key, version: Tuple[int, ...], template_name: str, context: dict) -> Response:
+    """Renderizza la pagina e la memorizza nella cache dei frammenti"""
+    body = fragment_cache.put(key, version, templates.get_template(template_name).render(context))
+    return Response(content=body, media_type="text/html")
+
+def cached_page(key) -> Tuple[Optional[Response], Tuple[int, ...]]:
+    """Pagina dalla cache se funzioni e ruoli non sono cambiati, e la versione letta"""
+    version = db_connection.change_version(*PAGE_TOPICS)
+    body = fragment_cache.get(key, version)
+    if body is None:
+        return None, version
+    return Response(content=body, media_type="text/html"), version
+
 @app.get("/organization", response_class=HTMLResponse)
-async def organization_chart(request: Request):
-    """Organigramma"""
+async def organization_chart(request: Request, as_of: Optional[date] = None):
+    """Organigramma (attuale o alla data as_of)"""
     try:
-        org_tree = service.get_organization_tree()
-        return templates.TemplateResponse("organization.html", {
-            "request": request,
-            "title": "Organigramma",
+        key = ("organization", as_of)
+        cached, version = cached_page(key)
+        if cached:
+            return cached
+        org_tree = await async_service.get_organization_tree(as_of)
+        title = f"Organigramma al {as_of.strftime('%d/%m/%Y')}" if as_of else "Organigramma"
+        return render_cached(key, version, "organization.html", {
+            "title": title,
+            "as_of": as_of,
             "org_tree": org_tree
         })
+    except QueryTimeoutError:
+        raise
     except Exception as e:
         logger.error(f"Errore organigramma: {e}")
         raise HTTPException(500, "Errore interno del server")
@@ -122,12 +169,16 @@ async def organization_chart(request: Request):
 async def functions_list(request: Request):
     """Lista funzioni"""
     try:
-        functions = repository.get_all_functions()
-        return templates.TemplateResponse("functions.html", {
-            "request": request,
+        cached, version = cached_page("functions")
+        if cached:
+            return cached
+        functions = await async_repository.get_all_functions()
+        return render_cached("functions", version, "functions.html", {
             "title": "Funzioni",
             "functions": functions
         })
+    except QueryTimeoutError:
+        raise
     except Exception as e:
         logger.error(f"Errore lista funzioni: {e}")
         raise HTTPException(500, "Errore interno del server")
@@ -136,17 +187,22 @@ async def functions_list(request: Request):
 async def function_detail(request: Request, function_name: str):
     """Dettaglio funzione"""
     try:
-        details = service.get_function_details(function_name)
+        key = ("function", function_name)
+        cached, version = cached_page(key)
+        if cached:
+            return cached
+        details = await async_service.get_function_details(function_name)
         if not details:
             raise HTTPException(404, "Funzione non trovata")
         
-        return templates.TemplateResponse("function_detail.html", {
-            "request": request,
+        return render_cached(key, version, "function_detail.html", {
             "title": f"Funzione - {function_name}",
             **details
         })
     except HTTPException:
         raise
+    except QueryTimeoutError:
+        raise
     except Exception as e:
         logger.error(f"Errore dettaglio funzione {function_name}: {e}")
         raise HTTPException(500, "Errore interno del server")
@@ -159,22 +215,26 @@ async def function_detail(request: Request, function_name: str):
 async def admin_dashboard(request: Request):
     """Dashboard amministrativa"""
     try:
-        stats = repository.get_detailed_stats()
+        stats = await async_repository.get_detailed_stats()
         return templates.TemplateResponse("admin/dashboard.html", {
             "request": request,
             "title": "Amministrazione",
             "stats": stats
         })
+    except QueryTimeoutError:
+        raise
     except Exception as e:
         logger.error(f"Errore admin dashboard: {e}")
         # Fallback con stats base
         try:
-            stats = repository.get_stats()
+            stats = await async_repository.get_stats()
             return templates.TemplateResponse("admin/dashboard.html", {
                 "request": request,
                 "title": "Amministrazione",
                 "stats": stats
             })
+        except QueryTimeoutError:
+            raise
         except:
             raise HTTPException(500, "Errore interno del server")
 
@@ -183,21 +243,50 @@ async def admin_dashboard(request: Request):
 # ================================================================
 
 @app.get("/api/search/employees")
-async def api_search_employees(q: str):
-    """API ricerca dipendenti"""
+async def api_search_employees(q: str, limit: int = Query(10, ge=1, le=50)):
+    """API ricerca dipendenti (typeahead in memoria)"""
     try:
-        employees = service.search_employees(q)
+        if service.typeahead.is_fresh:
+            # Niente executor: la ricerca sull'indice dura microsecondi
+            employees = service.quick_search_employees(q, limit)
+        else:
+            # L'indice va prima aggiornato dal database
+            employees = await async_service.quick_search_employees(q, limit)
         return [{"name": emp.name, "employee_id": emp.employee_id, "status": emp.status} 
                 for emp in employees]
+    except QueryTimeoutError:
+        raise
     except Exception as e:
         logger.error(f"Errore ricerca API: {e}")
         return []
 
+def _search_hit_url(kind: str, name: str) -> str:
+    """Pagina di destinazione di un risultato della ricerca"""
+    if kind == 'person':
+        return f"/employee/{quote(name, safe='')}"
+    if kind == 'function':
+        return f"/function/{quote(name, safe='')}"
+    return f"/admin/roles?{urlencode({'job_title_name': name})}"
+
+@app.get("/api/search")
+async def api_search(q: str, types: Optional[str] = None,
+                     limit: int = Query(20, ge=1, le=100)):
+    """API ricerca full-text: persone, funzioni e job title per rilevanza"""
+    kinds = [kind.strip() for kind in types.split(',') if kind.strip()] if types else None
+    unknown = [kind for kind in kinds or () if kind not in SEARCH_KINDS]
+    if unknown:
+        raise HTTPException(400, f"Tipi non supportati: {', '.join(unknown)} "
+                                 f"(ammessi: {', '.join(SEARCH_KINDS)})")
+    hits = await async_service.search(q, kinds, limit)
+    return [{**hit.to_dict(), "url": _search_hit_url(hit.kind, hit.name)} for hit in hits]
+
 @app.get("/api/stats")
 async def api_stats():
     """API statistiche"""
     try:
-        return service.get_dashboard_data()['stats']
+        return await async_repository.get_stats()
+    except QueryTimeoutError:
+        raise
     except Exception as e:
         logger.error(f"Errore stats API: {e}")
         return {"error": "Dati non disponibili"}
@@ -206,13 +295,17 @@ async def api_stats():
 async def health_check():
     """Health check"""
     try:
-        stats = repository.get_stats()
+        stats = await async_repository.get_stats()
         return {
             "status": "ok", 
             "service": "organigramma-manager",
             "database": "connected",
+            "database_profile": db_connection.profile_info(),
+            "fragment_cache": fragment_cache.info(),
             "total_persons": stats.get('total_persons', 0)
         }
+    except QueryTimeoutError:
+        raise
     except Exception as e:
         logger.error(f"Health check failed: {e}")
         return {
@@ -222,7 +315,33 @@ async def health_check():
             "error": str(e)
         }
 
+@app.on_event("startup")
+async def build_typeahead_index():
+    """Costruisce l'indice typeahead prima delle prime ricerche"""
+    try:
+        await async_service.with_timeout(None).run(service.typeahead.build)
+    except Exception as e:
+        logger.error(f"Errore costruzione indice typeahead: {e}")
+
+@app.on_event("startup")
+async def build_org_graph():
+    """Carica in memoria il grafo dell'organigramma (profili, funzioni, organigramma)"""
+    try:
+        await async_service.with_timeout(None).run(service.graph.build)
+    except Exception as e:
+        logger.error(f"Errore costruzione grafo organigramma: {e}")
+
+@app.on_event("shutdown")
+async def shutdown_database():
+    """Chiude executor e connessioni del pool alla chiusura dell'applicazione"""
+    shutdown_db_executor()
+    db_connection.close()
+
 # Exception handlers
+@app.exception_handler(QueryTimeoutError)
+async def query_timeout_handler(request: Request, exc: QueryTimeoutError):
+    return JSONResponse(status_code=504, content={"detail": str(exc)})
+
 @app.exception_handler(404)
 async def not_found_handler(request: Request, exc: HTTPException):
     return templates.TemplateResponse("404.html", {
@@ -78,5 +78,159 @@ def status(check_db):
     except:
         click.echo("❌ Server web non attivo")
 
+@cli.command(name='import')
+@click.argument('source', type=click.File('rb'))
+@click.option('--entity', type=click.Choice(['functions', 'job_titles', 'persons',
+                                             'person_aliases', 'function_aliases', 'roles']),
+              help='Entità contenuta nel file (obbligatoria per CSV)')
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'json', 'ndjson']),
+              help="Formato del file (dedotto dall'estensione se omesso)")
+@click.option('--batch-size', default=5000, show_default=True, help='Righe per executemany')
+@click.option('--strict', is_flag=True, help='Annulla tutto se una riga non è valida')
+@click.option('--rebuild-indexes/--keep-indexes', default=None,
+              help='Ricostruisce gli indici dei ruoli a fine import (default: solo per import consistenti)')
+@click.option('--db', 'db_path', default='data/organigramma.db', show_default=True,
+              help='Percorso database')
+@click.option('--profile', default=None, help='Profilo performance database (es. fast)')
+def import_data(source, entity, fmt, batch_size, strict, rebuild_indexes, db_path, profile):
+    """Importa in blocco funzioni, job title, persone, alias e ruoli"""
+    from src.database.connection import DatabaseConnection
+    from src.services.bulk_import import BulkImporter, BulkImportError, guess_format
+    
+    fmt = fmt or guess_format(source.name)
+    if not fmt:
+        raise click.UsageError("Impossibile dedurre il formato: usare --format")
+    
+    click.echo(f"📥 Import {fmt.upper()} da {source.name}")
+    try:
+        db = DatabaseConnection(db_path, profile=profile)
+        importer = BulkImporter(db, batch_size=batch_size, strict=strict,
+                                rebuild_indexes=rebuild_indexes)
+        report = importer.import_stream(source, fmt, entity)
+        db.close()
+    except BulkImportError as e:
+        click.echo(f"❌ Import fallito: {e}")
+        sys.exit(1)
+    
+    for name, count in report.inserted.items():
+        rejected = report.rejected.get(name, 0)
+        if count or rejected:
+            click.echo(f"   {name}: {count} inseriti, {rejected} scartati")
+    for error in report.errors[:10]:
+        click.echo(f"   ⚠️  {error}")
+    if len(report.errors) > 10:
+        click.echo(f"   ... e altri {sum(report.rejected.values()) - 10} errori")
+    click.echo(f"✅ {report.total_inserted} righe in {report.elapsed:.2f}s "
+               f"({report.rows_per_sec:,.0f} righe/s)")
+
+@cli.command(name='export')
+@click.argument('entity', type=click.Choice(['functions', 'job_titles', 'persons', 'roles',
+                                             'role_history', 'organization_chart']))
+@click.option('--format', 'fmt', type=click.Choice(['ndjson', 'csv']), default='ndjson',
+              show_default=True, help='Formato di output')
+@click.option('--output', '-o', type=click.File('wb'), default='-',
+              help='File di destinazione (default: stdout)')
+@click.option('--chunk-size', default=1000, show_default=True, help='Righe lette per blocco')
+@click.option('--db', 'db_path', default='data/organigramma.db', show_default=True,
+              help='Percorso database')
+@click.option('--profile', default=None, help='Profilo performance database (es. fast)')
+def export_data(entity, fmt, output, chunk_size, db_path, profile):
+    """Esporta in streaming tabelle e organigramma (NDJSON o CSV)"""
+    from src.database.connection import DatabaseConnection
+    from src.services.bulk_export import BulkExporter
+    
+    db = DatabaseConnection(db_path, profile=profile)
+    stream = BulkExporter(db, chunk_size=chunk_size).open(entity, fmt)
+    for chunk in stream:
+        output.write(chunk)
+    output.flush()
+    db.close()
+    click.echo(f"✅ {stream.rows} righe esportate ({entity}, {fmt.upper()})", err=True)
+
+@cli.command(name='archive-history')
+@click.option('--retention-days', default=365, show_default=True,
+              help='Giorni di storico da mantenere nel database')
+@click.option('--purge-before', type=int, default=None,
+              help="Elimina gli archivi degli anni precedenti a quello indicato")
+@click.option('--archive-dir', default=None, help='Cartella archivi (default: <db>/archive)')
+@click.option('--vacuum', is_flag=True, help='Compatta il database dopo lo spostamento')
+@click.option('--db', 'db_path', default='data/organigramma.db', show_default=True,
+              help='Percorso database')
+def archive_history(retention_days, purge_before, archive_dir, vacuum, db_path):
+    """Sposta lo storico ruoli più vecchio in archivi annuali"""
+    from src.database.connection import DatabaseConnection
+    from src.services.history_archive import HistoryArchive
+    
+    db = DatabaseConnection(db_path)
+    archive = HistoryArchive(db, archive_dir)
+    report = archive.archive(retention_days)
+    for year, count in sorted(report.archived.items()):
+        click.echo(f"   {year}: {count} righe -> {archive.archive_path(year)}")
+    if purge_before:
+        for year in archive.purge_before(purge_before):
+            click.echo(f"   🗑️  archivio {year} eliminato")
+    if vacuum and report.total_archived:
+        with db.get_connection() as conn:
+            conn.execute("VACUUM")
+    db.close()
+    click.echo(f"✅ {report.total_archived} modifiche anteriori al {report.cutoff} "
+               f"archiviate in {report.elapsed:.2f}s")
+
+@cli.command()
+@click.argument('name')
+@click.option('--db', 'db_path', default='data/organigramma.db', show_default=True,
+              help='Percorso database')
+def snapshot(name, db_path):
+    """Salva una fotografia dell'organigramma attuale per i confronti"""
+    import sqlite3
+    from src.database.connection import DatabaseConnection
+    from src.services.org_diff import OrgDiff
+    
+    db = DatabaseConnection(db_path)
+    try:
+        snapshot_id = OrgDiff(db).save_snapshot(name)
+    except sqlite3.IntegrityError:
+        raise click.ClickException(f"Fotografia '{name}' già esistente")
+    finally:
+        db.close()
+    click.echo(f"✅ Fotografia '{name}' salvata (id {snapshot_id})")
+
+@cli.command()
+@click.option('--from', 'from_date', type=click.DateTime(['%Y-%m-%d']), default=None,
+              help='Data iniziale (AAAA-MM-GG)')
+@click.option('--to', 'to_date', type=click.DateTime(['%Y-%m-%d']), default=None,
+              help='Data finale (default: oggi)')
+@click.option('--from-snapshot', default=None, help='Fotografia iniziale')
+@click.option('--to-snapshot', default=None, help='Fotografia finale')
+@click.option('--output', '-o', type=click.File('wb'), default='-',
+              help='File di destinazione (default: stdout)')
+@click.option('--db', 'db_path', default='data/organigramma.db', show_default=True,
+              help='Percorso database')
+def diff(from_date, to_date, from_snapshot, to_snapshot, output, db_path):
+    """Differenze dell'organigramma fra due date o due fotografie (NDJSON)"""
+    from datetime import date
+    from src.database.connection import DatabaseConnection
+    from src.services.org_diff import OrgDiff, OrgDiffError
+    
+    db = DatabaseConnection(db_path)
+    try:
+        if from_snapshot or to_snapshot:
+            if not (from_snapshot and to_snapshot):
+                raise OrgDiffError("Indicare sia --from-snapshot che --to-snapshot")
+            stream = OrgDiff(db).between_snapshots(from_snapshot, to_snapshot)
+        else:
+            if not from_date:
+                raise OrgDiffError("Indicare --from (e --to) oppure due fotografie")
+            end = to_date.date() if to_date else date.today()
+            stream = OrgDiff(db).between_dates(from_date.date(), end)
+        for chunk in stream:
+            output.write(chunk)
+        output.flush()
+    except OrgDiffError as e:
+        raise click.ClickException(str(e))
+    finally:
+        db.close()
+    click.echo(f"✅ {stream.changes} differenze", err=True)
+
 if __name__ == "__main__":
     cli()
\ No newline at end of file
@@ -0,0 +1,69 @@
+# src/web/etag.py - GET condizionali (ETag / If-None-Match) legati alla versione del database
+import uuid
+from typing import Iterable, Optional
+
+from starlette.middleware.base import BaseHTTPMiddleware, RequestResponseEndpoint
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.types import ASGIApp
+
+from ..database.connection import DatabaseConnection
+
+# Le pagine restano in cache (anche nei proxy) ma vanno sempre rivalidate
+DEFAULT_CACHE_CONTROL = "no-cache"
+
+
+class ConditionalGetMiddleware(BaseHTTPMiddleware):
+    """ETag forte dalla versione del database per le letture indicate.
+
+    Il valore combina PRAGMA data_version, che cambia a ogni commit (anche
+    di altri processi), con un identificativo del processo: dopo un riavvio
+    o un aggiornamento del codice gli ETag precedenti non sono più validi.
+    Se il client presenta un If-None-Match ancora valido la risposta è un
+    304 senza eseguire la route, quindi senza query né serializzazione.
+
+        app.add_middleware(ConditionalGetMiddleware, db=db,
+                           paths=['/api/stats', '/organization'])
+    """
+
+    def __init__(self, app: ASGIApp, db: DatabaseConnection, paths: Iterable[str],
+                 cache_control: str = DEFAULT_CACHE_CONTROL):
+        super().__init__(app)
+        self.db = db
+        self.paths = frozenset(paths)
+        self.cache_control = cache_control
+        self.instance = uuid.uuid4().hex[:12]
+
+    def current_etag(self) -> str:
+        return f'"{self.instance}-{self.db.data_version()}"'
+
+    async def dispatch(self, request: Request, call_next: RequestResponseEndpoint) -> Response:
+        if request.method not in ('GET', 'HEAD') or request.url.path not in self.paths:
+            return await call_next(request)
+
+        # Versione letta prima della route: se nel frattempo arriva un
+        # commit, l'ETag risulta già vecchio e la prossima richiesta rilegge
+        etag = self.current_etag()
+        headers = {"ETag": etag, "Cache-Control": self.cache_control}
+        if _etag_matches(request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers=headers)
+
+        response = await call_next(request)
+        if response.status_code == 200:
+            response.headers.update(headers)
+        return response
+
+
+def _etag_matches(header: Optional[str], etag: str) -> bool:
+    """Confronto debole di If-None-Match (RFC 9110): '*' o uno degli ETag elencati"""
+    if not header:
+        return False
+    for candidate in header.split(','):
+        candidate = candidate.strip()
+        if candidate == '*':
+            return True
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
@@ -0,0 +1,72 @@
+# src/web/fragments.py - Cache dell'HTML già renderizzato, legata alla versione dei dati
+import threading
+from collections import OrderedDict
+from typing import Hashable, Optional, Tuple
+
+DEFAULT_MAX_BYTES = 32 * 1024 * 1024
+
+
+class FragmentCache:
+    """HTML renderizzato (già codificato in UTF-8) per chiave, con LRU sui byte.
+
+    Ogni voce ricorda la versione dei dati con cui è stata prodotta (per
+    le pagine dell'organigramma DatabaseConnection.change_version su
+    funzioni, ruoli e status dei dipendenti): letta con una versione
+    diversa viene scartata. Le altre scritture (dati anagrafici, storico,
+    snapshot) non invalidano nulla; i commit di altri processi sì, perché
+    non dicono cosa hanno modificato. Le voci meno usate escono quando si
+    supera max_bytes.
+
+        html = cache.get(('function', name), version)
+        if html is None:
+            html = cache.put(('function', name), version, template.render(...))
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries: 'OrderedDict[Hashable, Tuple[Hashable, bytes]]' = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, version: Hashable) -> Optional[bytes]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version:
+                if entry is not None:
+                    self._drop(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: Hashable, version: Hashable, html: str) -> bytes:
+        """Memorizza la pagina e la restituisce codificata"""
+        body = html.encode('utf-8')
+        if len(body) > self.max_bytes:
+            return body
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (version, body)
+            self._size += len(body)
+            while self._size > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+        return body
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def _drop(self, key: Hashable):
+        _, body = self._entries.pop(key)
+        self._size -= len(body)
+
+    def info(self) -> dict:
+        """Occupazione e hit/miss (per diagnostica)"""
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._size,
+                    "max_bytes": self.max_bytes, "hits": self.hits, "misses": self.misses}
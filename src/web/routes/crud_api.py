@@ -1,13 +1,22 @@
-from fastapi import APIRouter, HTTPException, Depends, Form
-from fastapi.responses import JSONResponse
-from typing import Optional, Dict, Any
+from fastapi import APIRouter, HTTPException, Depends, Form, File, UploadFile, Request, Query
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse
+from typing import Optional, Dict, Any, List, Union
 from datetime import date, datetime
 from pydantic import BaseModel, validator
 import json
 
 from ...database.connection import DatabaseConnection
 from ...database.repository import OrganigrammaRepository
+from ...database.pagination import Page, PaginationError
 from ...services.organigramma_service import OrganigrammaService
+from ...services.async_facade import AsyncFacade
+from ...services.bulk_import import BulkImporter, BulkImportError, guess_format
+from ...services.bulk_export import BulkExporter, BulkExportError, MEDIA_TYPES
+from ...services.org_diff import OrgDiff, OrgDiffError
+from ...services.batch_operations import BatchProcessor, BatchError, MODES as BATCH_MODES
+from ...services.bulk_changes import (BulkChangeError, manager_changes, read_manager_changes,
+                                      read_terminations, text_lines)
 
 # Inizializzazione
 router = APIRouter(prefix="/api", tags=["CRUD"])
@@ -15,6 +24,34 @@ db_connection = DatabaseConnection()
 repository = OrganigrammaRepository(db_connection)
 service = OrganigrammaService(repository)
 
+# Facciate async: il lavoro SQLite gira nell'executor, non sull'event loop
+async_repository = AsyncFacade(repository, db_connection)
+async_service = AsyncFacade(service, db_connection)
+
+# ================================================================
+# PAGINAZIONE
+# ================================================================
+
+def paged_response(request: Request, page: Page,
+                   items: Optional[List[Dict[str, Any]]] = None) -> JSONResponse:
+    """Lista JSON con link alla pagina successiva (header Link e X-Next-Cursor)"""
+    headers = {}
+    if page.next_cursor:
+        next_url = request.url.include_query_params(cursor=page.next_cursor)
+        headers["Link"] = f'<{next_url}>; rel="next"'
+        headers["X-Next-Cursor"] = page.next_cursor
+    if items is None:
+        items = [item.to_dict() for item in page.items]
+    content = jsonable_encoder(items)
+    return JSONResponse(content=content, headers=headers)
+
+async def fetch_page(method, **kwargs) -> Page:
+    """Esegue una lista paginata traducendo gli errori di paginazione in 400"""
+    try:
+        return await method(**kwargs)
+    except PaginationError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 # ================================================================
 # PYDANTIC MODELS PER VALIDAZIONE
 # ================================================================
@@ -87,11 +124,45 @@ class RoleUpdate(BaseModel):
             raise ValueError('Percentuale deve essere tra 0.01 e 1.0')
         return v
 
+class FunctionMove(BaseModel):
+    function_name: str
+    new_reports_to: Optional[str] = None
+
+class FunctionReorganize(BaseModel):
+    moves: List[FunctionMove]
+
+class ManagerChange(BaseModel):
+    old_manager: str
+    new_manager: str
+
+class BulkManagerChange(BaseModel):
+    changes: List[ManagerChange]
+
+class BulkTermination(BaseModel):
+    persons: List[str]
+    termination_date: Optional[date] = None
+
 class JobTitleCreate(BaseModel):
     name: str
     level: Optional[int] = None
     flags: Optional[str] = None
 
+class BatchOperation(BaseModel):
+    op: str
+    entity: str
+    key: Optional[Union[str, int]] = None
+    data: Dict[str, Any] = {}
+
+class BatchRequest(BaseModel):
+    mode: str = "atomic"
+    operations: List[BatchOperation]
+    
+    @validator('mode')
+    def validate_mode(cls, v):
+        if v not in BATCH_MODES:
+            raise ValueError(f"Modo deve essere uno di: {', '.join(BATCH_MODES)}")
+        return v
+
 # ================================================================
 # PERSONS API ENDPOINTS
 # ================================================================
@@ -99,7 +170,7 @@ class JobTitleCreate(BaseModel):
 @router.post("/persons")
 async def create_person(person: PersonCreate):
     """Crea nuovo dipendente"""
-    success, message, person_id = service.create_person(person.dict())
+    success, message, person_id = await async_service.create_person(person.dict())
     
     if success:
         return JSONResponse(
@@ -110,28 +181,56 @@ async def create_person(person: PersonCreate):
         raise HTTPException(status_code=400, detail=message)
 
 @router.get("/persons")
-async def list_persons(active_only: bool = True, search: Optional[str] = None):
-    """Lista dipendenti"""
+async def list_persons(
+    request: Request,
+    active_only: bool = True,
+    status: Optional[str] = None,
+    search: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    sort: Optional[str] = None,
+    order: str = Query("asc", pattern="^(asc|desc)$")
+):
+    """Lista dipendenti (paginata a cursore)"""
     if search:
-        persons = service.search_employees(search)
-    else:
-        persons = repository.get_all_persons(active_only)
+        persons = await async_service.search_employees(search)
+        return [person.to_dict() for person in persons]
     
-    return [person.__dict__ for person in persons]
+    if status is None and active_only:
+        status = "ACTIVE"
+    page = await fetch_page(async_repository.list_persons, status=status, limit=limit,
+                            cursor=cursor, sort=sort, descending=order == "desc")
+    return paged_response(request, page)
 
 @router.get("/persons/{person_name}")
 async def get_person(person_name: str):
     """Recupera singolo dipendente"""
-    person = repository.get_person(person_name)
+    person = await async_repository.get_person(person_name)
     if not person:
         raise HTTPException(status_code=404, detail="Dipendente non trovato")
     
-    return person.__dict__
+    return person.to_dict()
+
+@router.get("/persons/{person_name}/roles")
+async def get_person_roles(person_name: str, as_of: Optional[date] = None):
+    """Ruoli del dipendente attivi oggi o validi alla data as_of"""
+    if not await async_repository.get_person(person_name):
+        raise HTTPException(status_code=404, detail="Dipendente non trovato")
+    roles = await async_service.get_person_roles(person_name, as_of)
+    return [role.to_dict() for role in roles]
+
+@router.get("/persons/{person_name}/reports")
+async def get_direct_reports(person_name: str, as_of: Optional[date] = None):
+    """Riporti diretti del dipendente, oggi o alla data as_of"""
+    if not await async_repository.get_person(person_name):
+        raise HTTPException(status_code=404, detail="Dipendente non trovato")
+    roles = await async_service.get_direct_reports(person_name, as_of)
+    return [role.to_dict() for role in roles]
 
 @router.put("/persons/{person_name}")
 async def update_person(person_name: str, person: PersonUpdate):
     """Aggiorna dipendente"""
-    success, message = service.update_person(person_name, person.dict(exclude_unset=True))
+    success, message = await async_service.update_person(person_name, person.dict(exclude_unset=True))
     
     if success:
         return {"success": True, "message": message}
@@ -142,9 +241,9 @@ async def update_person(person_name: str, person: PersonUpdate):
 async def delete_person(person_name: str, soft_delete: bool = True):
     """Elimina dipendente"""
     if soft_delete:
-        success, message = service.update_person(person_name, {"status": "TERMINATED"})
+        success, message = await async_service.update_person(person_name, {"status": "TERMINATED"})
     else:
-        success, message = service.delete_person(person_name)
+        success, message = await async_service.delete_person(person_name)
     
     if success:
         return {"success": True, "message": message}
@@ -154,7 +253,7 @@ async def delete_person(person_name: str, soft_delete: bool = True):
 @router.post("/persons/{person_name}/terminate")
 async def terminate_employee(person_name: str, termination_date: Optional[date] = None):
     """Termina dipendente e tutti i ruoli"""
-    success, message, roles_count = service.terminate_employee(person_name, termination_date)
+    success, message, roles_count = await async_service.terminate_employee(person_name, termination_date)
     
     if success:
         return {"success": True, "message": message, "terminated_roles": roles_count}
@@ -168,7 +267,7 @@ async def terminate_employee(person_name: str, termination_date: Optional[date]
 @router.post("/functions")
 async def create_function(function: FunctionCreate):
     """Crea nuova funzione"""
-    success, message, function_id = service.create_function(function.dict())
+    success, message, function_id = await async_service.create_function(function.dict())
     
     if success:
         return JSONResponse(
@@ -179,32 +278,67 @@ async def create_function(function: FunctionCreate):
         raise HTTPException(status_code=400, detail=message)
 
 @router.get("/functions")
-async def list_functions():
-    """Lista funzioni"""
-    functions = repository.get_all_functions()
-    return [func.__dict__ for func in functions]
+async def list_functions(
+    request: Request,
+    reports_to: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    sort: Optional[str] = None,
+    order: str = Query("asc", pattern="^(asc|desc)$"),
+    include: Optional[str] = Query(None, pattern="^dependencies$")
+):
+    """Lista funzioni (paginata a cursore), con include=dependencies anche le dipendenze"""
+    page = await fetch_page(async_repository.list_functions, reports_to=reports_to, limit=limit,
+                            cursor=cursor, sort=sort, descending=order == "desc")
+    if include != "dependencies":
+        return paged_response(request, page)
+    
+    # Dipendenze della sola pagina corrente, in una query
+    deps = await async_repository.get_functions_dependencies([f.name for f in page.items])
+    items = [{**f.to_dict(), "dependencies": deps[f.name]} for f in page.items]
+    return paged_response(request, page, items)
 
 @router.get("/functions/{function_name}")
-async def get_function(function_name: str):
-    """Recupera singola funzione"""
-    function = repository.get_function(function_name)
+async def get_function(function_name: str, as_of: Optional[date] = None):
+    """Recupera singola funzione (ruoli attivi oggi o validi alla data as_of)"""
+    function = await async_repository.get_function(function_name)
     if not function:
         raise HTTPException(status_code=404, detail="Funzione non trovata")
     
     # Aggiungi informazioni aggiuntive
-    deps = repository.get_function_dependencies(function_name)
-    roles = repository.get_function_roles(function_name)
+    deps = await async_repository.get_function_dependencies(function_name)
+    roles = await async_service.get_function_roles(function_name, as_of=as_of)
     
     return {
-        **function.__dict__,
+        **function.to_dict(),
         "dependencies": deps,
-        "roles": [role.__dict__ for role in roles]
+        "roles": [role.to_dict() for role in roles]
     }
 
+@router.get("/organization")
+async def get_organization_chart(as_of: Optional[date] = None):
+    """Organigramma attuale o alla data as_of (una riga per funzione e persona)"""
+    nodes = await async_service.get_organization_tree(as_of)
+    return [node.to_dict() for node in nodes]
+
+@router.get("/functions/{function_name}/rollup")
+async def get_function_rollup(function_name: str):
+    """Headcount, FTE e interim della funzione, diretti e con le sotto-funzioni"""
+    rollup = await async_service.get_function_rollup(function_name)
+    if not rollup:
+        raise HTTPException(status_code=404, detail="Funzione non trovata")
+    return rollup.to_dict()
+
+@router.get("/rollup")
+async def get_function_rollups():
+    """Headcount, FTE e interim di tutte le funzioni (per livello e nome)"""
+    rollups = await async_service.get_function_rollups()
+    return [rollup.to_dict() for rollup in rollups]
+
 @router.put("/functions/{function_name}")
 async def update_function(function_name: str, function: FunctionUpdate):
     """Aggiorna funzione"""
-    success, message = service.update_function(function_name, function.dict(exclude_unset=True))
+    success, message = await async_service.update_function(function_name, function.dict(exclude_unset=True))
     
     if success:
         return {"success": True, "message": message}
@@ -214,7 +348,7 @@ async def update_function(function_name: str, function: FunctionUpdate):
 @router.delete("/functions/{function_name}")
 async def delete_function(function_name: str):
     """Elimina funzione"""
-    success, message = service.delete_function(function_name)
+    success, message = await async_service.delete_function(function_name)
     
     if success:
         return {"success": True, "message": message}
@@ -224,7 +358,7 @@ async def delete_function(function_name: str):
 @router.post("/functions/{function_name}/reorganize")
 async def reorganize_function(function_name: str, new_reports_to: Optional[str] = None):
     """Riorganizza funzione nella gerarchia"""
-    success, message = service.reorganize_function(function_name, new_reports_to)
+    success, message = await async_service.reorganize_function(function_name, new_reports_to)
     
     if success:
         return {"success": True, "message": message}
@@ -238,7 +372,7 @@ async def reorganize_function(function_name: str, new_reports_to: Optional[str]
 @router.post("/roles")
 async def create_role(role: RoleCreate):
     """Crea nuovo ruolo"""
-    success, message, role_id = service.create_role(role.dict())
+    success, message, role_id = await async_service.create_role(role.dict())
     
     if success:
         return JSONResponse(
@@ -248,19 +382,43 @@ async def create_role(role: RoleCreate):
     else:
         raise HTTPException(status_code=400, detail=message)
 
+@router.get("/roles")
+async def list_roles(
+    request: Request,
+    active_only: bool = True,
+    person_name: Optional[str] = None,
+    function_name: Optional[str] = None,
+    job_title_name: Optional[str] = None,
+    organizational_unit: Optional[str] = None,
+    ad_interim: Optional[bool] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    sort: Optional[str] = None,
+    order: str = Query("asc", pattern="^(asc|desc)$")
+):
+    """Lista ruoli con filtri (paginata a cursore)"""
+    page = await fetch_page(
+        async_repository.list_roles,
+        active_only=active_only, person_name=person_name, function_name=function_name,
+        job_title_name=job_title_name, organizational_unit=organizational_unit,
+        ad_interim=ad_interim, limit=limit, cursor=cursor, sort=sort,
+        descending=order == "desc"
+    )
+    return paged_response(request, page)
+
 @router.get("/roles/{role_id}")
 async def get_role(role_id: int):
     """Recupera singolo ruolo"""
-    role = repository.get_role(role_id)
+    role = await async_repository.get_role(role_id)
     if not role:
         raise HTTPException(status_code=404, detail="Ruolo non trovato")
     
-    return role.__dict__
+    return role.to_dict()
 
 @router.put("/roles/{role_id}")
 async def update_role(role_id: int, role: RoleUpdate):
     """Aggiorna ruolo"""
-    success, message = service.update_role(role_id, role.dict(exclude_unset=True))
+    success, message = await async_service.update_role(role_id, role.dict(exclude_unset=True))
     
     if success:
         return {"success": True, "message": message}
@@ -270,7 +428,7 @@ async def update_role(role_id: int, role: RoleUpdate):
 @router.post("/roles/{role_id}/end")
 async def end_role(role_id: int, end_date: Optional[date] = None):
     """Termina ruolo"""
-    success, message = service.end_role(role_id, end_date)
+    success, message = await async_service.end_role(role_id, end_date)
     
     if success:
         return {"success": True, "message": message}
@@ -280,7 +438,7 @@ async def end_role(role_id: int, end_date: Optional[date] = None):
 @router.post("/roles/{role_id}/transfer")
 async def transfer_role(role_id: int, new_person_name: str, transfer_date: Optional[date] = None):
     """Trasferisce ruolo ad altra persona"""
-    success, message, new_role_id = service.transfer_role(role_id, new_person_name, transfer_date)
+    success, message, new_role_id = await async_service.transfer_role(role_id, new_person_name, transfer_date)
     
     if success:
         return {"success": True, "message": message, "new_role_id": new_role_id}
@@ -294,7 +452,7 @@ async def transfer_role(role_id: int, new_person_name: str, transfer_date: Optio
 @router.post("/job-titles")
 async def create_job_title(job_title: JobTitleCreate):
     """Crea nuovo job title"""
-    success, message, job_title_id = service.create_job_title(job_title.dict())
+    success, message, job_title_id = await async_service.create_job_title(job_title.dict())
     
     if success:
         return JSONResponse(
@@ -305,15 +463,22 @@ async def create_job_title(job_title: JobTitleCreate):
         raise HTTPException(status_code=400, detail=message)
 
 @router.get("/job-titles")
-async def list_job_titles():
-    """Lista job titles"""
-    job_titles = repository.get_all_job_titles()
-    return [jt.__dict__ for jt in job_titles]
+async def list_job_titles(
+    request: Request,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    sort: Optional[str] = None,
+    order: str = Query("asc", pattern="^(asc|desc)$")
+):
+    """Lista job titles (paginata a cursore)"""
+    page = await fetch_page(async_repository.list_job_titles, limit=limit,
+                            cursor=cursor, sort=sort, descending=order == "desc")
+    return paged_response(request, page)
 
 @router.delete("/job-titles/{job_title_name}")
 async def delete_job_title(job_title_name: str):
     """Elimina job title"""
-    success, message = service.delete_job_title(job_title_name)
+    success, message = await async_service.delete_job_title(job_title_name)
     
     if success:
         return {"success": True, "message": message}
@@ -327,13 +492,234 @@ async def delete_job_title(job_title_name: str):
 @router.post("/bulk/change-manager")
 async def bulk_change_manager(old_manager: str, new_manager: str):
     """Cambia manager per tutti i report"""
-    success, message, count = service.bulk_change_manager(old_manager, new_manager)
+    success, message, count = await async_service.bulk_change_manager(old_manager, new_manager)
+    
+    if success:
+        return {"success": True, "message": message, "affected_count": count}
+    else:
+        raise HTTPException(status_code=400, detail=message)
+
+@router.post("/bulk/reorganize")
+async def bulk_reorganize(request: FunctionReorganize):
+    """Sposta più funzioni nella gerarchia in un'unica transazione"""
+    moves: Dict[str, Optional[str]] = {}
+    for move in request.moves:
+        if move.function_name in moves:
+            raise HTTPException(status_code=400,
+                                detail=f"Funzione indicata più volte: {move.function_name}")
+        moves[move.function_name] = move.new_reports_to
+    
+    success, message, count = await async_service.reorganize_functions(moves)
+    
+    if success:
+        return {"success": True, "message": message, "affected_count": count}
+    else:
+        raise HTTPException(status_code=400, detail=message)
+
+@router.post("/bulk/change-managers")
+async def bulk_change_managers(request: BulkManagerChange):
+    """Sostituisce più manager (vecchio -> nuovo) in un'unica transazione"""
+    try:
+        changes = manager_changes((c.old_manager, c.new_manager) for c in request.changes)
+    except BulkChangeError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return await _change_managers(changes)
+
+@router.post("/bulk/change-managers/upload")
+async def bulk_change_managers_upload(file: UploadFile = File(...)):
+    """Come /bulk/change-managers, da CSV old_manager,new_manager"""
+    try:
+        changes = await async_service.run(read_manager_changes, text_lines(file.file))
+    except (BulkChangeError, UnicodeDecodeError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return await _change_managers(changes)
+
+async def _change_managers(changes: Dict[str, str]):
+    success, message, count = await async_service.bulk_change_managers(changes)
     
     if success:
         return {"success": True, "message": message, "affected_count": count}
     else:
         raise HTTPException(status_code=400, detail=message)
 
+@router.post("/bulk/terminate")
+async def bulk_terminate(request: BulkTermination):
+    """Termina più dipendenti e tutti i loro ruoli in un'unica transazione"""
+    terminations = {name.strip(): None for name in request.persons if name.strip()}
+    return await _terminate(terminations, request.termination_date)
+
+@router.post("/bulk/terminate/upload")
+async def bulk_terminate_upload(
+    file: UploadFile = File(...),
+    termination_date: Optional[date] = Form(None)
+):
+    """Come /bulk/terminate, da CSV person_name[,termination_date]"""
+    try:
+        terminations = await async_service.run(read_terminations, text_lines(file.file))
+    except (BulkChangeError, UnicodeDecodeError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return await _terminate(terminations, termination_date)
+
+async def _terminate(terminations: Dict[str, Optional[date]], termination_date: Optional[date]):
+    success, message, count = await async_service.terminate_employees(terminations, termination_date)
+    
+    if success:
+        return {"success": True, "message": message, "affected_count": count}
+    else:
+        raise HTTPException(status_code=400, detail=message)
+
+@router.post("/batch")
+async def run_batch(request: BatchRequest):
+    """Più operazioni CRUD (create/update/end/transfer) in un'unica transazione.
+
+    atomic: tutto o niente; best_effort: si applicano le operazioni valide.
+    L'esito di ogni operazione è nei risultati, nello stesso ordine.
+    """
+    try:
+        processor = BatchProcessor(db_connection, mode=request.mode)
+        report = await async_service.run(processor.run, [op.dict() for op in request.operations])
+    except BatchError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    return JSONResponse(status_code=200 if report.committed else 400,
+                        content=jsonable_encoder(report.to_dict()))
+
+# ================================================================
+# IMPORT MASSIVO
+# ================================================================
+
+@router.post("/import")
+async def bulk_import(
+    file: UploadFile = File(...),
+    entity: Optional[str] = Form(None),
+    format: Optional[str] = Form(None),
+    batch_size: int = Form(5000),
+    strict: bool = Form(False)
+):
+    """Import massivo in streaming da CSV, JSON o NDJSON"""
+    fmt = format or guess_format(file.filename)
+    if not fmt:
+        raise HTTPException(status_code=400, detail="Formato non indicato né deducibile dal nome file")
+    
+    importer = BulkImporter(db_connection, batch_size=batch_size, strict=strict)
+    try:
+        # Nessun timeout: un import massivo può durare più di una query normale
+        report = await async_service.with_timeout(None).run(
+            importer.import_stream, file.file, fmt, entity
+        )
+    except BulkImportError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    return report.to_dict()
+
+# ================================================================
+# EXPORT IN STREAMING
+# ================================================================
+
+@router.get("/export/{entity}")
+async def bulk_export(entity: str, format: str = "ndjson", chunk_size: int = 1000):
+    """Export in streaming (NDJSON o CSV) di tabelle e vista organigramma"""
+    exporter = BulkExporter(db_connection, chunk_size=max(1, min(chunk_size, 10000)))
+    try:
+        stream = await async_repository.run(exporter.open, entity, format)
+    except BulkExportError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    async def body():
+        try:
+            while True:
+                # Ogni blocco viene letto nell'executor database
+                chunk = await async_repository.run(stream.next_chunk)
+                if chunk is None:
+                    break
+                yield chunk
+        finally:
+            stream.close()
+    
+    return StreamingResponse(
+        body(),
+        media_type=MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{entity}.{format}"'}
+    )
+
+@router.get("/history")
+async def get_role_history(
+    role_id: Optional[int] = None,
+    person_name: Optional[str] = None,
+    function_name: Optional[str] = None,
+    since: Optional[date] = None,
+    until: Optional[date] = None,
+    limit: int = Query(100, ge=1, le=1000)
+):
+    """Storico modifiche dei ruoli (database e archivi annuali), più recenti per prime"""
+    return await async_service.get_role_history(
+        limit, role_id=role_id, person_name=person_name, function_name=function_name,
+        since=since, until=until)
+
+# ================================================================
+# CONFRONTO ORGANIGRAMMA (DIFF) E FOTOGRAFIE
+# ================================================================
+
+@router.get("/snapshots")
+async def list_org_snapshots():
+    """Fotografie dell'organigramma salvate"""
+    return await async_service.list_org_snapshots()
+
+@router.post("/snapshots")
+async def save_org_snapshot(name: str, flags: Optional[str] = None):
+    """Salva una fotografia dell'organigramma attuale"""
+    success, message, snapshot_id = await async_service.save_org_snapshot(name, flags)
+    
+    if success:
+        return {"success": True, "message": message, "snapshot_id": snapshot_id}
+    else:
+        raise HTTPException(status_code=400, detail=message)
+
+@router.delete("/snapshots/{name}")
+async def delete_org_snapshot(name: str):
+    """Elimina una fotografia salvata"""
+    success, message = await async_service.delete_org_snapshot(name)
+    
+    if success:
+        return {"success": True, "message": message}
+    else:
+        raise HTTPException(status_code=404, detail=message)
+
+@router.get("/diff")
+async def org_diff(
+    from_date: Optional[date] = None,
+    to_date: Optional[date] = None,
+    from_snapshot: Optional[str] = None,
+    to_snapshot: Optional[str] = None,
+    chunk_size: int = Query(1000, ge=1, le=10000)
+):
+    """Differenze dell'organigramma fra due date o due fotografie, in streaming NDJSON"""
+    diff = OrgDiff(db_connection, chunk_size=chunk_size)
+    try:
+        if from_snapshot or to_snapshot:
+            if not (from_snapshot and to_snapshot):
+                raise OrgDiffError("Indicare sia from_snapshot che to_snapshot")
+            stream = await async_repository.run(diff.between_snapshots, from_snapshot, to_snapshot)
+        else:
+            if not from_date:
+                raise OrgDiffError("Indicare from_date (e to_date) oppure due fotografie")
+            stream = await async_repository.run(diff.between_dates, from_date,
+                                                to_date or date.today())
+    except OrgDiffError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    async def body():
+        try:
+            while True:
+                chunk = await async_repository.run(stream.next_chunk)
+                if chunk is None:
+                    break
+                yield chunk
+        finally:
+            stream.close()
+    
+    return StreamingResponse(body(), media_type=MEDIA_TYPES["ndjson"])
+
 # ================================================================
 # ALIASES API ENDPOINTS
 # ================================================================
@@ -341,7 +727,7 @@ async def bulk_change_manager(old_manager: str, new_manager: str):
 @router.post("/persons/{person_name}/aliases")
 async def add_person_alias(person_name: str, alias: str, flags: Optional[str] = None):
     """Aggiungi alias a persona"""
-    success = repository.add_person_alias(person_name, alias, flags)
+    success = await async_repository.add_person_alias(person_name, alias, flags)
     
     if success:
         return {"success": True, "message": "Alias aggiunto"}
@@ -351,7 +737,7 @@ async def add_person_alias(person_name: str, alias: str, flags: Optional[str] =
 @router.delete("/persons/{person_name}/aliases/{alias}")
 async def remove_person_alias(person_name: str, alias: str):
     """Rimuovi alias da persona"""
-    success = repository.remove_person_alias(person_name, alias)
+    success = await async_repository.remove_person_alias(person_name, alias)
     
     if success:
         return {"success": True, "message": "Alias rimosso"}
@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Request, Form, HTTPException
+from fastapi import APIRouter, Request, Form, HTTPException, File, UploadFile
 from fastapi.templating import Jinja2Templates
 from fastapi.responses import HTMLResponse, RedirectResponse
 from typing import Optional
@@ -6,7 +6,11 @@ from datetime import date
 
 from ...database.connection import DatabaseConnection
 from ...database.repository import OrganigrammaRepository
+from ...database.pagination import Page, PaginationError
 from ...services.organigramma_service import OrganigrammaService
+from ...services.async_facade import AsyncFacade
+from ...services.bulk_changes import (BulkChangeError, read_manager_changes, read_terminations,
+                                      text_lines)
 
 # Setup
 router = APIRouter(tags=["CRUD Web"])
@@ -15,23 +19,42 @@ db_connection = DatabaseConnection()
 repository = OrganigrammaRepository(db_connection)
 service = OrganigrammaService(repository)
 
+# Facciate async: il lavoro SQLite gira nell'executor, non sull'event loop
+async_repository = AsyncFacade(repository, db_connection)
+async_service = AsyncFacade(service, db_connection)
+
+def page_links(request: Request, page: Page) -> dict:
+    """Link di navigazione per le pagine admin paginate a cursore"""
+    return {
+        "next_url": str(request.url.include_query_params(cursor=page.next_cursor))
+                    if page.next_cursor else None,
+        "first_url": str(request.url.remove_query_params("cursor"))
+                     if request.query_params.get("cursor") else None,
+    }
+
+async def fetch_page(method, **kwargs) -> Page:
+    """Esegue una lista paginata traducendo gli errori di paginazione in 400"""
+    try:
+        return await method(**kwargs)
+    except PaginationError as e:
+        raise HTTPException(400, str(e))
+
 # ================================================================
 # PERSONS - WEB CRUD
 # ================================================================
 
 @router.get("/admin/persons", response_class=HTMLResponse)
-async def admin_persons(request: Request):
+async def admin_persons(request: Request, status: Optional[str] = None,
+                        cursor: Optional[str] = None):
     """Pagina amministrazione dipendenti"""
-    persons = repository.get_all_persons(active_only=False)
-    functions = repository.get_all_functions()
-    job_titles = repository.get_all_job_titles()
+    page = await fetch_page(async_repository.list_persons, status=status or None, cursor=cursor)
     
     return templates.TemplateResponse("admin/persons.html", {
         "request": request,
         "title": "Gestione Dipendenti",
-        "persons": persons,
-        "functions": functions,
-        "job_titles": job_titles
+        "persons": page.items,
+        "filter_status": status or "",
+        **page_links(request, page)
     })
 
 @router.get("/admin/persons/new", response_class=HTMLResponse)
@@ -64,7 +87,7 @@ async def create_person_web(
         "flags": flags if flags else None
     }
     
-    success, message, person_id = service.create_person(person_data)
+    success, message, person_id = await async_service.create_person(person_data)
     
     if success:
         return RedirectResponse(
@@ -84,7 +107,7 @@ async def create_person_web(
 @router.get("/admin/persons/{person_name}/edit", response_class=HTMLResponse)
 async def edit_person_form(request: Request, person_name: str):
     """Form modifica dipendente"""
-    person = repository.get_person(person_name)
+    person = await async_repository.get_person(person_name)
     if not person:
         raise HTTPException(404, "Dipendente non trovato")
     
@@ -114,7 +137,7 @@ async def update_person_web(
         "flags": flags if flags else None
     }
     
-    success, message = service.update_person(person_name, person_data)
+    success, message = await async_service.update_person(person_name, person_data)
     
     if success:
         return RedirectResponse(
@@ -122,7 +145,7 @@ async def update_person_web(
             status_code=303
         )
     else:
-        person = repository.get_person(person_name)
+        person = await async_repository.get_person(person_name)
         return templates.TemplateResponse("admin/person_form.html", {
             "request": request,
             "title": f"Modifica {person_name}",
@@ -134,7 +157,7 @@ async def update_person_web(
 @router.post("/admin/persons/{person_name}/delete")
 async def delete_person_web(person_name: str):
     """Elimina dipendente"""
-    success, message = service.delete_person(person_name)
+    success, message = await async_service.delete_person(person_name)
     
     if success:
         return RedirectResponse(
@@ -154,17 +177,17 @@ async def delete_person_web(person_name: str):
 @router.get("/admin/functions", response_class=HTMLResponse)
 async def admin_functions(request: Request):
     """Pagina amministrazione funzioni"""
-    functions = repository.get_all_functions()
+    functions = await async_repository.get_all_functions()
     
-    # Aggiungi info dipendenze per ogni funzione
+    # Dipendenze di tutte le funzioni in una sola query
+    all_deps = await async_repository.get_functions_dependencies()
     functions_with_deps = []
     for func in functions:
-        deps = repository.get_function_dependencies(func.name)
-        roles = repository.get_function_roles(func.name, active_only=True)
+        deps = all_deps[func.name]
         functions_with_deps.append({
             "function": func,
             "dependencies": deps,
-            "active_roles": len(roles),
+            "active_roles": deps['active_roles'],
             "can_delete": not deps['has_dependencies']
         })
     
@@ -178,7 +201,7 @@ async def admin_functions(request: Request):
 @router.get("/admin/functions/new", response_class=HTMLResponse)
 async def new_function_form(request: Request):
     """Form creazione nuova funzione"""
-    functions = repository.get_all_functions()
+    functions = await async_repository.get_all_functions()
     return templates.TemplateResponse("admin/function_form.html", {
         "request": request,
         "title": "Nuova Funzione",
@@ -201,7 +224,7 @@ async def create_function_web(
         "flags": flags if flags else None
     }
     
-    success, message, function_id = service.create_function(function_data)
+    success, message, function_id = await async_service.create_function(function_data)
     
     if success:
         return RedirectResponse(
@@ -209,7 +232,7 @@ async def create_function_web(
             status_code=303
         )
     else:
-        functions = repository.get_all_functions()
+        functions = await async_repository.get_all_functions()
         return templates.TemplateResponse("admin/function_form.html", {
             "request": request,
             "title": "Nuova Funzione",
@@ -222,12 +245,12 @@ async def create_function_web(
 @router.get("/admin/functions/{function_name}/edit", response_class=HTMLResponse)
 async def edit_function_form(request: Request, function_name: str):
     """Form modifica funzione"""
-    function = repository.get_function(function_name)
+    function = await async_repository.get_function(function_name)
     
     if not function:
         raise HTTPException(404, "Funzione non trovata")
     
-    all_functions = repository.get_all_functions()
+    all_functions = await async_repository.get_all_functions()
     return templates.TemplateResponse("admin/function_form.html", {
         "request": request,
         "title": f"Modifica {function.name}",
@@ -249,7 +272,7 @@ async def update_functions_web(
         "flags": flags if flags else None
     }
     
-    success, message = service.update_function(function_name, function_data)
+    success, message = await async_service.update_function(function_name, function_data)
     
     if success:
         return RedirectResponse(
@@ -257,7 +280,7 @@ async def update_functions_web(
             status_code=303
         )
     else:
-        function = repository.get_function(function_name)
+        function = await async_repository.get_function(function_name)
         return templates.TemplateResponse("admin/function_form.html", {
             "request": request,
             "title": f"Modifica {function_name}",
@@ -269,7 +292,7 @@ async def update_functions_web(
 @router.post("/admin/functions/{person_name}/delete")
 async def delete_function_web(function_name: str):
     """Elimina funzione"""
-    success, message = service.delete_function(function_name)
+    success, message = await async_service.delete_function(function_name)
     
     if success:
         return RedirectResponse(
@@ -287,38 +310,52 @@ async def delete_function_web(function_name: str):
 # ================================================================
 
 @router.get("/admin/roles", response_class=HTMLResponse)
-async def admin_roles(request: Request, person_name: Optional[str] = None):
+async def admin_roles(
+    request: Request,
+    person_name: Optional[str] = None,
+    function_name: Optional[str] = None,
+    job_title_name: Optional[str] = None,
+    organizational_unit: Optional[str] = None,
+    ad_interim: Optional[bool] = None,
+    cursor: Optional[str] = None
+):
     """Pagina amministrazione ruoli"""
-    if person_name:
-        roles = repository.get_person_roles(person_name, active_only=False)
-        title = f"Ruoli di {person_name}"
-    else:
-        # Recupera tutti i ruoli attivi
-        query = "SELECT * FROM roles WHERE end_date IS NULL ORDER BY person_name, function_name"
-        rows = repository.db.execute_query(query)
-        roles = [repository._dict_to_role(dict(row)) for row in rows]
-        title = "Tutti i Ruoli"
+    # Per una persona si mostrano anche i ruoli terminati, altrimenti solo gli attivi
+    page = await fetch_page(
+        async_repository.list_roles,
+        active_only=not person_name,
+        person_name=person_name or None,
+        function_name=function_name or None,
+        job_title_name=job_title_name or None,
+        organizational_unit=organizational_unit or None,
+        ad_interim=ad_interim or None,
+        cursor=cursor
+    )
+    title = f"Ruoli di {person_name}" if person_name else "Tutti i Ruoli"
     
-    persons = repository.get_all_persons()
-    functions = repository.get_all_functions()
-    job_titles = repository.get_all_job_titles()
+    functions = await async_repository.get_all_functions()
+    job_titles = await async_repository.get_all_job_titles()
     
     return templates.TemplateResponse("admin/roles.html", {
         "request": request,
         "title": title,
-        "roles": roles,
-        "persons": persons,
+        "roles": page.items,
         "functions": functions,
         "job_titles": job_titles,
-        "filter_person": person_name
+        "filter_person": person_name or "",
+        "filter_function": function_name or "",
+        "filter_job_title": job_title_name or "",
+        "filter_unit": organizational_unit or "",
+        "filter_interim": bool(ad_interim),
+        **page_links(request, page)
     })
 
 @router.get("/admin/roles/new", response_class=HTMLResponse)
 async def new_role_form(request: Request):
     """Form creazione nuovo ruolo"""
-    persons = repository.get_all_persons()
-    functions = repository.get_all_functions()
-    job_titles = repository.get_all_job_titles()
+    persons = await async_repository.get_all_persons()
+    functions = await async_repository.get_all_functions()
+    job_titles = await async_repository.get_all_job_titles()
     
     return templates.TemplateResponse("admin/role_form.html", {
         "request": request,
@@ -356,7 +393,7 @@ async def create_role_web(
         "flags": flags if flags else None
     }
     
-    success, message, role_id = service.create_role(role_data)
+    success, message, role_id = await async_service.create_role(role_data)
     
     if success:
         return RedirectResponse(
@@ -364,9 +401,9 @@ async def create_role_web(
             status_code=303
         )
     else:
-        persons = repository.get_all_persons()
-        functions = repository.get_all_functions()
-        job_titles = repository.get_all_job_titles()
+        persons = await async_repository.get_all_persons()
+        functions = await async_repository.get_all_functions()
+        job_titles = await async_repository.get_all_job_titles()
         
         return templates.TemplateResponse("admin/role_form.html", {
             "request": request,
@@ -382,15 +419,15 @@ async def create_role_web(
 @router.get("/admin/roles/{role_id}/edit", response_class=HTMLResponse)
 async def edit_role_form(request: Request, role_id: int):
     """Form modifica ruolo"""
-    role = repository.get_role(role_id)
+    role = await async_repository.get_role(role_id)
     
     if not role:
         raise HTTPException(404, "Ruolo non trovata")
     
-    all_persons = repository.get_all_persons()
-    #all_functions = repository.get_all_functions()
-    all_functions = repository.get_function_tree()
-    all_job_titles = repository.get_all_job_titles()
+    all_persons = await async_repository.get_all_persons()
+    #all_functions = await async_repository.get_all_functions()
+    all_functions = await async_repository.get_function_tree()
+    all_job_titles = await async_repository.get_all_job_titles()
     
     return templates.TemplateResponse("admin/role_form.html", {
         "request": request,
@@ -430,7 +467,7 @@ async def update_roles_web(
         "flags": flags if flags else None
     }
     
-    success, message = service.update_role(role_id, role_data)
+    success, message = await async_service.update_role(role_id, role_data)
     
     if success:
         return RedirectResponse(
@@ -438,7 +475,7 @@ async def update_roles_web(
             status_code=303
         )
     else:
-        role = repository.get_role(role_id)
+        role = await async_repository.get_role(role_id)
         return templates.TemplateResponse("admin/role_form.html", {
             "request": request,
             "title": f"Modifica {role_id}",
@@ -450,7 +487,7 @@ async def update_roles_web(
 @router.post("/admin/roles/{role_id}/end")
 async def end_role_web(role_id: int, end_date: Optional[date] = Form(None)):
     """Termina ruolo"""
-    success, message = service.end_role(role_id, end_date)
+    success, message = await async_service.end_role(role_id, end_date)
     
     if success:
         return RedirectResponse(
@@ -470,8 +507,8 @@ async def end_role_web(role_id: int, end_date: Optional[date] = Form(None)):
 @router.get("/admin/bulk", response_class=HTMLResponse)
 async def admin_bulk_operations(request: Request):
     """Pagina operazioni in blocco"""
-    persons = repository.get_all_persons()
-    functions = repository.get_all_functions()
+    persons = await async_repository.get_all_persons()
+    functions = await async_repository.get_all_functions()
     
     return templates.TemplateResponse("admin/bulk_operations.html", {
         "request": request,
@@ -486,7 +523,7 @@ async def bulk_change_manager_web(
     new_manager: str = Form(...)
 ):
     """Cambio manager in blocco"""
-    success, message, count = service.bulk_change_manager(old_manager, new_manager)
+    success, message, count = await async_service.bulk_change_manager(old_manager, new_manager)
     
     if success:
         return RedirectResponse(
@@ -505,7 +542,7 @@ async def terminate_employee_web(
     termination_date: Optional[date] = Form(None)
 ):
     """Terminazione dipendente con tutti i ruoli"""
-    success, message, count = service.terminate_employee(person_name, termination_date)
+    success, message, count = await async_service.terminate_employee(person_name, termination_date)
     
     if success:
         return RedirectResponse(
@@ -516,4 +553,50 @@ async def terminate_employee_web(
         return RedirectResponse(
             url=f"/admin/bulk?error={message}",
             status_code=303
-        )
\ No newline at end of file
+        )
+
+def _bulk_lines(text: str, file: Optional[UploadFile]):
+    """Righe della mappatura: dal file CSV se caricato, altrimenti dal campo di testo.
+
+    Le righe del file vengono lette da chi le consuma: leggerle nell'executor.
+    """
+    if file is not None and file.filename:
+        return text_lines(file.file)
+    return text.splitlines()
+
+@router.post("/admin/bulk/change-managers")
+async def bulk_change_managers_web(
+    changes: str = Form(""),
+    file: Optional[UploadFile] = File(None)
+):
+    """Cambio di più manager da elenco o CSV (vecchio;nuovo per riga)"""
+    try:
+        mapping = await async_service.run(read_manager_changes, _bulk_lines(changes, file))
+    except (BulkChangeError, UnicodeDecodeError) as e:
+        return RedirectResponse(url=f"/admin/bulk?error={e}", status_code=303)
+    
+    success, message, count = await async_service.bulk_change_managers(mapping)
+    
+    if success:
+        return RedirectResponse(url=f"/admin/bulk?success={message}", status_code=303)
+    else:
+        return RedirectResponse(url=f"/admin/bulk?error={message}", status_code=303)
+
+@router.post("/admin/bulk/terminate-employees")
+async def terminate_employees_web(
+    persons: str = Form(""),
+    termination_date: Optional[date] = Form(None),
+    file: Optional[UploadFile] = File(None)
+):
+    """Terminazione di più dipendenti da elenco o CSV (nome[;data] per riga)"""
+    try:
+        terminations = await async_service.run(read_terminations, _bulk_lines(persons, file))
+    except (BulkChangeError, UnicodeDecodeError) as e:
+        return RedirectResponse(url=f"/admin/bulk?error={e}", status_code=303)
+    
+    success, message, count = await async_service.terminate_employees(terminations, termination_date)
+    
+    if success:
+        return RedirectResponse(url=f"/admin/bulk?success={message}", status_code=303)
+    else:
+        return RedirectResponse(url=f"/admin/bulk?error={message}", status_code=303)
@@ -11,6 +11,9 @@ document.addEventListener('DOMContentLoaded', function() {
             const query = this.value.trim();
             
             if (query.length < 2) {
+                if (searchController) {
+                    searchController.abort();
+                }
                 searchResults.classList.add('hidden');
                 return;
             }
@@ -28,17 +31,44 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     }
     
+    const SEARCH_KIND_LABELS = {
+        person: 'Persona',
+        function: 'Funzione',
+        job_title: 'Job title'
+    };
+    
+    // Richiesta in corso: annullata quando ne parte una più recente
+    let searchController = null;
+    
     async function performQuickSearch(query) {
+        if (searchController) {
+            searchController.abort();
+        }
+        const controller = new AbortController();
+        searchController = controller;
+        
         try {
-            const response = await fetch(`/api/search/employees?q=${encodeURIComponent(query)}`);
-            const employees = await response.json();
+            // Persone dall'indice typeahead in memoria, funzioni e job title dall'indice full-text
+            const q = encodeURIComponent(query);
+            const [employees, others] = await Promise.all([
+                fetch(`/api/search/employees?q=${q}&limit=10`, { signal: controller.signal })
+                    .then(response => response.json()),
+                fetch(`/api/search?q=${q}&types=function,job_title&limit=5`, { signal: controller.signal })
+                    .then(response => response.json())
+            ]);
+            const hits = employees.map(emp => ({
+                kind: 'person',
+                name: emp.name,
+                detail: emp.employee_id,
+                url: `/employee/${encodeURIComponent(emp.name)}`
+            })).concat(others);
             
-            if (employees.length > 0) {
-                const resultsHtml = employees.map(emp => `
+            if (hits.length > 0) {
+                const resultsHtml = hits.map(hit => `
                     <div class="search-result-item">
-                        <a href="/employee/${encodeURIComponent(emp.name)}" class="search-result-link">
-                            <div class="search-result-name">${escapeHtml(emp.name)}</div>
-                            <div class="search-result-details">${emp.employee_id || 'N/A'} - ${emp.status}</div>
+                        <a href="${escapeHtml(hit.url)}" class="search-result-link">
+                            <div class="search-result-name">${escapeHtml(hit.name)}</div>
+                            <div class="search-result-details">${SEARCH_KIND_LABELS[hit.kind] || hit.kind}${hit.detail ? ' - ' + escapeHtml(hit.detail) : ''}</div>
                         </a>
                     </div>
                 `).join('');
@@ -50,9 +80,16 @@ document.addEventListener('DOMContentLoaded', function() {
                 searchResults.classList.remove('hidden');
             }
         } catch (error) {
+            if (error.name === 'AbortError') {
+                return;
+            }
             console.error('Error performing search:', error);
             searchResults.innerHTML = '<div class="search-error">Errore durante la ricerca</div>';
             searchResults.classList.remove('hidden');
+        } finally {
+            if (searchController === controller) {
+                searchController = null;
+            }
         }
     }
     